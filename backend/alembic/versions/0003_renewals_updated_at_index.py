@@ -0,0 +1,23 @@
+"""index renewals.updated_at for incremental snapshot refresh
+
+Revision ID: 0003_renewals_updated_at_index
+Revises: 0002_renewals_and_reminders
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "0003_renewals_updated_at_index"
+down_revision = "0002_renewals_and_reminders"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_renewals_updated_at", "renewals", ["updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_renewals_updated_at", table_name="renewals")
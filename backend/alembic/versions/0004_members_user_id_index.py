@@ -0,0 +1,25 @@
+"""index household_members.user_id (membership lookup on every request)
+
+Revision ID: 0004_members_user_id_index
+Revises: 0003_renewals_updated_at_index
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "0004_members_user_id_index"
+down_revision = "0003_renewals_updated_at_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # uq_household_user leads with household_id, so lookups by user_id alone
+    # (get_current_household) fell back to a sequential scan.
+    op.create_index("ix_household_members_user_id", "household_members", ["user_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_household_members_user_id", table_name="household_members")
@@ -0,0 +1,39 @@
+"""optionally convert renewals to a declaratively partitioned table
+
+Revision ID: 0005_partitioned_renewals
+Revises: 0004_members_user_id_index
+Create Date: 2026-10-19
+
+Choose the layout with `alembic -x renewals_partitioning=range|hash|none upgrade head`
+(or RENEWALS_PARTITIONING). The default, none, leaves renewals as a plain table.
+Hash partition count: -x renewals_hash_partitions=N (default 16).
+See app/partitioning.py.
+"""
+
+from __future__ import annotations
+
+import os
+
+from alembic import context, op
+from app import partitioning
+
+revision = "0005_partitioned_renewals"
+down_revision = "0004_members_user_id_index"
+branch_labels = None
+depends_on = None
+
+
+def _option(name: str, default: str) -> str:
+    return context.get_x_argument(as_dictionary=True).get(name) or os.getenv(name.upper()) or default
+
+
+def upgrade() -> None:
+    partitioning.convert(
+        op.get_bind(),
+        _option("renewals_partitioning", "none"),
+        hash_partitions=int(_option("renewals_hash_partitions", "16")),
+    )
+
+
+def downgrade() -> None:
+    partitioning.convert(op.get_bind(), "none")
@@ -0,0 +1,62 @@
+"""archive tables for compacted renewals and long-archived cars
+
+Revision ID: 0006_cold_storage_tables
+Revises: 0005_partitioned_renewals
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision = "0006_cold_storage_tables"
+down_revision = "0005_partitioned_renewals"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    renewal_kind = postgresql.ENUM("INSURANCE", "MOT", "TAX", name="renewal_kind", create_type=False)
+
+    # Append-only and rarely read: no foreign keys, and only the index restore looks up by.
+    op.create_table(
+        "cars_archive",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("household_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("registration_number", sa.String(length=16), nullable=False),
+        sa.Column("make", sa.String(length=64), nullable=True),
+        sa.Column("model", sa.String(length=64), nullable=True),
+        sa.Column("is_archived", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("archived_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_cars_archive_household_id", "cars_archive", ["household_id"])
+
+    op.create_table(
+        "renewals_archive",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("car_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("kind", renewal_kind, nullable=False),
+        sa.Column("valid_from", sa.Date(), nullable=False),
+        sa.Column("valid_to", sa.Date(), nullable=False),
+        sa.Column("provider", sa.String(length=120), nullable=True),
+        sa.Column("reference", sa.String(length=120), nullable=True),
+        sa.Column("cost_pence", sa.Integer(), nullable=True),
+        sa.Column("notes", sa.Text(), nullable=True),
+        sa.Column("is_deleted", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("archived_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_renewals_archive_car_id", "renewals_archive", ["car_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_renewals_archive_car_id", table_name="renewals_archive")
+    op.drop_table("renewals_archive")
+    op.drop_index("ix_cars_archive_household_id", table_name="cars_archive")
+    op.drop_table("cars_archive")
@@ -0,0 +1,60 @@
+"""pg_trgm GIN indexes for household search (app/search.py)
+
+Revision ID: 0007_search_trigram_indexes
+Revises: 0006_cold_storage_tables
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import logging
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "0007_search_trigram_indexes"
+down_revision = "0006_cold_storage_tables"
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger("alembic.runtime.migration")
+
+TRIGRAM_COLUMNS = {
+    "cars": ["registration_number", "make", "model"],
+    "renewals": ["provider", "reference", "notes"],
+}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    available = bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first()
+    if available is None:
+        # A server without contrib (the stock postgres images all have it). Search
+        # still works, with unindexed substring matching only. Install contrib and
+        # downgrade to 0006 / upgrade again to get the indexes and fuzzy matching.
+        log.warning(
+            "pg_trgm is not available on this server; skipping search indexes. Search will "
+            "scan each household's rows and find substring matches only (search.trigram_missing in /metrics)"
+        )
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Index-assisted ILIKE '%...%' and word-similarity (%>) matches. On a
+    # partitioned renewals table the index cascades to every partition.
+    for table, columns in TRIGRAM_COLUMNS.items():
+        for column in columns:
+            op.create_index(
+                f"ix_{table}_{column}_trgm",
+                table,
+                [column],
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+
+
+def downgrade() -> None:
+    for table, columns in TRIGRAM_COLUMNS.items():
+        for column in columns:
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_{column}_trgm")
+    # The extension is left installed: other objects may depend on it.
@@ -0,0 +1,56 @@
+"""audit outbox and log (app/audit.py)
+
+Revision ID: 0008_audit_log
+Revises: 0007_search_trigram_indexes
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision = "0008_audit_log"
+down_revision = "0007_search_trigram_indexes"
+branch_labels = None
+depends_on = None
+
+
+def _common() -> list[sa.Column]:
+    return [
+        sa.Column("id", sa.BigInteger(), sa.Identity(), primary_key=True),
+        sa.Column("at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("household_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("actor_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("entity", sa.String(length=16), nullable=False),
+        sa.Column("entity_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("op", sa.String(length=16), nullable=False),
+    ]
+
+
+def upgrade() -> None:
+    # Written by every mutation, drained in batches: no indexes beyond the key.
+    op.create_table(
+        "audit_outbox",
+        *_common(),
+        sa.Column("before", postgresql.JSONB(), nullable=True),
+        sa.Column("after", postgresql.JSONB(), nullable=True),
+    )
+
+    # Append-only; read by entity or household, newest first.
+    op.create_table(
+        "audit_log",
+        *_common(),
+        sa.Column("changes", postgresql.JSONB(), nullable=False),
+    )
+    op.create_index("ix_audit_log_entity_id_at", "audit_log", ["entity_id", "at"])
+    op.create_index("ix_audit_log_household_id_at", "audit_log", ["household_id", "at"])
+    # Rows arrive in time order, so a BRIN index covers time-range scans for a few pages.
+    op.create_index("ix_audit_log_at_brin", "audit_log", ["at"], postgresql_using="brin")
+
+
+def downgrade() -> None:
+    op.drop_table("audit_log")
+    op.drop_table("audit_outbox")
@@ -0,0 +1,27 @@
+"""index renewals on (car_id, valid_from, valid_to) for as-of compliance queries
+
+Revision ID: 0010_renewals_valid_range_index
+Revises: 0009_calendar_feeds
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "0010_renewals_valid_range_index"
+down_revision = "0009_calendar_feeds"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Replaces ix_renewals_car_id: same leading column, plus the date range, so
+    # "which covers of this car span day X" is answered from the index.
+    op.create_index("ix_renewals_car_id_valid_range", "renewals", ["car_id", "valid_from", "valid_to"])
+    op.drop_index("ix_renewals_car_id", table_name="renewals")
+
+
+def downgrade() -> None:
+    op.create_index("ix_renewals_car_id", "renewals", ["car_id"])
+    op.drop_index("ix_renewals_car_id_valid_range", table_name="renewals")
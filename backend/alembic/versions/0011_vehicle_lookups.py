@@ -0,0 +1,33 @@
+"""vehicle data lookup cache (app/vehicles.py)
+
+Revision ID: 0011_vehicle_lookups
+Revises: 0010_renewals_valid_range_index
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision = "0011_vehicle_lookups"
+down_revision = "0010_renewals_valid_range_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "vehicle_lookups",
+        sa.Column("provider", sa.String(length=32), primary_key=True),
+        sa.Column("registration_number", sa.String(length=16), primary_key=True),
+        sa.Column("data", postgresql.JSONB(), nullable=True),
+        sa.Column("fetched_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("vehicle_lookups")
@@ -0,0 +1,40 @@
+"""renewal attachments (app/attachments.py)
+
+Revision ID: 0012_attachments
+Revises: 0011_vehicle_lookups
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision = "0012_attachments"
+down_revision = "0011_vehicle_lookups"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "attachments",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("renewal_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=False),
+        sa.Column("content_type", sa.String(length=127), nullable=False),
+        sa.Column(
+            "created_by", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="SET NULL"), nullable=True
+        ),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_attachments_renewal_id", "attachments", ["renewal_id"])
+    op.create_index("ix_attachments_sha256", "attachments", ["sha256"])
+
+
+def downgrade() -> None:
+    op.drop_table("attachments")
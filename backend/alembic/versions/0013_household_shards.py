@@ -0,0 +1,38 @@
+"""household -> shard directory (app/shards.py)
+
+Revision ID: 0013_household_shards
+Revises: 0012_attachments
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision = "0013_household_shards"
+down_revision = "0012_attachments"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Only read on the directory (DATABASE_URL); shards get the table too, so every
+    # database has the same schema, but leave it empty.
+    op.create_table(
+        "household_shards",
+        sa.Column(
+            "household_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("households.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("shard", sa.String(length=64), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("household_shards")
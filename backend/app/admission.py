@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import Settings
+from app.metrics import metrics
+
+# (method or None for any, path prefix, group). First match wins; anything
+# else under /api is "default". Expensive work gets its own group so a burst
+# of it cannot take every worker thread from cheap reads.
+ROUTE_GROUPS: list[tuple[str | None, str, str]] = [
+    ("POST", "/api/auth/login", "auth"),  # bcrypt
+    ("POST", "/api/auth/token", "auth"),
+    ("POST", "/api/auth/signup", "auth"),
+    ("GET", "/api/renewals/upcoming", "upcoming"),
+]
+
+# Rejections from the auth group look like the login throttle (429); elsewhere
+# the server is overloaded (503).
+REJECT_STATUS = {"auth": 429}
+
+
+# Long-lived streams wait on the event loop, not a worker thread; a slot
+# per open stream would starve their group.
+UNLIMITED_PATHS = ("/api/events",)
+
+
+def route_group(method: str, path: str) -> str | None:
+    if not path.startswith("/api/") or path.startswith(UNLIMITED_PATHS):
+        return None  # /health, /metrics, docs, streams: never queued or shed
+    for m, prefix, group in ROUTE_GROUPS:
+        if (m is None or m == method) and path.startswith(prefix):
+            return group
+    return "default"
+
+
+class Rejected(Exception):
+    def __init__(self, retry_after: int) -> None:
+        self.retry_after = retry_after
+
+
+class ConcurrencyGroup:
+    """At most `limit` requests at a time; up to `queue_size` more wait (FIFO)
+    for at most `queue_timeout` seconds, the rest are rejected at once.
+
+    Waiters may be on different event loops (one per TestClient, say), so
+    state is guarded by a thread lock and waiters are woken thread-safely.
+    """
+
+    def __init__(self, name: str, *, limit: int, queue_size: int, queue_timeout: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters: deque[_Waiter] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= self.limit and self.queued >= self.queue_size
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.queue_timeout))
+
+    def _shed(self, reason: str) -> Rejected:
+        metrics.inc(f"admission.{self.name}.shed")
+        metrics.inc(f"admission.{self.name}.shed_{reason}")
+        return Rejected(self._retry_after())
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                metrics.inc(f"admission.{self.name}.admitted")
+                return
+            if len(self._waiters) >= self.queue_size:
+                raise self._shed("queue_full")
+            waiter = _Waiter(loop, loop.create_future())
+            self._waiters.append(waiter)
+        metrics.inc(f"admission.{self.name}.queued")
+
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except BaseException as err:  # timeout, or the client went away
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if not granted:
+                if isinstance(err, TimeoutError):
+                    raise self._shed("timeout") from None
+                raise
+            if not isinstance(err, TimeoutError):
+                self.release()  # granted, but the request is gone
+                raise
+            # otherwise the slot arrived just as we timed out: keep it
+        metrics.inc(f"admission.{self.name}.admitted")
+        metrics.inc(f"admission.{self.name}.wait_ms", int((time.monotonic() - t0) * 1000))
+
+    def release(self) -> None:
+        with self._lock:
+            if self._waiters:
+                # Hand the slot straight to the oldest waiter; in_flight is unchanged.
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.loop.call_soon_threadsafe(_grant, waiter.future)
+            else:
+                self.in_flight -= 1
+
+    def snapshot(self) -> dict[str, int]:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": self.queued}
+
+
+@dataclass(eq=False)
+class _Waiter:
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future
+    granted: bool = False
+
+
+def _grant(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class AdmissionController:
+    def __init__(self, limits: dict[str, int], *, queue_size: int, queue_timeout: float) -> None:
+        self.groups = {
+            name: ConcurrencyGroup(name, limit=limit, queue_size=queue_size, queue_timeout=queue_timeout)
+            for name, limit in limits.items()
+            if limit > 0
+        }
+
+    def group(self, name: str | None) -> ConcurrencyGroup | None:
+        return self.groups.get(name) if name else None
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        return {name: g.snapshot() for name, g in self.groups.items()}
+
+    def overloaded(self) -> bool:
+        """The cheap-read group is full and queueing: a load balancer should back off."""
+        default = self.groups.get("default")
+        return default is not None and default.saturated
+
+
+_controllers: dict[tuple, AdmissionController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_admission(settings: Settings) -> AdmissionController:
+    key = (
+        tuple(sorted(settings.admission_limits.items())),
+        settings.admission_queue_size,
+        settings.admission_queue_timeout_seconds,
+    )
+    controller = _controllers.get(key)
+    if controller is None:
+        with _controllers_lock:
+            controller = _controllers.get(key)
+            if controller is None:
+                controller = _controllers[key] = AdmissionController(
+                    settings.admission_limits,
+                    queue_size=settings.admission_queue_size,
+                    queue_timeout=settings.admission_queue_timeout_seconds,
+                )
+    return controller
+
+
+def reset_admission() -> None:
+    with _controllers_lock:
+        _controllers.clear()
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware: admit, queue or shed each /api request by route group.
+
+    Uses `settings` if given, else reads the environment on each request.
+    """
+
+    def __init__(self, app: ASGIApp, *, settings: Settings | None = None) -> None:
+        self.app = app
+        self.settings = settings
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        group = get_admission(self.settings or Settings.from_env()).group(route_group(scope["method"], scope["path"]))
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await group.acquire()
+        except Rejected as rej:
+            await _reject(send, REJECT_STATUS.get(group.name, 503), rej.retry_after)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            group.release()
+
+
+async def _reject(send: Send, status: int, retry_after: int) -> None:
+    body = b'{"detail":"Server busy. Try again later."}'
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
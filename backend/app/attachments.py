@@ -0,0 +1,448 @@
+"""Renewal attachments: policy PDFs, MOT certificates and the like.
+
+Content lives in a blob store under its SHA-256, so a file attached twice
+(to two renewals, or by two households) is stored once. Attachment rows
+hold the metadata and the digest.
+
+  local  files under ATTACHMENT_DIR/ab/cd/<digest>
+  s3     objects <digest> in ATTACHMENT_S3_BUCKET (the optional 's3' extra,
+         boto3); ATTACHMENT_S3_ENDPOINT_URL points it at any S3-compatible
+         service, e.g. the MinIO in infra/docker-compose.yml
+
+Nothing is held in memory whole. An upload streams through a Spool: a
+temporary file, hashed as it is written. Once complete it is moved (local)
+or uploaded (s3) under its digest, unless that digest is already stored.
+Downloads stream from the store in READ_CHUNK_BYTES pieces, for a byte
+range if one was asked for.
+
+Placing a blob and deleting an unreferenced one both run under a
+transaction-scoped advisory lock on the digest. An upload therefore either
+commits its row before a deletion looks for references, or finds the blob
+gone and places it again. With DATABASE_SHARDS, blobs are shared by every
+shard: the lock is taken on the directory and references are looked for
+on every database. Blobs orphaned by a crash are swept by:
+
+    python -m app.attachments gc
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+import uuid
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Protocol
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, delete, exists, func, insert, literal, select, text
+from sqlalchemy.orm import Session
+
+from app.config import Settings
+from app.db import make_engine, make_session_factory
+from app.metrics import metrics
+from app.models import Attachment, Car, RenewalRecord
+from app.scoped import household_of
+
+READ_CHUNK_BYTES = 256 * 1024
+
+
+class Spool:
+    """A temporary file that hashes what is written to it."""
+
+    def __init__(self, directory: str | None = None) -> None:
+        fd, self.path = tempfile.mkstemp(prefix="upload-", dir=directory)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    def discard(self) -> None:
+        """Remove the file, unless a store has taken it."""
+        self._file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class BlobStore(Protocol):
+    name: str
+
+    def spool(self) -> Spool: ...
+
+    def put(self, spool: Spool) -> bool:
+        """Store a closed spool under its digest; False if it was already stored. The spool is used up."""
+        ...
+
+    def read(self, digest: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        """The bytes [start, end) of a blob, in pieces."""
+        ...
+
+    def delete(self, digest: str) -> None: ...
+
+    def digests(self) -> Iterator[str]: ...
+
+
+class LocalBlobStore:
+    name = "local"
+
+    def __init__(self, root: str | os.PathLike) -> None:
+        self.root = Path(root)
+        self._tmp = self.root / "tmp"  # same filesystem, so placing a blob is a rename
+        self._tmp.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def spool(self) -> Spool:
+        return Spool(str(self._tmp))
+
+    def put(self, spool: Spool) -> bool:
+        spool.close()
+        target = self.path(spool.digest)
+        if target.exists():
+            spool.discard()
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(spool.path, target)
+        return True
+
+    def read(self, digest: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        with open(self.path(digest), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(READ_CHUNK_BYTES if remaining is None else min(READ_CHUNK_BYTES, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, digest: str) -> None:
+        try:
+            self.path(digest).unlink()
+        except FileNotFoundError:
+            pass
+
+    def digests(self) -> Iterator[str]:
+        for path in self.root.glob("??/??/*"):
+            yield path.name
+
+
+class S3BlobStore:
+    name = "s3"
+
+    def __init__(self, bucket: str, *, endpoint_url: str | None = None, client=None) -> None:
+        if client is None:
+            import boto3  # optional "s3" extra; imported lazily
+
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+
+    def spool(self) -> Spool:
+        return Spool()
+
+    def _exists(self, digest: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=digest)
+        except ClientError as err:
+            if err.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def put(self, spool: Spool) -> bool:
+        spool.close()
+        try:
+            if self._exists(spool.digest):
+                return False
+            # A managed transfer: multipart, from the file, a part at a time.
+            self.client.upload_file(spool.path, self.bucket, spool.digest)
+            return True
+        finally:
+            spool.discard()
+
+    def read(self, digest: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        kwargs = {}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+        body = self.client.get_object(Bucket=self.bucket, Key=digest, **kwargs)["Body"]
+        try:
+            yield from body.iter_chunks(READ_CHUNK_BYTES)
+        finally:
+            body.close()
+
+    def delete(self, digest: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=digest)
+
+    def digests(self) -> Iterator[str]:
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket):
+            for obj in page.get("Contents", ()):
+                yield obj["Key"]
+
+
+_stores: dict[tuple, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(settings: Settings) -> BlobStore:
+    key = (
+        settings.attachment_storage,
+        settings.attachment_dir,
+        settings.attachment_s3_bucket,
+        settings.attachment_s3_endpoint_url,
+    )
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                if settings.attachment_storage == "local":
+                    store = LocalBlobStore(settings.attachment_dir)
+                elif settings.attachment_storage == "s3":
+                    if not settings.attachment_s3_bucket:
+                        raise RuntimeError("ATTACHMENT_STORAGE=s3 needs ATTACHMENT_S3_BUCKET")
+                    store = S3BlobStore(settings.attachment_s3_bucket, endpoint_url=settings.attachment_s3_endpoint_url)
+                else:
+                    raise RuntimeError(f"Unknown ATTACHMENT_STORAGE: {settings.attachment_storage}")
+                _stores[key] = store
+    return store
+
+
+# -------------------------
+# Rows
+# -------------------------
+
+
+def _owned_renewal(user_id: uuid.UUID, renewal_id: uuid.UUID):
+    return and_(
+        RenewalRecord.id == renewal_id,
+        RenewalRecord.is_deleted.is_(False),
+        Car.id == RenewalRecord.car_id,
+        Car.household_id == household_of(user_id),
+    )
+
+
+def _owned_attachment(user_id: uuid.UUID, attachment_id: uuid.UUID):
+    return and_(
+        Attachment.id == attachment_id,
+        RenewalRecord.id == Attachment.renewal_id,
+        RenewalRecord.is_deleted.is_(False),
+        Car.id == RenewalRecord.car_id,
+        Car.household_id == household_of(user_id),
+    )
+
+
+def owns_renewal(db: Session, user_id: uuid.UUID, renewal_id: uuid.UUID) -> bool:
+    """Whether the user may attach to this (live) renewal: checked before an upload is read."""
+    return db.scalar(select(exists().where(_owned_renewal(user_id, renewal_id)))) or False
+
+
+def list_for_renewal(db: Session, user_id: uuid.UUID, renewal_id: uuid.UUID) -> list[Attachment] | None:
+    """A renewal's attachments, oldest first; None if the renewal is not the user's."""
+    stmt = (
+        select(RenewalRecord.id, Attachment)
+        .select_from(RenewalRecord)
+        .join(Car, Car.id == RenewalRecord.car_id)
+        .outerjoin(Attachment, Attachment.renewal_id == RenewalRecord.id)
+        .where(_owned_renewal(user_id, renewal_id))
+        .order_by(Attachment.created_at, Attachment.id)
+    )
+    rows = db.execute(stmt).all()
+    if not rows:
+        return None
+    return [a for _, a in rows if a is not None]
+
+
+def get(db: Session, user_id: uuid.UUID, attachment_id: uuid.UUID) -> Attachment | None:
+    return db.scalars(select(Attachment).where(_owned_attachment(user_id, attachment_id))).one_or_none()
+
+
+def _lock(db: Session, digest: str) -> None:
+    shards = db.info.get("shards")
+    db.execute(
+        text("SELECT pg_advisory_xact_lock(hashtextextended(:digest, 0))"),
+        {"digest": digest},
+        bind_arguments={"bind": shards.directory} if shards is not None else None,
+    )
+
+
+def save(
+    db: Session,
+    store: BlobStore,
+    spool: Spool,
+    *,
+    user_id: uuid.UUID,
+    renewal_id: uuid.UUID,
+    filename: str,
+    content_type: str,
+) -> Attachment | None:
+    """Store the spooled upload and attach it; None if the renewal is no longer the user's. Commits."""
+    digest, size = spool.digest, spool.size
+    _lock(db, digest)
+    added = store.put(spool)
+    values = {
+        "id": uuid.uuid4(),
+        "sha256": digest,
+        "size": size,
+        "filename": filename,
+        "content_type": content_type,
+        "created_by": user_id,
+        "created_at": datetime.utcnow(),
+    }
+    source = select(
+        RenewalRecord.id, *(literal(v, Attachment.__table__.c[k].type) for k, v in values.items())
+    ).where(_owned_renewal(user_id, renewal_id))
+    stmt = insert(Attachment).from_select(["renewal_id", *values], source).returning(Attachment)
+    attachment = db.scalars(stmt).one_or_none()
+    if attachment is None:
+        db.rollback()
+        if added:
+            release(db, store, digest)
+        return None
+    db.commit()
+    metrics.inc("attachments.uploads")
+    metrics.inc("attachments.bytes_in", size)
+    if not added:
+        metrics.inc("attachments.deduplicated")
+    return attachment
+
+
+def remove(db: Session, store: BlobStore, user_id: uuid.UUID, attachment_id: uuid.UUID) -> bool:
+    """Delete the attachment, and its blob if nothing else uses it. Commits."""
+    stmt = (
+        delete(Attachment)
+        .where(Attachment.id == attachment_id)
+        .where(_owned_attachment(user_id, attachment_id))
+        .returning(Attachment.sha256)
+    )
+    digest = db.scalars(stmt).one_or_none()
+    if digest is None:
+        return False
+    db.commit()
+    release(db, store, digest)
+    return True
+
+
+def release(db: Session, store: BlobStore, digest: str) -> bool:
+    """Delete a blob no attachment refers to. Returns whether it did. Commits (releasing the lock)."""
+    _lock(db, digest)
+    stmt = select(exists().where(Attachment.sha256 == digest))
+    shards = db.info.get("shards")
+    unused = not (any(shards.scalars_everywhere(stmt)) if shards is not None else db.scalar(stmt))
+    if unused:
+        store.delete(digest)
+        metrics.inc("attachments.blobs_deleted")
+    db.commit()
+    return unused
+
+
+def gc(db: Session, store: BlobStore) -> int:
+    """Delete every stored blob no attachment refers to. Returns how many."""
+    stmt = select(func.distinct(Attachment.sha256))
+    shards = db.info.get("shards")
+    referenced = set(shards.scalars_everywhere(stmt) if shards is not None else db.scalars(stmt))
+    db.rollback()
+    return sum(release(db, store, d) for d in store.digests() if d not in referenced)
+
+
+# -------------------------
+# HTTP helpers
+# -------------------------
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ByteRange:
+    start: int
+    end: int  # exclusive
+
+    def content_range(self, size: int) -> str:
+        return f"bytes {self.start}-{self.end - 1}/{size}"
+
+
+def parse_range(header: str | None, size: int) -> ByteRange | None:
+    """The single byte range a Range header asks for; None to send the whole body.
+
+    Multiple ranges and malformed headers get the whole body (RFC 9110 allows
+    ignoring Range). Raises RangeNotSatisfiable if it starts past the end.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:  # suffix: the last N bytes
+            n = int(last)
+            if n <= 0:
+                raise RangeNotSatisfiable
+            return ByteRange(max(0, size - n), size)
+        start = int(first)
+        end = size if not last else min(int(last) + 1, size)
+    except ValueError:
+        return None
+    if start < 0 or (last and int(last) < start):
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return ByteRange(start, end)
+
+
+def content_disposition(filename: str) -> str:
+    fallback = filename.encode("ascii", "replace").decode().replace('"', "'").replace("\\", "_")
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.attachments")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("gc")
+    parser.parse_args()
+
+    load_dotenv()
+    settings = Settings.from_env()
+    if settings.database_shards:
+        from app.shards import get_shard_router
+
+        session = get_shard_router(settings).session()
+    else:
+        session = make_session_factory(make_engine(settings))()
+    with session as db:
+        removed = gc(db, get_blob_store(settings))
+    print(f"deleted {removed} unreferenced blobs")
+
+
+if __name__ == "__main__":
+    main()
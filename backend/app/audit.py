@@ -0,0 +1,282 @@
+"""Audit trail: before/after diffs of every car and renewal change.
+
+Write path: each mutation statement in app.scoped carries a data-modifying
+CTE that appends the row's before and after images (JSONB) to audit_outbox.
+It is the same statement and the same transaction as the write, so the
+entry commits or rolls back with it, and no round trip is added. The
+outbox has no secondary indexes, which keeps the append cheap.
+
+Flush path: an AuditShipper per worker drains the outbox in batches. It
+claims rows with DELETE ... FOR UPDATE SKIP LOCKED RETURNING, turns the
+images into {"field": [before, after]} diffs, and COPYs them into
+audit_log, one transaction per batch. A crash mid-batch puts the batch back
+in the outbox, and several workers can flush at once. audit_log is indexed
+for reads by entity and by household over time.
+
+The log trails the writes by up to AUDIT_FLUSH_INTERVAL_SECONDS. With 0,
+nothing flushes in-process; run the CLI from cron instead.
+
+CLI (from backend/):
+    python -m app.audit flush [--batch-size N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime
+
+from dotenv import load_dotenv
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import (
+    CTE,
+    ColumnElement,
+    FromClause,
+    Select,
+    Table,
+    cast,
+    func,
+    insert,
+    literal,
+    select,
+    tuple_,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config import Settings
+from app.db import make_engine
+from app.metrics import metrics
+from app.models import AuditLog, AuditOutbox
+
+log = logging.getLogger(__name__)
+
+# Bumped by every write; a diff of only these says nothing.
+IGNORED_FIELDS = frozenset({"updated_at"})
+
+_LOG_COLUMNS = ("at", "household_id", "actor_id", "entity", "entity_id", "op", "changes")
+
+
+# -------------------------
+# Write path
+# -------------------------
+
+
+def image(row: FromClause) -> ColumnElement:
+    """A whole row of `row` (a table alias or CTE) as JSONB."""
+    return func.to_jsonb(row.table_valued())
+
+
+def typed(table: Table, name: str, value) -> ColumnElement:
+    """`value` as a bound parameter cast to the column's type (enums need the explicit cast)."""
+    column_type = table.c[name].type
+    return cast(literal(value, column_type), column_type)
+
+
+def built(table: Table, values: dict) -> ColumnElement:
+    """`values` as a JSONB object, each value typed like its column."""
+    pairs = [x for name, value in values.items() for x in (literal(name), typed(table, name, value))]
+    return func.jsonb_build_object(*pairs)
+
+
+def patched(row: FromClause, table: Table, values: dict) -> ColumnElement:
+    """The image of `row` with `values` applied: the after image of an UPDATE."""
+    return image(row).op("||")(built(table, values))
+
+
+def outbox(source: Select, *, entity: str, op: str, actor_id: uuid.UUID | None) -> CTE:
+    """A CTE appending one outbox entry per row of `source`, to add to a write with .add_cte().
+
+    `source` selects (entity_id, household_id, before, after).
+    """
+    rows = source.add_columns(literal(entity), literal(op), literal(actor_id, AuditOutbox.actor_id.type))
+    return (
+        insert(AuditOutbox)
+        .from_select(["entity_id", "household_id", "before", "after", "entity", "op", "actor_id"], rows)
+        .cte(f"audit_{entity}")
+    )
+
+
+def record(
+    db: Session,
+    *,
+    entity: str,
+    entity_id: uuid.UUID,
+    household_id: uuid.UUID,
+    actor_id: uuid.UUID | None,
+    op: str,
+    before: dict | None = None,
+    after: dict | None = None,
+) -> None:
+    """Append an outbox entry as its own statement, for multi-statement writes (restores)."""
+    db.execute(
+        insert(AuditOutbox).values(
+            entity=entity,
+            entity_id=entity_id,
+            household_id=household_id,
+            actor_id=actor_id,
+            op=op,
+            before=jsonable_encoder(before),
+            after=jsonable_encoder(after),
+        )
+    )
+
+
+# -------------------------
+# Flush path
+# -------------------------
+
+
+def diff(before: dict | None, after: dict | None) -> dict[str, list]:
+    """{"field": [before, after]} for every field whose value changed."""
+    before, after = before or {}, after or {}
+    return {
+        name: [before.get(name), after.get(name)]
+        for name in sorted(before.keys() | after.keys())
+        if name not in IGNORED_FIELDS and before.get(name) != after.get(name)
+    }
+
+
+_CLAIM = """
+DELETE FROM audit_outbox
+WHERE id IN (SELECT id FROM audit_outbox ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED)
+RETURNING id, at, household_id, actor_id, entity, entity_id, op, before, after
+"""
+
+
+def flush_batch(engine: Engine, batch_size: int = 1_000) -> int:
+    """Move up to `batch_size` outbox entries into audit_log, in one transaction. Returns how many."""
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        with conn.cursor() as cur:
+            cur.execute(_CLAIM, (batch_size,))
+            rows = sorted(cur.fetchall())  # RETURNING order is unspecified; keep the log in write order
+            if rows:
+                with cur.copy(f"COPY audit_log ({', '.join(_LOG_COLUMNS)}) FROM STDIN") as copy:
+                    for _, at, household_id, actor_id, entity, entity_id, op, before, after in rows:
+                        changes = json.dumps(diff(before, after))
+                        copy.write_row((at, household_id, actor_id, entity, entity_id, op, changes))
+        conn.commit()
+    except BaseException:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    if rows:
+        metrics.inc("audit.flushed", len(rows))
+        metrics.inc("audit.batches")
+    return len(rows)
+
+
+def flush(engine: Engine, batch_size: int = 1_000) -> int:
+    """Drain the outbox. Returns the number of entries moved."""
+    total = 0
+    while True:
+        n = flush_batch(engine, batch_size)
+        total += n
+        if n < batch_size:
+            return total
+
+
+class AuditShipper:
+    """Background thread flushing the outbox every `interval` seconds."""
+
+    def __init__(self, engine: Engine, *, interval: float, batch_size: int) -> None:
+        self.engine = engine
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cartrack-audit", daemon=True)
+
+    def start(self) -> AuditShipper:
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                flush(self.engine, self.batch_size)
+            except Exception:
+                # The entries stay in the outbox for the next round.
+                metrics.inc("audit.flush_errors")
+                log.exception("audit flush failed")
+
+
+_shippers: dict[str, AuditShipper] = {}
+_shippers_lock = threading.Lock()
+
+
+def get_audit_shipper(settings: Settings) -> AuditShipper | None:
+    """This worker's shipper (started on first use), or None if in-process flushing is off."""
+    if settings.audit_flush_interval_seconds <= 0:
+        return None
+    key = settings.database_url
+    shipper = _shippers.get(key)
+    if shipper is None:
+        with _shippers_lock:
+            shipper = _shippers.get(key)
+            if shipper is None:
+                shipper = _shippers[key] = AuditShipper(
+                    make_engine(settings),
+                    interval=settings.audit_flush_interval_seconds,
+                    batch_size=settings.audit_batch_size,
+                ).start()
+    return shipper
+
+
+def stop_audit_shippers() -> None:
+    with _shippers_lock:
+        for shipper in _shippers.values():
+            shipper.stop()
+        _shippers.clear()
+
+
+def history(
+    db: Session,
+    household_id: uuid.UUID,
+    *,
+    entity_id: uuid.UUID | None,
+    before: datetime | None,
+    before_id: int | None = None,
+    limit: int,
+) -> list[AuditLog]:
+    """A household's audit entries, newest first, optionally for one entity.
+
+    Pages on (at, id): pass the last entry's `at` and `id` as `before` and
+    `before_id` for the next page. Entries sharing a timestamp are told apart
+    by id, so none is skipped at a page boundary. `before` alone gives the
+    entries older than that time.
+    """
+    stmt = select(AuditLog).where(AuditLog.household_id == household_id)
+    if entity_id is not None:
+        stmt = stmt.where(AuditLog.entity_id == entity_id)
+    if before is not None and before_id is not None:
+        stmt = stmt.where(tuple_(AuditLog.at, AuditLog.id) < tuple_(before, before_id))
+    elif before is not None:
+        stmt = stmt.where(AuditLog.at < before)
+    return list(db.scalars(stmt.order_by(AuditLog.at.desc(), AuditLog.id.desc()).limit(limit)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.audit")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    run = sub.add_parser("flush")
+    run.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    load_dotenv()
+    settings = Settings.from_env()
+    moved = flush(make_engine(settings), args.batch_size or settings.audit_batch_size)
+    print(f"moved {moved} audit entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Move cold rows out of the hot tables, and bring them back on request.
+
+Soft-deleted renewals older than the retention window, and cars archived
+for longer than theirs (with all of their renewals), are moved into
+renewals_archive / cars_archive. Every request-path query then has fewer
+rows and smaller indexes to wade through. "Older" is judged on updated_at,
+which delete and archive both bump.
+
+Compaction runs in batches, each its own transaction, and skips rows that
+are locked by in-flight requests. Restores are single round trips per table
+(DELETE ... RETURNING feeding an INSERT) in the caller's transaction.
+
+CLI (from backend/):
+    python -m app.compaction sizes
+    python -m app.compaction run [--deleted-days N] [--archived-days N] [--reclaim]
+"""
+
+from __future__ import annotations
+
+import argparse
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, false, insert, literal, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.config import Settings
+from app.db import make_engine
+from app.metrics import metrics
+from app.models import Car, CarArchive, RenewalArchive, RenewalRecord
+
+_CAR_COLS = [c.name for c in Car.__table__.columns]
+_RENEWAL_COLS = [c.name for c in RenewalRecord.__table__.columns]
+
+
+@dataclass(frozen=True)
+class CompactionResult:
+    renewals_archived: int
+    cars_archived: int
+
+
+def _archive_renewals(conn: Connection, where, *, now: datetime) -> int:
+    moved = delete(RenewalRecord).where(where).returning(*RenewalRecord.__table__.columns).cte("moved")
+    stmt = insert(RenewalArchive).from_select(
+        [*_RENEWAL_COLS, "archived_at"],
+        select(*[moved.c[name] for name in _RENEWAL_COLS], literal(now)),
+    )
+    # rowcount of an INSERT is only kept when asked for.
+    return conn.execute(stmt.execution_options(preserve_rowcount=True)).rowcount
+
+
+def compact(
+    engine: Engine,
+    *,
+    deleted_retention_days: int,
+    archived_car_retention_days: int,
+    batch_size: int = 5_000,
+    now: datetime | None = None,
+) -> CompactionResult:
+    now = now or datetime.utcnow()
+    renewals = cars = 0
+
+    deleted_cutoff = now - timedelta(days=deleted_retention_days)
+    while True:
+        with engine.begin() as conn:
+            batch = (
+                select(RenewalRecord.id)
+                .where(RenewalRecord.is_deleted.is_(True), RenewalRecord.updated_at < deleted_cutoff)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            n = _archive_renewals(conn, RenewalRecord.id.in_(batch.scalar_subquery()), now=now)
+        renewals += n
+        if n < batch_size:
+            break
+
+    car_cutoff = now - timedelta(days=archived_car_retention_days)
+    while True:
+        with engine.begin() as conn:
+            ids = list(
+                conn.execute(
+                    select(Car.id)
+                    .where(Car.is_archived.is_(True), Car.updated_at < car_cutoff)
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True)
+                ).scalars()
+            )
+            if ids:
+                renewals += _archive_renewals(conn, RenewalRecord.car_id.in_(ids), now=now)
+                moved = delete(Car).where(Car.id.in_(ids)).returning(*Car.__table__.columns).cte("moved")
+                conn.execute(
+                    insert(CarArchive).from_select(
+                        [*_CAR_COLS, "archived_at"],
+                        select(*[moved.c[name] for name in _CAR_COLS], literal(now)),
+                    )
+                )
+        cars += len(ids)
+        if len(ids) < batch_size:
+            break
+
+    metrics.inc("compaction.renewals_archived", renewals)
+    metrics.inc("compaction.cars_archived", cars)
+    return CompactionResult(renewals_archived=renewals, cars_archived=cars)
+
+
+def restore_car(db: Session, household_id: uuid.UUID, car_id: uuid.UUID) -> Car | None:
+    """Move an archived car and its renewals back into the hot tables.
+
+    The car comes back still archived, exactly as it was compacted. Returns
+    None if the household has no such car in cold storage. Raises
+    IntegrityError if the household has since reused the registration.
+    The caller commits.
+    """
+    moved = (
+        delete(CarArchive)
+        .where(CarArchive.id == car_id, CarArchive.household_id == household_id)
+        .returning(*CarArchive.__table__.columns)
+        .cte("moved")
+    )
+    stmt = (
+        insert(Car)
+        .from_select(_CAR_COLS, select(*[moved.c[name] for name in _CAR_COLS]))
+        .returning(Car)
+    )
+    car = db.scalars(stmt).one_or_none()
+    if car is None:
+        return None
+
+    moved = (
+        delete(RenewalArchive)
+        .where(RenewalArchive.car_id == car_id)
+        .returning(*RenewalArchive.__table__.columns)
+        .cte("moved")
+    )
+    db.execute(insert(RenewalRecord).from_select(_RENEWAL_COLS, select(*[moved.c[name] for name in _RENEWAL_COLS])))
+    metrics.inc("compaction.cars_restored")
+    return car
+
+
+def restore_renewal(db: Session, household_id: uuid.UUID, renewal_id: uuid.UUID) -> RenewalRecord | None:
+    """Move a compacted renewal back into renewals, undeleted.
+
+    Only renewals whose car is in the household's hot tables qualify; a car
+    in cold storage is restored with restore_car instead. Returns None if
+    there is nothing to restore. The caller commits.
+    """
+    owned_cars = select(Car.id).where(Car.household_id == household_id)
+    moved = (
+        delete(RenewalArchive)
+        .where(RenewalArchive.id == renewal_id, RenewalArchive.car_id.in_(owned_cars))
+        .returning(*RenewalArchive.__table__.columns)
+        .cte("moved")
+    )
+    restored = {name: moved.c[name] for name in _RENEWAL_COLS}
+    restored["is_deleted"] = false()
+    restored["updated_at"] = literal(datetime.utcnow())
+    stmt = (
+        insert(RenewalRecord)
+        .from_select(_RENEWAL_COLS, select(*restored.values()))
+        .returning(RenewalRecord)
+    )
+    r = db.scalars(stmt).one_or_none()
+    if r is not None:
+        metrics.inc("compaction.renewals_restored")
+    return r
+
+
+# -------------------------
+# Size reporting
+# -------------------------
+
+_SIZED_TABLES = ("renewals", "cars", "renewals_archive", "cars_archive")
+
+
+def table_sizes(conn: Connection) -> dict[str, dict[str, int]]:
+    """Rows, heap bytes and index bytes per table (partitions summed)."""
+    sizes: dict[str, dict[str, int]] = {}
+    for table in _SIZED_TABLES:
+        row = conn.execute(
+            text(
+                """
+                SELECT coalesce(sum(pg_table_size(rel)), 0), coalesce(sum(pg_indexes_size(rel)), 0)
+                FROM (
+                    -- pg_partition_tree is empty for a plain table
+                    SELECT relid AS rel FROM pg_partition_tree(CAST(:t AS regclass))
+                    UNION SELECT CAST(:t AS regclass)
+                ) AS tree
+                """
+            ),
+            {"t": table},
+        ).one()
+        rows = conn.execute(text(f"SELECT count(*) FROM {table}")).scalar_one()
+        sizes[table] = {"rows": rows, "table_bytes": int(row[0]), "index_bytes": int(row[1])}
+    return sizes
+
+
+def _print_sizes(label: str, sizes: dict[str, dict[str, int]]) -> None:
+    print(label)
+    for table, s in sizes.items():
+        print(
+            f"  {table:<18} rows {s['rows']:>10}  table {s['table_bytes'] / 1e6:>9.2f} MB"
+            f"  indexes {s['index_bytes'] / 1e6:>9.2f} MB"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.compaction")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("sizes")
+    run = sub.add_parser("run")
+    run.add_argument("--deleted-days", type=int, default=None)
+    run.add_argument("--archived-days", type=int, default=None)
+    run.add_argument("--batch-size", type=int, default=5_000)
+    run.add_argument(
+        "--reclaim",
+        action="store_true",
+        help="VACUUM FULL the hot tables afterwards (returns space to the OS; takes an exclusive lock)",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    settings = Settings.from_env()
+    engine = make_engine(settings)
+    with engine.connect() as conn:
+        before = table_sizes(conn)
+    if args.cmd == "sizes":
+        _print_sizes("sizes:", before)
+        return
+
+    result = compact(
+        engine,
+        deleted_retention_days=settings.deleted_renewal_retention_days if args.deleted_days is None else args.deleted_days,
+        archived_car_retention_days=(
+            settings.archived_car_retention_days if args.archived_days is None else args.archived_days
+        ),
+        batch_size=args.batch_size,
+    )
+    with engine.connect() as conn:
+        # VACUUM cannot run in a transaction block. Plain VACUUM makes the space
+        # reusable by new rows; only FULL shrinks the files.
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        if args.reclaim:
+            conn.execute(text("VACUUM FULL renewals, cars"))
+        # Also after FULL, which leaves the visibility map empty (no index-only scans).
+        conn.execute(text("VACUUM ANALYZE renewals, cars"))
+        after = table_sizes(conn)
+    _print_sizes("before:", before)
+    _print_sizes("after:", after)
+    print(f"archived {result.renewals_archived} renewals and {result.cars_archived} cars")
+
+
+if __name__ == "__main__":
+    main()
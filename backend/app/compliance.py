@@ -0,0 +1,232 @@
+"""Fleet compliance on past (or future) dates.
+
+A car is covered for a kind on a day if one of its live renewals of that
+kind spans the day (valid_from <= day <= valid_to). A car that is not
+covered is lapsed if it had cover of that kind before the day, and missing
+if it never had. Soft-deleted renewals don't count. Every car of the
+household that had been added by the day counts (Car.created_at, as a
+date), archived ones included: a car sold since then may still have been
+on the road on the day. Cars and renewals moved to cold storage by
+compaction (app.compaction) are not consulted, so days before the
+compaction horizon can undercount.
+
+Both questions are answered in one statement:
+
+- On one day, per car: the household's cars left-joined to their renewals
+  that started by then, through ix_renewals_car_id_valid_range.
+- Over a series of days, counts only. Each car and kind's covers are merged
+  into islands of continuous cover. Every island start and every first
+  cover is a +1 delta on that day, and the day after an island ends is a
+  -1; both are moved up to the day the car was added, as is a +1 to the
+  car count. A running sum over the deltas, read at a marker row per
+  requested day, gives the counts. The cost grows with renewals + days,
+  not renewals x days.
+"""
+
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass
+from datetime import date
+
+from sqlalchemy import (
+    Date,
+    Select,
+    and_,
+    case,
+    cast,
+    false,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    true,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+from app.enums import RenewalKind
+from app.models import Car, RenewalRecord
+
+# The day a car was added to its household; it counts from then on.
+_ADDED_ON = cast(Car.created_at, Date)
+
+
+@dataclass(frozen=True)
+class CarStatus:
+    car_id: uuid.UUID
+    registration_number: str
+    is_archived: bool
+    kind: RenewalKind
+    status: str  # covered | lapsed | missing
+    # covered: the end of the cover spanning the day; lapsed: the end of the last cover before it
+    valid_to: date | None
+
+
+@dataclass(frozen=True)
+class Counts:
+    on: date
+    kind: RenewalKind
+    covered: int
+    lapsed: int
+    missing: int
+
+
+def status_on(db: Session, household_id: uuid.UUID, on: date) -> list[CarStatus]:
+    """Each car's status per kind on `on`, by registration number."""
+    stmt = (
+        select(
+            Car.id,
+            Car.registration_number,
+            Car.is_archived,
+            RenewalRecord.kind,
+            func.max(RenewalRecord.valid_to).filter(RenewalRecord.valid_to >= on),
+            func.max(RenewalRecord.valid_to).filter(RenewalRecord.valid_to < on),
+        )
+        .select_from(Car)
+        .outerjoin(
+            RenewalRecord,
+            and_(
+                RenewalRecord.car_id == Car.id,
+                RenewalRecord.valid_from <= on,
+                RenewalRecord.is_deleted.is_(False),
+            ),
+        )
+        .where(Car.household_id == household_id, _ADDED_ON <= on)
+        .group_by(Car.id, RenewalRecord.kind)
+        .order_by(Car.registration_number)
+    )
+    cars: dict[uuid.UUID, tuple[str, bool]] = {}
+    found: dict[tuple[uuid.UUID, RenewalKind], tuple[date | None, date | None]] = {}
+    for car_id, registration_number, is_archived, kind, covered_to, lapsed_to in db.execute(stmt):
+        cars[car_id] = (registration_number, is_archived)
+        if kind is not None:
+            found[(car_id, kind)] = (covered_to, lapsed_to)
+
+    out: list[CarStatus] = []
+    for car_id, (registration_number, is_archived) in cars.items():
+        for kind in RenewalKind:
+            covered_to, lapsed_to = found.get((car_id, kind), (None, None))
+            if covered_to is not None:
+                status, valid_to = "covered", covered_to
+            elif lapsed_to is not None:
+                status, valid_to = "lapsed", lapsed_to
+            else:
+                status, valid_to = "missing", None
+            out.append(CarStatus(car_id, registration_number, is_archived, kind, status, valid_to))
+    return out
+
+
+def counts_of(statuses: list[CarStatus], on: date) -> list[Counts]:
+    """Per-kind totals of a status_on() result."""
+    totals = {kind: {"covered": 0, "lapsed": 0, "missing": 0} for kind in RenewalKind}
+    for s in statuses:
+        totals[s.kind][s.status] += 1
+    return [Counts(on=on, kind=kind, **t) for kind, t in totals.items()]
+
+
+def counts_over(db: Session, household_id: uuid.UUID, days: list[date]) -> list[Counts]:
+    """Per-kind covered/lapsed/missing counts on each of `days`, in date then kind order."""
+    if not days:
+        return []
+    days = sorted(set(days))
+    kind_type = RenewalRecord.kind.type
+
+    r = (
+        select(
+            RenewalRecord.car_id,
+            RenewalRecord.kind,
+            RenewalRecord.valid_from,
+            RenewalRecord.valid_to,
+            _ADDED_ON.label("added"),
+        )
+        .join(Car, Car.id == RenewalRecord.car_id)
+        .where(
+            Car.household_id == household_id,
+            _ADDED_ON <= days[-1],
+            RenewalRecord.is_deleted.is_(False),
+            RenewalRecord.valid_from <= days[-1],
+        )
+        .cte("r")
+    )
+    # Islands: a cover starts a new one unless an earlier cover of the same car
+    # and kind reaches (or touches) its first day.
+    pair = (r.c.car_id, r.c.kind)
+    order = (r.c.valid_from, r.c.valid_to)
+    reach = func.max(r.c.valid_to).over(partition_by=pair, order_by=order, rows=(None, -1))
+    s = select(r, reach.label("reach")).cte("s")
+    starts = case((or_(s.c.reach.is_(None), s.c.valid_from > s.c.reach + 1), 1), else_=0)
+    numbered = select(
+        s,
+        func.sum(starts).over(partition_by=(s.c.car_id, s.c.kind), order_by=(s.c.valid_from, s.c.valid_to)).label("n"),
+    ).cte("numbered")
+    islands = (
+        select(
+            numbered.c.car_id,
+            numbered.c.kind,
+            func.min(numbered.c.valid_from).label("start"),
+            func.max(numbered.c.valid_to).label("end"),
+            func.max(numbered.c.added).label("added"),
+        )
+        .group_by(numbered.c.car_id, numbered.c.kind, numbered.c.n)
+        .cte("islands")
+    )
+    # Cover before the car was added counts from that day: an island is cut
+    # short (or dropped), a first cover moves up to it.
+    counted = (
+        select(islands.c.kind, func.greatest(islands.c.start, islands.c.added).label("start"), islands.c.end)
+        .where(islands.c.end >= islands.c.added)
+        .subquery("counted")
+    )
+    firsts = select(
+        islands.c.kind, func.greatest(func.min(islands.c.start), func.max(islands.c.added)).label("day")
+    ).group_by(islands.c.car_id, islands.c.kind)
+    added = (
+        select(_ADDED_ON.label("day"))
+        .where(Car.household_id == household_id, _ADDED_ON <= days[-1])
+        .subquery("added")
+    )
+    requested = select(func.unnest(cast(days, ARRAY(Date))).label("day")).cte("requested")
+
+    def delta(kind, day, covered: int, started: int, cars: int, marker) -> Select:
+        return select(
+            kind.label("kind"),
+            day.label("day"),
+            literal_column(str(covered)).label("covered"),
+            literal_column(str(started)).label("started"),
+            literal_column(str(cars)).label("cars"),
+            marker.label("marker"),
+        )
+
+    fs = firsts.subquery()
+    deltas = union_all(
+        delta(counted.c.kind, counted.c.start, 1, 0, 0, false()),
+        delta(counted.c.kind, counted.c.end + 1, -1, 0, 0, false()),
+        delta(fs.c.kind, fs.c.day, 0, 1, 0, false()),
+        *(delta(literal(kind, kind_type), added.c.day, 0, 0, 1, false()) for kind in RenewalKind),
+        *(
+            delta(literal(kind, kind_type), requested.c.day, 0, 0, 0, true()).select_from(requested)
+            for kind in RenewalKind
+        ),
+    ).subquery("deltas")
+    # Default frame (RANGE ... CURRENT ROW): a marker sees every delta of its own day.
+    window = {"partition_by": deltas.c.kind, "order_by": deltas.c.day}
+    running = select(
+        deltas.c.day,
+        deltas.c.kind,
+        deltas.c.marker,
+        func.sum(deltas.c.covered).over(**window).label("covered"),
+        func.sum(deltas.c.started).over(**window).label("started"),
+        func.sum(deltas.c.cars).over(**window).label("cars"),
+    ).subquery("running")
+    stmt = (
+        select(running.c.day, running.c.kind, running.c.covered, running.c.started, running.c.cars)
+        .where(running.c.marker)
+        .order_by(running.c.day, running.c.kind)
+    )
+    return [
+        Counts(on=day, kind=kind, covered=covered, lapsed=started - covered, missing=total - started)
+        for day, kind, covered, started, total in db.execute(stmt)
+    ]
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 def _getenv(name: str, default: str | None = None) -> str | None:
@@ -16,6 +16,90 @@ class Settings:
     jwt_alg: str
     access_token_expire_minutes: int
     cors_origins: list[str]
+    # Read replicas for GET handlers (empty = everything on the primary).
+    database_replica_urls: list[str] = field(default_factory=list)
+    replica_balancing: str = "round_robin"  # round_robin | least_connections
+    # After a household/user writes, its reads stay on the primary this long.
+    read_your_writes_seconds: float = 5.0
+    # Redis is optional; without it, shared state (rate limits etc.) is per process.
+    redis_url: str | None = None
+    # Login throttling: token buckets refilled at N attempts per minute (0 disables).
+    login_rate_per_ip: int = 20
+    login_rate_per_email: int = 5
+    # Verified-token cache entries per process (0 disables) and JWT library ("jose" | "pyjwt").
+    jwt_cache_size: int = 10_000
+    jwt_backend: str = "jose"
+    # Trust a valid token's subject on GET/HEAD and skip re-reading the users row.
+    auth_trust_claims: bool = False
+    # Compaction (python -m app.compaction run): move soft-deleted renewals and
+    # archived cars to cold storage once untouched for this many days.
+    deleted_renewal_retention_days: int = 90
+    archived_car_retention_days: int = 365
+    # Identical concurrent computations (e.g. upcoming renewals) share one run;
+    # waiters give up and compute themselves after this long. Across workers with REDIS_URL.
+    singleflight_timeout_seconds: float = 5.0
+    # Admission control: concurrent requests per route group (app/admission.py). Keep the
+    # total under the threadpool size (40) so no group can take every thread.
+    admission_limits: dict[str, int] = field(
+        default_factory=lambda: {"auth": 4, "upcoming": 8, "default": 24}
+    )
+    # Per group: how many more may wait, and for how long, before being shed.
+    admission_queue_size: int = 50
+    admission_queue_timeout_seconds: float = 2.0
+    # /api/events: keep-alive comment interval, and events buffered per slow client
+    # before they collapse into a single "resync".
+    events_heartbeat_seconds: float = 15.0
+    events_buffer_size: int = 32
+    # Connections opened per engine at startup so the first requests don't pay for them.
+    pool_warmup_connections: int = 2
+    # psycopg prepares a statement server-side once a connection has run it this many
+    # times (0: at once; None: never, e.g. behind PgBouncer in transaction mode).
+    db_prepare_threshold: int | None = 5
+    # Compress responses at least this big with the best of these the client accepts
+    # (zstd needs Python 3.14, br the 'brotli' extra; unavailable ones are skipped). Empty disables.
+    compression_min_bytes: int = 1024
+    compression_encodings: list[str] = field(default_factory=lambda: ["zstd", "br", "gzip"])
+    # Token for the /admin endpoints and X-Profile requests (unset: admin endpoints return 403).
+    admin_token: str | None = None
+    # Continuous sampling profiler interval (0 disables), and the fraction of /api requests
+    # profiled individually without being asked to (app/profiling.py).
+    profiler_interval_ms: float = 20.0
+    profile_request_rate: float = 0.0
+    # Audit trail (app/audit.py): how often each worker moves outbox entries into
+    # audit_log, and how many per COPY batch. 0 leaves it to `python -m app.audit flush`.
+    audit_flush_interval_seconds: float = 1.0
+    audit_batch_size: int = 1_000
+    # Rendered iCalendar feeds kept per worker (app/ical.py); 0 renders every poll afresh.
+    calendar_cache_size: int = 1_000
+    # Cost forecasts kept per worker, one per household (app/forecast.py); 0 computes every request.
+    forecast_cache_size: int = 1_000
+    # Vehicle data lookups (app/vehicles.py): provider ("" off | stub | dvla) and its API key,
+    # how long answers are cached, provider calls in flight per worker, retries per batch,
+    # and the circuit breaker (consecutive failed batches to open it, seconds until a retrial).
+    vehicle_data_provider: str = ""
+    vehicle_data_api_key: str | None = None
+    vehicle_data_ttl_hours: float = 24.0
+    vehicle_data_concurrency: int = 4
+    vehicle_data_retries: int = 2
+    vehicle_data_breaker_failures: int = 5
+    vehicle_data_breaker_reset_seconds: float = 30.0
+    # Renewal attachments (app/attachments.py): blob store ("local" | "s3"), its directory or
+    # bucket (plus endpoint for non-AWS S3, e.g. MinIO), and the largest file accepted.
+    attachment_storage: str = "local"
+    attachment_dir: str = "var/attachments"
+    attachment_s3_bucket: str | None = None
+    attachment_s3_endpoint_url: str | None = None
+    attachment_max_bytes: int = 100 * 1024 * 1024
+    # GET /health/ready (app/health.py): how long its database/Redis round trips are reused,
+    # and the limits past which it reports not ready (unset ones keep their defaults:
+    # pool=0.9,db_ms=250,queued=20,threads=0.95).
+    readiness_cache_seconds: float = 1.0
+    readiness_thresholds: dict[str, float] = field(default_factory=dict)
+    # Household shards (app/shards.py): name -> database URL. DATABASE_URL stays the directory
+    # (users, households, which shard each household is on) and is itself the "default" shard.
+    # Empty: one database. How long a worker trusts its copy of a household's shard.
+    database_shards: dict[str, str] = field(default_factory=dict)
+    shard_cache_seconds: float = 5.0
 
     @staticmethod
     def from_env() -> Settings:
@@ -25,10 +109,110 @@ class Settings:
         exp = int(_getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
         cors = _getenv("CORS_ORIGINS", "http://localhost:5173")
         cors_origins = [c.strip() for c in cors.split(",") if c.strip()]
+        replicas = _getenv("DATABASE_REPLICA_URLS", "")
+        database_replica_urls = [u.strip() for u in replicas.split(",") if u.strip()]
+        replica_balancing = _getenv("REPLICA_BALANCING", "round_robin")
+        read_your_writes_seconds = float(_getenv("READ_YOUR_WRITES_SECONDS", "5"))
+        redis_url = _getenv("REDIS_URL")
+        login_rate_per_ip = int(_getenv("LOGIN_RATE_PER_IP", "20"))
+        login_rate_per_email = int(_getenv("LOGIN_RATE_PER_EMAIL", "5"))
+        jwt_cache_size = int(_getenv("JWT_CACHE_SIZE", "10000"))
+        jwt_backend = _getenv("JWT_BACKEND", "jose")
+        auth_trust_claims = _getenv("AUTH_TRUST_CLAIMS", "false").lower() in ("1", "true", "yes")
+        deleted_renewal_retention_days = int(_getenv("DELETED_RENEWAL_RETENTION_DAYS", "90"))
+        archived_car_retention_days = int(_getenv("ARCHIVED_CAR_RETENTION_DAYS", "365"))
+        singleflight_timeout_seconds = float(_getenv("SINGLEFLIGHT_TIMEOUT_SECONDS", "5"))
+        limits = _getenv("ADMISSION_LIMITS", "auth=4,upcoming=8,default=24")
+        admission_limits = {
+            name.strip(): int(n) for name, _, n in (p.partition("=") for p in limits.split(",")) if name.strip()
+        }
+        admission_queue_size = int(_getenv("ADMISSION_QUEUE_SIZE", "50"))
+        admission_queue_timeout_seconds = float(_getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+        events_heartbeat_seconds = float(_getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+        events_buffer_size = int(_getenv("EVENTS_BUFFER_SIZE", "32"))
+        pool_warmup_connections = int(_getenv("POOL_WARMUP_CONNECTIONS", "2"))
+        prepare_threshold = _getenv("DB_PREPARE_THRESHOLD", "5")
+        db_prepare_threshold = None if prepare_threshold.lower() == "none" else int(prepare_threshold)
+        compression_min_bytes = int(_getenv("COMPRESSION_MIN_BYTES", "1024"))
+        encodings = _getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+        compression_encodings = [e.strip() for e in encodings.split(",") if e.strip()]
+        admin_token = _getenv("ADMIN_TOKEN")
+        profiler_interval_ms = float(_getenv("PROFILER_INTERVAL_MS", "20"))
+        profile_request_rate = float(_getenv("PROFILE_REQUEST_RATE", "0"))
+        audit_flush_interval_seconds = float(_getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1"))
+        audit_batch_size = int(_getenv("AUDIT_BATCH_SIZE", "1000"))
+        calendar_cache_size = int(_getenv("CALENDAR_CACHE_SIZE", "1000"))
+        forecast_cache_size = int(_getenv("FORECAST_CACHE_SIZE", "1000"))
+        vehicle_data_provider = _getenv("VEHICLE_DATA_PROVIDER", "")
+        vehicle_data_api_key = _getenv("VEHICLE_DATA_API_KEY")
+        vehicle_data_ttl_hours = float(_getenv("VEHICLE_DATA_TTL_HOURS", "24"))
+        vehicle_data_concurrency = int(_getenv("VEHICLE_DATA_CONCURRENCY", "4"))
+        vehicle_data_retries = int(_getenv("VEHICLE_DATA_RETRIES", "2"))
+        vehicle_data_breaker_failures = int(_getenv("VEHICLE_DATA_BREAKER_FAILURES", "5"))
+        vehicle_data_breaker_reset_seconds = float(_getenv("VEHICLE_DATA_BREAKER_RESET_SECONDS", "30"))
+        attachment_storage = _getenv("ATTACHMENT_STORAGE", "local")
+        attachment_dir = _getenv("ATTACHMENT_DIR", "var/attachments")
+        attachment_s3_bucket = _getenv("ATTACHMENT_S3_BUCKET")
+        attachment_s3_endpoint_url = _getenv("ATTACHMENT_S3_ENDPOINT_URL")
+        attachment_max_bytes = int(_getenv("ATTACHMENT_MAX_BYTES", str(100 * 1024 * 1024)))
+        readiness_cache_seconds = float(_getenv("READINESS_CACHE_SECONDS", "1"))
+        thresholds = _getenv("READINESS_THRESHOLDS", "")
+        readiness_thresholds = {
+            name.strip(): float(v) for name, _, v in (p.partition("=") for p in thresholds.split(",")) if name.strip()
+        }
+        shards = _getenv("DATABASE_SHARDS", "")
+        database_shards = {
+            name.strip(): url.strip() for name, _, url in (p.partition("=") for p in shards.split(",")) if name.strip()
+        }
+        shard_cache_seconds = float(_getenv("SHARD_CACHE_SECONDS", "5"))
         return Settings(
             database_url=db,
             jwt_secret=jwt_secret,
             jwt_alg=jwt_alg,
             access_token_expire_minutes=exp,
             cors_origins=cors_origins,
+            database_replica_urls=database_replica_urls,
+            replica_balancing=replica_balancing,
+            read_your_writes_seconds=read_your_writes_seconds,
+            redis_url=redis_url,
+            login_rate_per_ip=login_rate_per_ip,
+            login_rate_per_email=login_rate_per_email,
+            jwt_cache_size=jwt_cache_size,
+            jwt_backend=jwt_backend,
+            auth_trust_claims=auth_trust_claims,
+            deleted_renewal_retention_days=deleted_renewal_retention_days,
+            archived_car_retention_days=archived_car_retention_days,
+            singleflight_timeout_seconds=singleflight_timeout_seconds,
+            admission_limits=admission_limits,
+            admission_queue_size=admission_queue_size,
+            admission_queue_timeout_seconds=admission_queue_timeout_seconds,
+            events_heartbeat_seconds=events_heartbeat_seconds,
+            events_buffer_size=events_buffer_size,
+            pool_warmup_connections=pool_warmup_connections,
+            db_prepare_threshold=db_prepare_threshold,
+            compression_min_bytes=compression_min_bytes,
+            compression_encodings=compression_encodings,
+            admin_token=admin_token,
+            profiler_interval_ms=profiler_interval_ms,
+            profile_request_rate=profile_request_rate,
+            audit_flush_interval_seconds=audit_flush_interval_seconds,
+            audit_batch_size=audit_batch_size,
+            calendar_cache_size=calendar_cache_size,
+            forecast_cache_size=forecast_cache_size,
+            vehicle_data_provider=vehicle_data_provider,
+            vehicle_data_api_key=vehicle_data_api_key,
+            vehicle_data_ttl_hours=vehicle_data_ttl_hours,
+            vehicle_data_concurrency=vehicle_data_concurrency,
+            vehicle_data_retries=vehicle_data_retries,
+            vehicle_data_breaker_failures=vehicle_data_breaker_failures,
+            vehicle_data_breaker_reset_seconds=vehicle_data_breaker_reset_seconds,
+            attachment_storage=attachment_storage,
+            attachment_dir=attachment_dir,
+            attachment_s3_bucket=attachment_s3_bucket,
+            attachment_s3_endpoint_url=attachment_s3_endpoint_url,
+            attachment_max_bytes=attachment_max_bytes,
+            readiness_cache_seconds=readiness_cache_seconds,
+            readiness_thresholds=readiness_thresholds,
+            database_shards=database_shards,
+            shard_cache_seconds=shard_cache_seconds,
         )
@@ -1,9 +1,23 @@
 from __future__ import annotations
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Iterable
+
+from sqlalchemy import Delete, Insert, Update, create_engine, event
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS, CACHING_DISABLED, NO_CACHE_KEY
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
 from app.config import Settings
+from app.metrics import metrics
+from app.redis_store import redis_client
+
+log = logging.getLogger(__name__)
 
 
 class Base(DeclarativeBase):
@@ -11,8 +25,268 @@ class Base(DeclarativeBase):
 
 
 def make_engine(settings: Settings):
-    return create_engine(settings.database_url, pool_pre_ping=True)
+    return get_engine(settings.database_url, prepare_threshold=settings.db_prepare_threshold)
 
 
 def make_session_factory(engine):
     return sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
+
+
+_engines: dict[tuple[str, int | None], Engine] = {}
+_engines_lock = threading.Lock()
+
+# ExecutionContext.cache_hit -> counter: was the SQL string reused from the
+# engine's compiled cache, or compiled for this execution?
+_CACHE_COUNTERS = {
+    CACHE_HIT: "db.statement_cache.hit",
+    CACHE_MISS: "db.statement_cache.miss",
+    CACHING_DISABLED: "db.statement_cache.uncached",
+    NO_CACHE_KEY: "db.statement_cache.uncached",
+}
+
+
+def _count_statement_cache(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None and context.cache_hit in _CACHE_COUNTERS:
+        metrics.inc(_CACHE_COUNTERS[context.cache_hit])
+
+
+def get_engine(url: str, *, prepare_threshold: int | None = 5) -> Engine:
+    """One engine (and connection pool) per URL for the life of the process.
+
+    `prepare_threshold` goes to psycopg (see Settings.db_prepare_threshold);
+    other drivers ignore it.
+    """
+    key = (url, prepare_threshold)
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                connect_args = {}
+                if make_url(url).get_driver_name() == "psycopg":
+                    connect_args["prepare_threshold"] = prepare_threshold
+                engine = _engines[key] = create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+                event.listen(engine, "after_cursor_execute", _count_statement_cache)
+    return engine
+
+
+# -------------------------
+# Read-replica routing
+# -------------------------
+
+
+class InMemoryPinStore:
+    """Read-your-writes pins for a single worker: key -> monotonic deadline."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._until: dict[str, float] = {}
+
+    def pin(self, key: str, seconds: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._until[key] = now + seconds
+            if len(self._until) > 10_000:
+                self._until = {k: t for k, t in self._until.items() if t > now}
+
+    def is_pinned(self, key: str) -> bool:
+        return self._until.get(key, 0.0) > time.monotonic()
+
+
+class RedisPinStore:
+    """Pins shared by every worker, so a write on one worker is visible to reads on another."""
+
+    def __init__(self, url: str, *, prefix: str = "cartrack:pin:") -> None:
+        self._client = redis_client(url)
+        self._prefix = prefix
+
+    def pin(self, key: str, seconds: float) -> None:
+        self._client.set(self._prefix + key, b"1", px=max(1, int(seconds * 1000)))
+
+    def is_pinned(self, key: str) -> bool:
+        return bool(self._client.exists(self._prefix + key))
+
+
+class DatabaseRouter:
+    """Primary engine plus an optional pool of replica engines.
+
+    Replicas are picked round-robin or by fewest checked-out connections. A
+    replica that fails to connect (or raises a disconnect error) is skipped
+    for `retry_seconds`; if none is usable, reads go to the primary.
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: list[Engine],
+        *,
+        balancing: str = "round_robin",
+        read_your_writes_seconds: float = 5.0,
+        pins: InMemoryPinStore | RedisPinStore | None = None,
+        retry_seconds: float = 30.0,
+    ) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.balancing = balancing
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.pins = pins or InMemoryPinStore()
+        self.retry_seconds = retry_seconds
+        self._rr = itertools.count()
+        self._down_until: dict[Engine, float] = {}
+        self._factory = sessionmaker(
+            bind=primary,
+            class_=RoutingSession,
+            autoflush=False,
+            autocommit=False,
+            expire_on_commit=False,
+        )
+        for engine in replicas:
+            event.listen(engine, "handle_error", self._on_replica_error)
+
+    def _on_replica_error(self, context) -> None:
+        if context.is_disconnect and context.engine is not None:
+            self.mark_down(context.engine)
+
+    def mark_down(self, engine: Engine) -> None:
+        metrics.inc("db.replica.marked_down")
+        self._down_until[engine] = time.monotonic() + self.retry_seconds
+
+    def _healthy(self) -> list[Engine]:
+        now = time.monotonic()
+        return [e for e in self.replicas if self._down_until.get(e, 0.0) <= now]
+
+    def pick_replica(self) -> Engine | None:
+        healthy = self._healthy()
+        if not healthy:
+            return None
+        if self.balancing == "least_connections":
+            return min(healthy, key=lambda e: e.pool.checkedout())
+        return healthy[next(self._rr) % len(healthy)]
+
+    def _connect_replica(self) -> Connection | None:
+        # Try each healthy replica at most once; pool_pre_ping makes checkout a liveness check.
+        for _ in range(len(self.replicas)):
+            engine = self.pick_replica()
+            if engine is None:
+                break
+            try:
+                return engine.connect()
+            except DBAPIError:
+                self.mark_down(engine)
+        metrics.inc("db.replica.fallback_to_primary")
+        return None
+
+    def session(self, *, read_only: bool) -> RoutingSession:
+        replica = self._connect_replica() if read_only and self.replicas else None
+        return self._factory(info={"router": self, "replica": replica})
+
+    def pin(self, key: str) -> None:
+        if self.replicas and self.read_your_writes_seconds > 0:
+            self.pins.pin(key, self.read_your_writes_seconds)
+
+    def is_pinned(self, key: str) -> bool:
+        return bool(self.replicas) and self.pins.is_pinned(key)
+
+
+class RoutingSession(Session):
+    """Session that sends writes, flushes and pinned reads to the primary and
+    everything else to the replica connection chosen for this request."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        router: DatabaseRouter | None = self.info.get("router")
+        if router is None:
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+        if self._flushing or isinstance(clause, Insert | Update | Delete):
+            self.info["wrote"] = True
+            return router.primary
+        replica = self.info.get("replica")
+        if replica is None or self.info.get("primary"):
+            return router.primary
+        metrics.inc("db.replica.reads")
+        return replica
+
+    def close(self) -> None:
+        super().close()
+        replica = self.info.pop("replica", None)
+        if replica is not None:
+            replica.close()
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _pin_after_write(session: RoutingSession) -> None:
+    router: DatabaseRouter | None = session.info.get("router")
+    if router is None or not session.info.pop("wrote", False):
+        return
+    for key in ("household_id", "user_id"):
+        if session.info.get(key) is not None:
+            router.pin(f"{key}:{session.info[key]}")
+
+
+def note_principal(db: Session, *, user_id: uuid.UUID | None = None, household_id: uuid.UUID | None = None) -> None:
+    """Record who the request acts for.
+
+    Writes pin these ids to the primary for the read-your-writes window, and
+    a request for a pinned id switches its remaining reads to the primary.
+    """
+    router: DatabaseRouter | None = db.info.get("router")
+    for key, value in (("user_id", user_id), ("household_id", household_id)):
+        if value is None:
+            continue
+        db.info[key] = value
+        if router is not None and not db.info.get("primary") and router.is_pinned(f"{key}:{value}"):
+            db.info["primary"] = True
+            metrics.inc("db.replica.pinned_reads")
+
+
+_routers: dict[tuple, DatabaseRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(settings: Settings) -> DatabaseRouter:
+    key = (
+        settings.database_url,
+        tuple(settings.database_replica_urls),
+        settings.replica_balancing,
+        settings.read_your_writes_seconds,
+        settings.redis_url,
+        settings.db_prepare_threshold,
+    )
+    router = _routers.get(key)
+    if router is None:
+        with _routers_lock:
+            router = _routers.get(key)
+            if router is None:
+                pins = RedisPinStore(settings.redis_url) if settings.redis_url else InMemoryPinStore()
+                router = _routers[key] = DatabaseRouter(
+                    make_engine(settings),
+                    [get_engine(url, prepare_threshold=settings.db_prepare_threshold) for url in settings.database_replica_urls],
+                    balancing=settings.replica_balancing,
+                    read_your_writes_seconds=settings.read_your_writes_seconds,
+                    pins=pins,
+                )
+    return router
+
+
+def warm_up(router: DatabaseRouter, connections: int, *, shards: Iterable[Engine] = ()) -> int:
+    """Open up to `connections` pooled connections per engine (the router's and
+    each shard's), then return them to the pool.
+
+    Best effort: if a database is unreachable, startup carries on and requests
+    connect on demand as before. Returns how many were opened.
+    """
+    opened = 0
+    for engine in [router.primary, *router.replicas, *shards]:
+        held: list[Connection] = []
+        try:
+            for _ in range(min(connections, engine.pool.size())):
+                held.append(engine.connect())
+        except DBAPIError:
+            log.warning("pool warm-up failed for %s", engine.url.render_as_string(hide_password=True))
+            if engine in router.replicas:
+                router.mark_down(engine)
+        finally:
+            opened += len(held)
+            for conn in held:
+                conn.close()
+    metrics.inc("db.pool.warmed", opened)
+    return opened
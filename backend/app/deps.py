@@ -2,14 +2,16 @@ from __future__ import annotations
 
 import uuid
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 
 from app.config import Settings
-from app.db import make_engine, make_session_factory
+from app.db import get_router, note_principal
 from app.models import Household, HouseholdMember, User
+from app.security import InvalidToken, decode_access_token, is_admin_token
+from app.shards import get_shard_router
 
 # oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
@@ -19,55 +21,154 @@ def get_settings() -> Settings:
     return Settings.from_env()
 
 
-def get_db(settings: Settings = Depends(get_settings)):
-    engine = make_engine(settings)
-    SessionLocal = make_session_factory(engine)
-    db: Session = SessionLocal()
+# Handlers for these methods only read, so their sessions may use a replica.
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def get_db(request: Request, settings: Settings = Depends(get_settings)):
+    if settings.database_shards:
+        db: Session = get_shard_router(settings).session()
+    else:
+        db = get_router(settings).session(read_only=request.method in SAFE_METHODS)
     try:
         yield db
     finally:
         db.close()
 
 
-def get_current_user(
+def require_admin(request: Request, settings: Settings = Depends(get_settings)) -> None:
+    """Operator endpoints: the X-Admin-Token header must match ADMIN_TOKEN."""
+    if not is_admin_token(settings, request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
+
+
+def get_token_claims(
     token: str = Depends(oauth2_scheme),
     settings: Settings = Depends(get_settings),
-    db: Session = Depends(get_db),
-) -> User:
+) -> dict:
     try:
-        payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_alg])
-        sub = payload.get("sub")
-        if not sub:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-        user_id = uuid.UUID(sub)
-    except (JWTError, ValueError) as err:
+        return decode_access_token(settings=settings, token=token)
+    except InvalidToken as err:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
         ) from err
 
+
+def token_subject(claims: dict) -> uuid.UUID:
+    sub = claims.get("sub")
+    if not sub:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    try:
+        return uuid.UUID(sub)
+    except (TypeError, ValueError) as err:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+        ) from err
+
+
+def get_current_user(
+    claims: dict = Depends(get_token_claims),
+    db: Session = Depends(get_db),
+) -> User:
+    user_id = token_subject(claims)
+    note_principal(db, user_id=user_id)
+    _note_household_of(db, user_id)
     user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     return user
 
 
-def get_current_household(
-    user: User = Depends(get_current_user),
+def get_current_user_id(
+    request: Request,
+    claims: dict = Depends(get_token_claims),
+    settings: Settings = Depends(get_settings),
     db: Session = Depends(get_db),
-) -> Household:
-    member = (
-        db.query(HouseholdMember)
-        .filter(HouseholdMember.user_id == user.id)
-        .order_by(HouseholdMember.created_at.asc())
-        .first()
-    )
-    if not member:
+) -> uuid.UUID:
+    """Authenticated user id, for handlers that only need the id.
+
+    With AUTH_TRUST_CLAIMS on, read-only requests trust the verified token's
+    subject and skip the users row fetch; writes always confirm the user exists.
+    """
+    user_id = token_subject(claims)
+    note_principal(db, user_id=user_id)
+    _note_household_of(db, user_id)
+    if settings.auth_trust_claims and request.method in ("GET", "HEAD"):
+        return user_id
+    if db.get(User, user_id) is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    return user_id
+
+
+def get_token_user_id(
+    claims: dict = Depends(get_token_claims),
+    db: Session = Depends(get_db),
+) -> uuid.UUID:
+    """Authenticated user id, with no database round trip.
+
+    For handlers whose statements check ownership themselves (app.scoped): a
+    missing user or household shows up when such a statement matches nothing.
+    """
+    user_id = token_subject(claims)
+    note_principal(db, user_id=user_id)
+    _note_household_of(db, user_id)
+    return user_id
+
+
+# Built once: runs on nearly every request, so it skips statement construction
+# and goes straight to the compiled cache (see app.scoped).
+_first_household = (
+    select(HouseholdMember.household_id)
+    .where(HouseholdMember.user_id == bindparam("user_id"))
+    .order_by(HouseholdMember.created_at.asc())
+    .limit(1)
+)
+
+
+def _note_household_of(db: Session, user_id: uuid.UUID) -> None:
+    """On a replica, also honour the pin of the user's household.
+
+    Writes pin the household, so another member's reads move to the primary
+    and see that write at once. This costs one indexed lookup on the
+    replica, and only for requests that still read from it.
+    """
+    if db.info.get("replica") is None or db.info.get("primary"):
+        return
+    household_id = db.scalar(_first_household, {"user_id": user_id})
+    if household_id is not None:
+        note_principal(db, household_id=household_id)
+
+
+def household_id_for(db: Session, user_id: uuid.UUID) -> uuid.UUID:
+    """The user's (first) household, or 409 if they have none yet."""
+    household_id = db.scalar(_first_household, {"user_id": user_id})
+    if household_id is None:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="No household found. Create a household first.",
         )
-    household = db.get(Household, member.household_id)
+    return household_id
+
+
+def get_current_household(
+    user_id: uuid.UUID = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+) -> Household:
+    household_id = household_id_for(db, user_id)
+    note_principal(db, household_id=household_id)
+    household = db.get(Household, household_id)
     if not household:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Household not found")
     return household
+
+
+def get_current_household_id(
+    user_id: uuid.UUID = Depends(get_token_user_id),
+    db: Session = Depends(get_db),
+) -> uuid.UUID:
+    """The caller's household id in one query (membership), for handlers that need it up front."""
+    household_id = household_id_for(db, user_id)
+    note_principal(db, household_id=household_id)
+    return household_id
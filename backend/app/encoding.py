@@ -0,0 +1,300 @@
+"""Response encodings: compression and MessagePack, negotiated per request.
+
+CompressionMiddleware compresses text-like responses of at least
+`minimum_size` bytes with the best encoding the client accepts (zstd, br,
+gzip). zstd needs Python 3.14's compression.zstd, br the optional `brotli`
+package; gzip is always there. Streamed bodies are compressed as they go,
+except event streams, which must reach the client event by event.
+Responses that offer byte ranges (Accept-Ranges) are sent as they are: a
+range, and the strong ETag an If-Range checks, refer to those bytes.
+
+MessagePackMiddleware re-encodes the JSON from the list endpoints as
+MessagePack when the client prefers it (`Accept: application/msgpack`).
+Only those clients pay for the re-encode; JSON keeps FastAPI's fast
+serializer. It runs inside compression, so MessagePack bodies are
+compressed too.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import json
+import re
+import zlib
+from functools import cache
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.metrics import metrics
+
+# Levels for dynamic content: most of the size win at a fraction of the max-level CPU.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+# Whole bodies at least this big are compressed on a worker thread, not the event loop.
+THREAD_MIN_BYTES = 128 * 1024
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/msgpack",
+    "application/xml",
+    "text/plain",
+    "text/html",
+    "text/csv",
+    "text/calendar",
+)
+
+MSGPACK_TYPE = "application/msgpack"
+_MSGPACK_ALIASES = (MSGPACK_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+# GET endpoints returning lists, which may be served as MessagePack.
+MSGPACK_ROUTES = tuple(
+    re.compile(p)
+    for p in (
+        r"^/api/cars$",
+        r"^/api/cars/[^/]+/renewals$",
+        r"^/api/renewals/upcoming$",
+        r"^/api/search$",
+    )
+)
+
+
+def _qvalues(header: str) -> dict[str, float]:
+    """`a;q=0.5, b` -> {"a": 0.5, "b": 1.0} (names lower-cased)."""
+    prefs: dict[str, float] = {}
+    for part in header.split(","):
+        name, *params = (p.strip() for p in part.split(";"))
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        prefs[name.lower()] = q
+    return prefs
+
+
+@cache
+def available_encodings() -> tuple[str, ...]:
+    """Encodings this process can produce, in server preference order."""
+    found = []
+    if importlib.util.find_spec("compression") and importlib.util.find_spec("compression.zstd"):
+        found.append("zstd")
+    if importlib.util.find_spec("brotli"):
+        found.append("br")
+    found.append("gzip")
+    return tuple(found)
+
+
+def choose_encoding(accept_encoding: str, offered: tuple[str, ...] | list[str]) -> str | None:
+    """The offered encoding with the highest client q-value (ties: first offered), or None."""
+    prefs = _qvalues(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = prefs.get(encoding, prefs.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def prefers_msgpack(accept: str) -> bool:
+    """True if Accept ranks MessagePack strictly above JSON (so `*/*` keeps JSON)."""
+    prefs = _qvalues(accept)
+    wildcard = max(prefs.get("application/*", 0.0), prefs.get("*/*", 0.0))
+    q_msgpack = max([prefs.get(t, 0.0) for t in _MSGPACK_ALIASES] + [wildcard])
+    q_json = max(prefs.get("application/json", 0.0), wildcard)
+    return q_msgpack > q_json
+
+
+class _Brotli:
+    def __init__(self) -> None:
+        import brotli
+
+        self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.finish()
+
+
+def compressor(encoding: str):
+    """A fresh streaming compressor: .compress(chunk) -> bytes, .flush() -> final bytes."""
+    if encoding == "gzip":
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    if encoding == "br":
+        return _Brotli()
+    if encoding == "zstd":
+        from compression import zstd
+
+        return zstd.ZstdCompressor(level=ZSTD_LEVEL)
+    raise ValueError(f"unsupported encoding: {encoding}")
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    c = compressor(encoding)
+    return c.compress(data) + c.flush()
+
+
+def _media_type(headers: Headers) -> str:
+    return headers.get("content-type", "").partition(";")[0].strip().lower()
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware: compress responses by Accept-Encoding."""
+
+    def __init__(self, app: ASGIApp, *, minimum_size: int = 1024, encodings: list[str] | None = None) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        wanted = encodings if encodings is not None else list(available_encodings())
+        self.encodings = tuple(e for e in wanted if e in available_encodings())
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        await _Compressor(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _Compressor:
+    """Per-response state for CompressionMiddleware."""
+
+    def __init__(self, app: ASGIApp, encoding: str | None, minimum_size: int) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send
+        self.start: Message | None = None
+        self.stream = None  # compressor, once a streamed body is being compressed
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.on_send)
+
+    async def on_send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            compressible = (
+                _media_type(headers) in COMPRESSIBLE_TYPES
+                and "content-encoding" not in headers
+                and "accept-ranges" not in headers
+                and message["status"] not in (204, 206, 304)
+            )
+            if compressible:
+                # The representation depends on Accept-Encoding whether or not we compress this one.
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+            if not compressible or self.encoding is None:
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start = message  # held until we see the body
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body: bytes = message.get("body", b"")
+        more = message.get("more_body", False)
+        if self.stream is not None:
+            out = self.stream.compress(body)
+            if not more:
+                out += self.stream.flush()
+            self._count(len(body), len(out), response=False)
+            await self.send({"type": "http.response.body", "body": out, "more_body": more})
+            return
+
+        start, self.start = self.start, None
+        headers = MutableHeaders(raw=start["headers"])
+        if not more:
+            if len(body) < self.minimum_size:
+                await self.send(start)
+                await self.send(message)
+                return
+            if len(body) >= THREAD_MIN_BYTES:
+                out = await anyio.to_thread.run_sync(compress, self.encoding, body)
+            else:
+                out = compress(self.encoding, body)
+            headers["content-encoding"] = self.encoding
+            headers["content-length"] = str(len(out))
+            self._count(len(body), len(out))
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": out})
+            return
+
+        # A streamed body: its size is unknown, so compress chunk by chunk.
+        self.stream = compressor(self.encoding)
+        headers["content-encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["content-length"]
+        out = self.stream.compress(body)
+        self._count(len(body), len(out))
+        await self.send(start)
+        await self.send({"type": "http.response.body", "body": out, "more_body": True})
+
+    def _count(self, n_in: int, n_out: int, *, response: bool = True) -> None:
+        prefix = f"compression.{self.encoding}"
+        if response:
+            metrics.inc(f"{prefix}.responses")
+        metrics.inc(f"{prefix}.bytes_in", n_in)
+        metrics.inc(f"{prefix}.bytes_out", n_out)
+
+
+class MessagePackMiddleware:
+    """Pure ASGI middleware: serve the list endpoints as MessagePack on request."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.enabled = importlib.util.find_spec("msgpack") is not None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not any(p.match(scope["path"]) for p in MSGPACK_ROUTES)
+        ):
+            await self.app(scope, receive, send)
+            return
+        wanted = self.enabled and prefers_msgpack(Headers(scope=scope).get("accept", ""))
+        start: Message | None = None
+
+        async def on_send(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept")
+                headers = Headers(raw=message["headers"])
+                if wanted and message["status"] == 200 and _media_type(headers) == "application/json":
+                    start = message  # held until we have the whole body
+                    return
+                await send(message)
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            if message.get("more_body", False):  # not a single JSON document: leave it alone
+                held, start = start, None
+                await send(held)
+                await send(message)
+                return
+
+            import msgpack
+
+            body = msgpack.packb(json.loads(message.get("body", b"")), use_bin_type=True)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["content-type"] = MSGPACK_TYPE
+            headers["content-length"] = str(len(body))
+            metrics.inc("msgpack.responses")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, on_send)
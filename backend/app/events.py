@@ -0,0 +1,279 @@
+"""Household change events: Postgres NOTIFY in, server-sent events out.
+
+Mutation handlers attach a pg_notify() call to the statement that does the
+write (in its RETURNING clause), so the notification costs no extra round
+trip and, being transactional, is only delivered if the write commits.
+
+Each process keeps one LISTEN connection per database (the primary, plus
+each of DATABASE_SHARDS) on a background thread and fans notifications out
+to the subscribers of the affected household. A
+subscriber is a small object with a bounded buffer. If a slow client lets
+the buffer fill up, its pending events are replaced by a single "resync"
+event, telling it to refetch everything. Events are invalidation hints,
+so nothing of value is lost.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Callable
+
+from sqlalchemy import Text, cast, func, literal, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.config import Settings
+from app.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "cartrack_events"
+
+
+def change_notification(household_id, entity: str, entity_id, op: str) -> ColumnElement:
+    """A pg_notify(...) expression to add to a write's RETURNING clause.
+
+    `household_id` and `entity_id` may be columns (e.g. Car.household_id, Car.id)
+    so each returned row announces itself.
+    """
+    if isinstance(household_id, uuid.UUID):
+        household_id = literal(str(household_id))
+    payload = func.json_build_object(
+        "household_id",
+        cast(household_id, Text),
+        "entity",
+        cast(literal(entity), Text),
+        "id",
+        entity_id,
+        "op",
+        cast(literal(op), Text),
+    )
+    return func.pg_notify(CHANNEL, cast(payload, Text))
+
+
+def notify_change(db: Session, household_id: uuid.UUID, entity: str, entity_id: uuid.UUID, op: str) -> None:
+    """Queue a change notification in the current transaction (for writes without RETURNING)."""
+    db.execute(select(change_notification(household_id, entity, cast(literal(str(entity_id)), Text), op)))
+
+
+class Subscriber:
+    """One connected client.
+
+    Idle subscribers are kept small: the event buffer and the wait future
+    only exist while something is pending or someone is waiting.
+    """
+
+    __slots__ = ("household_id", "loop", "maxlen", "_pending", "_overflowed", "_waiter")
+
+    def __init__(self, household_id: str, loop: asyncio.AbstractEventLoop, *, maxlen: int = 32) -> None:
+        self.household_id = household_id
+        self.loop = loop
+        self.maxlen = maxlen
+        self._pending: list[dict] | None = None
+        self._overflowed = False
+        self._waiter: asyncio.Future | None = None
+
+    def push(self, event: dict) -> None:
+        """Runs on the subscriber's event loop."""
+        if self._overflowed:
+            return  # a resync is already pending
+        if self._pending is None:
+            self._pending = []
+        if len(self._pending) >= self.maxlen:
+            metrics.inc("events.overflows")
+            self.resync()
+            return
+        self._pending.append(event)
+        self._wake()
+
+    def resync(self) -> None:
+        """Drop whatever is pending; the client will be told to refetch."""
+        self._pending = None
+        self._overflowed = True
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def next_batch(self, timeout: float) -> list[tuple[str, dict]]:
+        """Pending (event name, data) pairs; empty after `timeout` with nothing to send."""
+        if not self._pending and not self._overflowed:
+            self._waiter = self.loop.create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except TimeoutError:
+                return []
+            finally:
+                self._waiter = None
+        if self._overflowed:
+            self._overflowed = False
+            return [("resync", {})]
+        batch = [("change", e) for e in self._pending or ()]
+        self._pending = None
+        return batch
+
+
+class EventHub:
+    """One LISTEN connection per database per process, fanned out to in-process subscribers.
+
+    `listening` is set while every connection is up.
+    """
+
+    def __init__(self, database_url: str, *, shard_urls: tuple[str, ...] = (), reconnect_seconds: float = 1.0) -> None:
+        # psycopg wants a libpq URL, not SQLAlchemy's postgresql+psycopg://
+        self._dsns = [
+            make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+            for url in (database_url, *shard_urls)
+        ]
+        self.reconnect_seconds = reconnect_seconds
+        self._lock = threading.Lock()
+        self._subscribers: dict[str, set[Subscriber]] = {}
+        self._watchers: list[Callable[[str | None, dict | None], None]] = []
+        self._threads: list[threading.Thread] = []
+        self._connected: set[str] = set()
+        self._stop = threading.Event()
+        self.listening = threading.Event()
+
+    # -- subscriptions (called on the event loop) --
+
+    def subscribe(self, household_id: uuid.UUID, *, maxlen: int = 32) -> Subscriber:
+        self._ensure_listener()
+        sub = Subscriber(str(household_id), asyncio.get_running_loop(), maxlen=maxlen)
+        with self._lock:
+            self._subscribers.setdefault(sub.household_id, set()).add(sub)
+        metrics.inc("events.subscribed")
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.household_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.household_id]
+        metrics.inc("events.unsubscribed")
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    # -- in-process watchers (called on the listener thread) --
+
+    def watch(self, callback: Callable[[str | None, dict | None], None]) -> None:
+        """Call `callback(household_id, event)` for every change, and `(None, None)`
+        when the listener reconnects (changes may have been missed). Must be quick.
+        """
+        with self._lock:
+            self._watchers.append(callback)
+        self._ensure_listener()
+
+    def _tell_watchers(self, household_id: str | None, event: dict | None) -> None:
+        for callback in list(self._watchers):
+            try:
+                callback(household_id, event)
+            except Exception:
+                log.exception("event watcher failed")
+
+    # -- listener thread --
+
+    def _ensure_listener(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                for i, dsn in enumerate(self._dsns):
+                    name = "cartrack-events" if i == 0 else f"cartrack-events-{i}"
+                    thread = threading.Thread(target=self._run, args=(dsn,), name=name, daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def _set_connected(self, dsn: str, up: bool) -> None:
+        with self._lock:
+            if up:
+                self._connected.add(dsn)
+            else:
+                self._connected.discard(dsn)
+            if len(self._connected) == len(self._dsns):
+                self.listening.set()
+            else:
+                self.listening.clear()
+
+    def _run(self, dsn: str) -> None:
+        import psycopg  # imported on first subscribe, not at startup
+
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(dsn, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    self._set_connected(dsn, True)
+                    while not self._stop.is_set():
+                        for n in conn.notifies(timeout=1.0):
+                            self.dispatch(n.payload)
+            except Exception:
+                self._set_connected(dsn, False)
+                metrics.inc("events.listener_errors")
+                log.exception("event listener failed; reconnecting")
+                # Clients may have missed changes while we were away.
+                self._broadcast_resync()
+                time.sleep(self.reconnect_seconds)
+
+    def dispatch(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+            household_id = event.pop("household_id")
+        except (ValueError, KeyError, AttributeError):
+            metrics.inc("events.bad_payloads")
+            return
+        self._tell_watchers(household_id, event)
+        with self._lock:
+            subs = list(self._subscribers.get(household_id, ()))
+        metrics.inc("events.received")
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.push, event)
+            except RuntimeError:  # loop closed; the subscriber is going away
+                pass
+        metrics.inc("events.delivered", len(subs))
+
+    def _broadcast_resync(self) -> None:
+        self._tell_watchers(None, None)
+        with self._lock:
+            subs = [s for group in self._subscribers.values() for s in group]
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.resync)
+            except RuntimeError:
+                pass
+
+
+_hubs: dict[tuple, EventHub] = {}
+_hubs_lock = threading.Lock()
+
+
+def get_event_hub(settings: Settings) -> EventHub:
+    # Writes notify on the database they run on, so listen on every shard too.
+    shard_urls = tuple(settings.database_shards.values())
+    key = (settings.database_url, shard_urls)
+    hub = _hubs.get(key)
+    if hub is None:
+        with _hubs_lock:
+            hub = _hubs.get(key)
+            if hub is None:
+                hub = _hubs[key] = EventHub(settings.database_url, shard_urls=shard_urls)
+    return hub
+
+
+def format_sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
@@ -0,0 +1,333 @@
+"""Renewal cost forecast: what each car, and the household, will spend next.
+
+For every car and renewal kind with history, the projection is:
+
+  due dates  the day after the latest cover ends (today, if it has already
+             lapsed), then every `cadence` days: the mean term of that car's
+             past renewals of the kind, clamped to [28 days, 3 years]
+  estimate   the mean cost_pence of that car's renewals of the kind that
+             started in the last HISTORY_YEARS; without any, the median of
+             the other cars' estimates for the kind ("kind" basis); without
+             those either, unpriced
+
+Only live renewals of cars that are not archived count, and a car with no
+renewals has nothing to project. Due dates in [today, today + months) are
+reported per car and totalled per calendar month and per kind.
+
+project() works on whole columns at once (one row per renewal, any number
+of cars) with NumPy: group reductions by bincount, then one np.repeat to
+expand every (car, kind) into its due dates. It never loops per car, so a
+household and the whole fleet cost the same code path.
+
+Forecasts are cached in the worker per household, like the calendar feeds
+(app.ical), and dropped on the household's next change notification, car or
+renewal. A forecast computed while a change arrived is returned but not
+kept. Without the listener nothing is cached.
+"""
+
+from __future__ import annotations
+
+import itertools
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import and_, case, func, literal, select
+from sqlalchemy.orm import Session
+
+from app.config import Settings
+from app.enums import RenewalKind
+from app.events import get_event_hub
+from app.metrics import metrics
+from app.models import Car, RenewalRecord
+
+_KINDS: tuple[RenewalKind, ...] = tuple(RenewalKind)
+_KIND_CODE = {k: i for i, k in enumerate(_KINDS)}
+_EPOCH = date(1970, 1, 1)  # dates travel as days since this (numpy datetime64[D])
+
+HISTORY_YEARS = 3
+MIN_TERM_DAYS = 28
+MAX_TERM_DAYS = 3 * 365
+NO_ESTIMATE = -1
+
+
+@dataclass(frozen=True)
+class Projection:
+    """Due dates for a batch of renewal history: one slot per projected renewal."""
+
+    car: np.ndarray  # int32, index into the batch's cars
+    kind: np.ndarray  # int8, index into _KINDS
+    due: np.ndarray  # int32, days since _EPOCH
+    estimate: np.ndarray  # int64 pence, NO_ESTIMATE when unpriced
+    own_history: np.ndarray  # bool, estimate from the car's own costs (else the kind's median)
+    car_total: np.ndarray  # int64 pence per car (length: cars in the batch)
+
+
+def add_months(d: date, months: int) -> date:
+    """Same day `months` later, clamped to the month's end (31 Jan + 1 -> 28/29 Feb)."""
+    y, m = divmod(d.month - 1 + months, 12)
+    year, month = d.year + y, m + 1
+    last = (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return date(year, month, min(d.day, last))
+
+
+def project(
+    car: np.ndarray,
+    kind: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    cost: np.ndarray,
+    *,
+    cars: int,
+    today: date,
+    months: int,
+) -> Projection:
+    """Project renewals due in [today, today + months) from renewal rows (see the module docstring).
+
+    `car`/`kind`/`start`/`end`/`cost` are parallel, one entry per live renewal:
+    car index (< `cars`), kind index, valid_from and valid_to in days since
+    1970-01-01, and cost_pence (NO_ESTIMATE when unknown).
+    """
+    k = len(_KINDS)
+    groups = cars * k
+    t = (today - _EPOCH).days
+    horizon = (add_months(today, months) - _EPOCH).days
+    g = car.astype(np.int64) * k + kind
+
+    count = np.bincount(g, minlength=groups)
+    has = count > 0
+    latest = np.full(groups, np.iinfo(np.int32).min, dtype=np.int64)
+    np.maximum.at(latest, g, end)
+    terms = np.bincount(g, weights=end - start + 1, minlength=groups)
+    cadence = np.clip(np.rint(terms / np.maximum(count, 1)), MIN_TERM_DAYS, MAX_TERM_DAYS).astype(np.int64)
+
+    since = (add_months(today, -12 * HISTORY_YEARS) - _EPOCH).days
+    priced = (cost != NO_ESTIMATE) & (start >= since)
+    spent = np.bincount(g[priced], weights=cost[priced], minlength=groups)
+    n_priced = np.bincount(g[priced], minlength=groups)
+    own = n_priced > 0
+    estimate = np.full(groups, NO_ESTIMATE, dtype=np.int64)
+    estimate[own] = np.rint(spent[own] / n_priced[own])
+    # Cars with no priced history of a kind take the median of the others' estimates.
+    by_kind = estimate.reshape(cars, k)
+    for i in range(k):
+        known = by_kind[:, i][own.reshape(cars, k)[:, i]]
+        if len(known):
+            column = by_kind[:, i]
+            column[(column == NO_ESTIMATE) & has.reshape(cars, k)[:, i]] = int(np.rint(np.median(known)))
+
+    first = np.maximum(latest + 1, t)
+    n_due = np.where(has & (first < horizon), (horizon - first - 1) // cadence + 1, 0)
+    slot = np.repeat(np.arange(groups), n_due)
+    step = np.arange(len(slot)) - np.repeat(np.cumsum(n_due) - n_due, n_due)
+    due = first[slot] + step * cadence[slot]
+    slot_estimate = estimate[slot]
+    slot_car = (slot // k).astype(np.int32)
+
+    car_total = np.bincount(slot_car, weights=np.maximum(slot_estimate, 0), minlength=cars)
+    return Projection(
+        car=slot_car,
+        kind=(slot % k).astype(np.int8),
+        due=due.astype(np.int32),
+        estimate=slot_estimate,
+        own_history=own[slot],
+        car_total=np.rint(car_total).astype(np.int64),
+    )
+
+
+# -------------------------
+# One household
+# -------------------------
+
+
+@dataclass(frozen=True)
+class ForecastItem:
+    kind: RenewalKind
+    due_date: date
+    estimate_pence: int | None
+    basis: str | None  # "car": its own past costs; "kind": other cars' median; None: unpriced
+
+
+@dataclass(frozen=True)
+class CarForecast:
+    car_id: uuid.UUID
+    registration_number: str
+    total_pence: int
+    renewals: list[ForecastItem]
+
+
+@dataclass(frozen=True)
+class MonthTotal:
+    month: date  # first day of the month
+    total_pence: int
+    renewals: int
+
+
+@dataclass(frozen=True)
+class Forecast:
+    as_of: date
+    until: date  # exclusive
+    total_pence: int
+    unpriced: int  # projected renewals with no estimate (not in the totals)
+    by_month: list[MonthTotal]
+    by_kind: dict[RenewalKind, int]
+    cars: list[CarForecast]
+
+
+def load(
+    db: Session, household_id: uuid.UUID | None = None
+) -> tuple[list[tuple[uuid.UUID, str]], tuple[np.ndarray, ...]]:
+    """(cars, columns for project()) for the household's (or, with None, every) active car.
+
+    One row per car with its renewals as arrays, already as integers, so a
+    fleet-wide load converts no per-renewal Python objects.
+    """
+    stmt = (
+        select(
+            Car.id,
+            Car.registration_number,
+            func.array_agg(case(_KIND_CODE, value=RenewalRecord.kind)),
+            func.array_agg(RenewalRecord.valid_from - literal(_EPOCH)),
+            func.array_agg(RenewalRecord.valid_to - literal(_EPOCH)),
+            func.array_agg(func.coalesce(RenewalRecord.cost_pence, NO_ESTIMATE)),
+        )
+        .join(RenewalRecord, and_(RenewalRecord.car_id == Car.id, RenewalRecord.is_deleted.is_(False)))
+        .where(Car.is_archived.is_(False))
+        .group_by(Car.id)
+        .order_by(Car.id)
+    )
+    if household_id is not None:
+        stmt = stmt.where(Car.household_id == household_id)
+
+    rows = db.execute(stmt).all()
+    counts = np.fromiter((len(r[2]) for r in rows), dtype=np.int64, count=len(rows))
+    n = int(counts.sum())
+
+    def column(i: int, dtype) -> np.ndarray:
+        return np.fromiter(itertools.chain.from_iterable(r[i] for r in rows), dtype=dtype, count=n)
+
+    cars = [(r[0], r[1]) for r in rows]
+    car = np.repeat(np.arange(len(rows), dtype=np.int32), counts)
+    return cars, (car, column(2, np.int8), column(3, np.int64), column(4, np.int64), column(5, np.int64))
+
+
+def build(db: Session, household_id: uuid.UUID, *, today: date, months: int) -> Forecast:
+    cars, columns = load(db, household_id)
+    p = project(*columns, cars=len(cars), today=today, months=months)
+    until = add_months(today, months)
+
+    priced = p.estimate != NO_ESTIMATE
+    month_of = (p.due.astype("datetime64[D]").astype("datetime64[M]") - np.datetime64(today, "M")).astype(np.int64)
+    n_months = (until.year - today.year) * 12 + until.month - today.month + (until.day > 1)
+    month_pence = np.bincount(month_of[priced], weights=p.estimate[priced], minlength=n_months)
+    month_count = np.bincount(month_of, minlength=n_months)
+    kind_pence = np.bincount(p.kind[priced], weights=p.estimate[priced], minlength=len(_KINDS))
+
+    items: list[list[ForecastItem]] = [[] for _ in cars]
+    order = np.lexsort((p.kind, p.due, p.car))
+    for car, kind, due, estimate, own in zip(
+        p.car[order].tolist(),
+        p.kind[order].tolist(),
+        p.due[order].tolist(),
+        p.estimate[order].tolist(),
+        p.own_history[order].tolist(),
+        strict=True,
+    ):
+        unpriced = estimate == NO_ESTIMATE
+        items[car].append(
+            ForecastItem(
+                kind=_KINDS[kind],
+                due_date=_EPOCH + timedelta(days=due),
+                estimate_pence=None if unpriced else estimate,
+                basis=None if unpriced else "car" if own else "kind",
+            )
+        )
+    first_month = today.replace(day=1)
+    return Forecast(
+        as_of=today,
+        until=until,
+        total_pence=int(p.car_total.sum()),
+        unpriced=int(np.count_nonzero(~priced)),
+        by_month=[
+            MonthTotal(month=add_months(first_month, i), total_pence=int(round(pence)), renewals=int(n))
+            for i, (pence, n) in enumerate(zip(month_pence.tolist(), month_count.tolist(), strict=True))
+        ],
+        by_kind={kind: int(round(pence)) for kind, pence in zip(_KINDS, kind_pence.tolist(), strict=True)},
+        cars=[
+            CarForecast(car_id=car_id, registration_number=reg, total_pence=int(total), renewals=car_items)
+            for (car_id, reg), total, car_items in zip(cars, p.car_total.tolist(), items, strict=True)
+        ],
+    )
+
+
+# -------------------------
+# Per-household cache
+# -------------------------
+
+
+class ForecastCache:
+    """Forecasts of this worker, one per household (latest day/horizon asked), LRU-bounded."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._forecasts: OrderedDict[str, tuple[tuple[date, int], Forecast]] = OrderedDict()
+        # household -> marker of the build in progress; a change notification removes it
+        self._building: dict[str, object] = {}
+
+    def on_change(self, household_id: str | None, event: dict | None) -> None:
+        """EventHub watcher (runs on the listener thread): any car or renewal change drops the forecast."""
+        with self._lock:
+            if household_id is None:  # notifications may have been missed
+                self._forecasts.clear()
+                self._building.clear()
+                return
+            self._forecasts.pop(household_id, None)
+            self._building.pop(household_id, None)
+
+    def forecast(
+        self, db: Session, household_id: uuid.UUID, *, today: date, months: int, cache: bool = True
+    ) -> Forecast:
+        """The household's forecast. With `cache` False (listener not connected), built and not kept."""
+        key, params = str(household_id), (today, months)
+        if not self.maxsize or not cache:
+            metrics.inc("forecast.builds")
+            return build(db, household_id, today=today, months=months)
+
+        with self._lock:
+            cached = self._forecasts.get(key)
+            if cached is not None and cached[0] == params:
+                self._forecasts.move_to_end(key)
+                metrics.inc("forecast.hits")
+                return cached[1]
+            marker = self._building[key] = object()
+
+        metrics.inc("forecast.builds")
+        result = build(db, household_id, today=today, months=months)
+        with self._lock:
+            if self._building.get(key) is marker:  # no change arrived while building
+                del self._building[key]
+                self._forecasts[key] = (params, result)
+                self._forecasts.move_to_end(key)
+                while len(self._forecasts) > self.maxsize:
+                    self._forecasts.popitem(last=False)
+        return result
+
+
+_caches: dict[str, ForecastCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_forecast_cache(settings: Settings) -> ForecastCache:
+    """This worker's forecast cache, watching the database's change notifications."""
+    cache = _caches.get(settings.database_url)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(settings.database_url)
+            if cache is None:
+                cache = _caches[settings.database_url] = ForecastCache(settings.forecast_cache_size)
+                get_event_hub(settings).watch(cache.on_change)
+    return cache
@@ -0,0 +1,221 @@
+"""Liveness and readiness.
+
+GET /health/live says the process is serving requests, and nothing more:
+restart the worker if it stops answering.
+
+GET /health/ready says whether this worker should get traffic, with the
+numbers behind the answer:
+
+  pools      per engine (primary, replicas, shard:<name> for each
+             DATABASE_SHARDS entry): checked out, overflow in use,
+             size, capacity, utilization (checked out / capacity)
+  database   round-trip time of SELECT 1 per engine, including checkout
+  cache      Redis PING time, if REDIS_URL is set
+  requests   admission in-flight and queued counts per route group
+  threads    worker threads busy out of the threadpool's size
+
+It returns 503 once a READINESS_THRESHOLDS limit is crossed:
+- pool: the primary's utilization
+- db_ms: the primary's round trip
+- queued: total requests waiting for admission
+- threads: threadpool utilization
+
+The primary being unreachable also fails it. Each shard is held to the
+same pool, database and db_ms limits, since its households' requests need
+it just as much; those failures are named shard:<name>:pool and so on.
+Replicas and Redis are reported but never fail readiness, because reads
+fall back to the primary and shared state falls back to per-worker state.
+
+The round trips are cached for READINESS_CACHE_SECONDS, and concurrent
+probes share one refresh, so a probe every second costs at most one SELECT 1
+per engine. The in-memory gauges are read fresh every time. The round trip
+is skipped while the primary's pool is exhausted: it would only queue
+behind the requests already waiting for a connection.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from app.config import Settings
+from app.db import DatabaseRouter, get_engine, get_router
+from app.metrics import metrics
+from app.redis_store import redis_client
+
+
+def pool_stats(engine: Engine) -> dict:
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0}
+    size = pool.size()
+    capacity = size + max(0, pool._max_overflow)
+    checked_out = pool.checkedout()
+    return {
+        "checked_out": checked_out,
+        "overflow": max(0, pool.overflow()),
+        "size": size,
+        "capacity": capacity,
+        "utilization": round(checked_out / capacity, 3) if capacity else 0.0,
+    }
+
+
+def _round_trip_ms(engine: Engine) -> float:
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    return round((time.perf_counter() - t0) * 1000, 2)
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    pool: float = 0.9
+    db_ms: float = 250.0
+    queued: int = 20
+    threads: float = 0.95
+
+    @classmethod
+    def parse(cls, values: dict[str, float]) -> Thresholds:
+        unknown = values.keys() - cls.__dataclass_fields__.keys()
+        if unknown:
+            raise ValueError(f"Unknown READINESS_THRESHOLDS: {', '.join(sorted(unknown))}")
+        return cls(**{name: type(getattr(cls, name))(value) for name, value in values.items()})
+
+
+class Readiness:
+    def __init__(
+        self,
+        router: DatabaseRouter,
+        *,
+        redis_url: str | None,
+        cache_seconds: float,
+        thresholds: Thresholds,
+        shards: dict[str, Engine] | None = None,
+    ) -> None:
+        self.router = router
+        self.shards = shards or {}
+        self.redis_url = redis_url
+        self.cache_seconds = cache_seconds
+        self.thresholds = thresholds
+        self._lock = threading.Lock()
+        self._probed: dict | None = None
+        self._probed_at = float("-inf")
+
+    def _engines(self) -> dict[str, Engine]:
+        return (
+            {"primary": self.router.primary}
+            | {f"replica{i}": e for i, e in enumerate(self.router.replicas)}
+            | {f"shard:{name}": e for name, e in self.shards.items()}
+        )
+
+    def probe(self) -> dict:
+        """The round trips, at most once per cache_seconds (callers during a refresh wait for it)."""
+        if time.monotonic() - self._probed_at < self.cache_seconds:
+            return self._probed
+        with self._lock:
+            if time.monotonic() - self._probed_at < self.cache_seconds:
+                return self._probed
+            metrics.inc("health.probes")
+            database: dict[str, dict] = {}
+            for name, engine in self._engines().items():
+                stats = pool_stats(engine)
+                if stats.get("capacity") and stats["checked_out"] >= stats["capacity"]:
+                    database[name] = {"ok": False, "error": "pool exhausted"}
+                    continue
+                try:
+                    database[name] = {"ok": True, "ms": _round_trip_ms(engine)}
+                except Exception as err:
+                    database[name] = {"ok": False, "error": type(err).__name__}
+            cache: dict = {"configured": self.redis_url is not None}
+            if self.redis_url:
+                t0 = time.perf_counter()
+                try:
+                    redis_client(self.redis_url).ping()
+                    cache |= {"ok": True, "ms": round((time.perf_counter() - t0) * 1000, 2)}
+                except Exception as err:
+                    cache |= {"ok": False, "error": type(err).__name__}
+            self._probed = {
+                "checked_at": datetime.now(UTC).isoformat(),
+                "database": database,
+                "cache": cache,
+            }
+            self._probed_at = time.monotonic()
+            return self._probed
+
+    def report(
+        self, probed: dict | None, *, admission: dict[str, dict[str, int]], threads: dict[str, int]
+    ) -> tuple[bool, dict]:
+        """(ready, body) from a probe() result (None: not probed, the threadpool is full) and live gauges."""
+        t = self.thresholds
+        pools = {name: pool_stats(engine) for name, engine in self._engines().items()}
+        queued = sum(g["queued"] for g in admission.values())
+        threads_used = threads["busy"] / threads["size"] if threads["size"] else 0.0
+
+        failing: list[str] = []
+        for name in ["primary", *(f"shard:{s}" for s in self.shards)]:
+            prefix = "" if name == "primary" else f"{name}:"
+            if pools[name].get("utilization", 0.0) >= t.pool:
+                failing.append(f"{prefix}pool")
+            if probed is not None:
+                database = probed["database"][name]
+                if not database["ok"]:
+                    failing.append(f"{prefix}database")
+                elif database["ms"] > t.db_ms:
+                    failing.append(f"{prefix}db_ms")
+        if queued > t.queued:
+            failing.append("queued")
+        if threads_used >= t.threads:
+            failing.append("threads")
+
+        body = {
+            "status": "not_ready" if failing else "ready",
+            "failing": failing,
+            "pools": pools,
+            **(probed or {"database": None, "cache": None}),
+            "requests": {
+                "in_flight": sum(g["in_flight"] for g in admission.values()),
+                "queued": queued,
+                "groups": admission,
+            },
+            "threads": threads | {"utilization": round(threads_used, 3)},
+            "thresholds": vars(t),
+        }
+        if failing:
+            metrics.inc("health.not_ready")
+        return not failing, body
+
+
+_checkers: dict[tuple, Readiness] = {}
+_checkers_lock = threading.Lock()
+
+
+def get_readiness(settings: Settings) -> Readiness:
+    key = (
+        settings.database_url,
+        tuple(settings.database_replica_urls),
+        tuple(sorted(settings.database_shards.items())),
+        settings.redis_url,
+        settings.readiness_cache_seconds,
+        tuple(sorted(settings.readiness_thresholds.items())),
+    )
+    checker = _checkers.get(key)
+    if checker is None:
+        with _checkers_lock:
+            checker = _checkers.get(key)
+            if checker is None:
+                checker = _checkers[key] = Readiness(
+                    get_router(settings),
+                    redis_url=settings.redis_url,
+                    cache_seconds=settings.readiness_cache_seconds,
+                    thresholds=Thresholds.parse(settings.readiness_thresholds),
+                    shards={
+                        name: get_engine(url, prepare_threshold=settings.db_prepare_threshold)
+                        for name, url in settings.database_shards.items()
+                    },
+                )
+    return checker
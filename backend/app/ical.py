@@ -0,0 +1,419 @@
+"""iCalendar feed of renewal due dates, cached per household.
+
+Calendar clients poll every few minutes and can't send an Authorization
+header. Each user therefore gets an unguessable feed URL,
+/api/calendar/{token}.ics. Only the token's SHA-256 is stored.
+
+The feed has one all-day event per car and renewal kind, on the latest
+valid_to of that kind. That is the same cover upcoming_renewals looks at.
+Each event has an alarm for each of the feed owner's reminder offsets.
+Archived cars and cars with no renewals have no events.
+
+Each car's events are rendered once and cached in the worker, per household
+and set of offsets. The change notifications of app.events say which cars
+or renewals changed, and only those cars are re-read and re-rendered. A poll
+with nothing changed runs the token lookup and nothing else. If the
+listener is not connected, feeds are built fresh and not cached. When it
+reconnects, every cached feed is rebuilt on its next poll.
+
+The body is deterministic: cars are in id order and DTSTAMP comes from
+updated_at. Every worker therefore computes the same strong ETag, a SHA-256
+over the per-car digests.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import secrets
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime, timedelta
+from email.utils import parsedate_to_datetime
+
+from sqlalchemy import cast, func, select, union
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.orm import Session
+
+from app.config import Settings
+from app.enums import RenewalKind
+from app.events import get_event_hub
+from app.metrics import metrics
+from app.models import Car, RenewalRecord
+
+PRODID = "-//Car Tracker//Renewal due dates//EN"
+_HEADER = (
+    "BEGIN:VCALENDAR\r\n"
+    "VERSION:2.0\r\n"
+    f"PRODID:{PRODID}\r\n"
+    "CALSCALE:GREGORIAN\r\n"
+    "METHOD:PUBLISH\r\n"
+    "X-WR-CALNAME:Car renewals\r\n"
+    # a hint to clients that poll far more often than anything changes
+    "REFRESH-INTERVAL;VALUE=DURATION:PT1H\r\n"
+    "X-PUBLISHED-TTL:PT1H\r\n"
+).encode()
+_FOOTER = b"END:VCALENDAR\r\n"
+# Streamed bodies are sent in pieces of about this size, not one per car.
+_STREAM_CHUNK_BYTES = 64 * 1024
+
+_KIND_LABELS = {RenewalKind.INSURANCE: "insurance", RenewalKind.MOT: "MOT", RenewalKind.TAX: "road tax"}
+
+# Reminder offsets per kind, normalised: ((kind, (30, 7, 1)), ...) in RenewalKind order.
+Alarms = tuple[tuple[RenewalKind, tuple[int, ...]], ...]
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def alarms_from(preferences: dict[str, list[int]]) -> Alarms:
+    return tuple((kind, tuple(sorted(set(preferences.get(kind.value, ())), reverse=True))) for kind in RenewalKind)
+
+
+# -------------------------
+# Rendering
+# -------------------------
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _line(text: str) -> str:
+    """One content line, folded at 75 octets (RFC 5545 3.1)."""
+    raw = text.encode()
+    if len(raw) <= 75:
+        return text + "\r\n"
+    parts, line = [], b""
+    for ch in text:
+        b = ch.encode()
+        if len(line) + len(b) > (75 if not parts else 74):
+            parts.append(line.decode())
+            line = b""
+        line += b
+    parts.append(line.decode())
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _stamp(at: datetime) -> str:
+    if at.tzinfo is not None:
+        at = at.astimezone(UTC)
+    return at.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _trigger(days: int) -> str:
+    return f"-P{days}D" if days else "PT0S"
+
+
+def render_car(
+    car_id: uuid.UUID,
+    label: str,
+    covers: Iterable[tuple[RenewalKind, date]],
+    *,
+    modified: datetime,
+    alarms: Alarms,
+) -> bytes:
+    """The VEVENTs of one car: one per kind with cover, each with its VALARMs."""
+    offsets = dict(alarms)
+    stamp = _stamp(modified)
+    out: list[str] = []
+    for kind, valid_to in sorted(covers):
+        summary = _escape(f"{label} {_KIND_LABELS[kind]} expires")
+        out += [
+            "BEGIN:VEVENT\r\n",
+            f"UID:{car_id}-{kind.value.lower()}@cartrack\r\n",
+            f"DTSTAMP:{stamp}\r\n",
+            f"LAST-MODIFIED:{stamp}\r\n",
+            f"DTSTART;VALUE=DATE:{valid_to:%Y%m%d}\r\n",
+            f"DTEND;VALUE=DATE:{valid_to + timedelta(days=1):%Y%m%d}\r\n",
+            _line(f"SUMMARY:{summary}"),
+            "TRANSP:TRANSPARENT\r\n",
+        ]
+        for days in offsets.get(kind, ()):
+            out += [
+                "BEGIN:VALARM\r\n",
+                "ACTION:DISPLAY\r\n",
+                _line(f"DESCRIPTION:{summary}"),
+                f"TRIGGER:{_trigger(days)}\r\n",
+                "END:VALARM\r\n",
+            ]
+        out.append("END:VEVENT\r\n")
+    return "".join(out).encode()
+
+
+def _car_label(registration_number: str, make: str | None, model: str | None) -> str:
+    name = " ".join(p for p in (make, model) if p)
+    return f"{registration_number} ({name})" if name else registration_number
+
+
+# -------------------------
+# Loading
+# -------------------------
+
+
+@dataclass(frozen=True)
+class _CarState:
+    car_id: uuid.UUID
+    events: bytes  # empty: no events (archived, or no renewals)
+    modified: datetime
+
+
+def _load(
+    db: Session,
+    household_id: uuid.UUID,
+    alarms: Alarms,
+    *,
+    car_ids: Iterable[uuid.UUID] | None = None,
+    renewal_ids: Iterable[uuid.UUID] | None = None,
+) -> Iterator[_CarState]:
+    """Render the household's cars (or only those named, directly or by renewal), in id order.
+
+    One statement, streamed: one row per car and kind, carrying the latest live
+    valid_to and the newest updated_at (deleted renewals included, so a delete
+    still moves Last-Modified).
+    """
+    stmt = (
+        select(
+            Car.id,
+            Car.registration_number,
+            Car.make,
+            Car.model,
+            Car.is_archived,
+            Car.updated_at,
+            RenewalRecord.kind,
+            func.max(RenewalRecord.valid_to).filter(RenewalRecord.is_deleted.is_(False)),
+            func.max(RenewalRecord.updated_at),
+        )
+        .select_from(Car)
+        .outerjoin(RenewalRecord, RenewalRecord.car_id == Car.id)
+        .where(Car.household_id == household_id)
+        .group_by(Car.id, RenewalRecord.kind)
+        .order_by(Car.id)
+    )
+    if car_ids is not None or renewal_ids is not None:
+        # One IN over a union, not an OR of two: the planner sees how few cars
+        # qualify and goes through the primary key and ix_renewals_car_id_valid_range.
+        named = select(RenewalRecord.car_id).where(RenewalRecord.id.in_(list(renewal_ids or ())))
+        if car_ids:
+            named = union(named, select(func.unnest(cast(list(car_ids), ARRAY(UUID(as_uuid=True))))))
+        stmt = stmt.where(Car.id.in_(named))
+    # A change can be announced before a replica has it.
+    db.info["primary"] = True
+    rows = db.execute(stmt.execution_options(yield_per=10_000))
+    for car_id, group in itertools.groupby(rows, key=lambda r: r[0]):
+        group = list(group)
+        _, registration_number, make, model, is_archived, car_updated, *_ = group[0]
+        modified = max([car_updated, *(r[8] for r in group if r[8] is not None)])
+        covers = [(r[6], r[7]) for r in group if r[7] is not None]
+        events = b""
+        if covers and not is_archived:
+            label = _car_label(registration_number, make, model)
+            events = render_car(car_id, label, covers, modified=modified, alarms=alarms)
+        yield _CarState(car_id, events, modified)
+
+
+# -------------------------
+# Cache
+# -------------------------
+
+
+@dataclass(frozen=True)
+class CalendarDocument:
+    """One version of a feed: immutable, so it can be streamed while the feed moves on."""
+
+    etag: str
+    last_modified: datetime | None
+    parts: tuple[bytes, ...]
+
+    def stream(self) -> Iterator[bytes]:
+        buf: list[bytes] = [_HEADER]
+        size = len(_HEADER)
+        for part in self.parts:
+            buf.append(part)
+            size += len(part)
+            if size >= _STREAM_CHUNK_BYTES:
+                yield b"".join(buf)
+                buf, size = [], 0
+        buf.append(_FOOTER)
+        yield b"".join(buf)
+
+    def body(self) -> bytes:
+        return b"".join(self.stream())
+
+
+def _document(cars: dict[uuid.UUID, tuple[bytes, bytes]], modified: datetime | None) -> CalendarDocument:
+    order = sorted(cars)
+    h = hashlib.sha256(_HEADER)
+    for car_id in order:
+        h.update(cars[car_id][1])
+    return CalendarDocument(
+        etag=f'"{h.hexdigest()[:32]}"',
+        last_modified=modified,
+        parts=tuple(cars[car_id][0] for car_id in order),
+    )
+
+
+@dataclass
+class _Feed:
+    household_id: uuid.UUID
+    alarms: Alarms
+    generation: int
+    cars: dict[uuid.UUID, tuple[bytes, bytes]] = field(default_factory=dict)  # car -> (events, digest)
+    modified: datetime | None = None
+    document: CalendarDocument | None = None
+    # Changes announced since the last refresh.
+    changed_cars: set[uuid.UUID] = field(default_factory=set)
+    changed_renewals: set[uuid.UUID] = field(default_factory=set)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def apply(self, states: Iterable[_CarState]) -> int:
+        n = 0
+        for state in states:
+            n += 1
+            if state.events:
+                self.cars[state.car_id] = (state.events, hashlib.sha256(state.events).digest())
+            else:
+                self.cars.pop(state.car_id, None)
+            if self.modified is None or state.modified > self.modified:
+                self.modified = state.modified
+        self.document = _document(self.cars, self.modified)
+        return n
+
+
+class CalendarCache:
+    """Rendered feeds of this worker, LRU-bounded, kept current by change notifications."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._feeds: OrderedDict[tuple[uuid.UUID, Alarms], _Feed] = OrderedDict()
+        self._by_household: dict[str, set[tuple[uuid.UUID, Alarms]]] = {}
+        # Bumped when notifications may have been missed; feeds from older generations are rebuilt.
+        self.generation = 0
+
+    def on_change(self, household_id: str | None, event: dict | None) -> None:
+        """EventHub watcher (runs on the listener thread)."""
+        with self._lock:
+            if household_id is None:
+                self.generation += 1
+                return
+            for key in self._by_household.get(household_id, ()):
+                feed = self._feeds[key]
+                try:
+                    entity_id = uuid.UUID(event["id"])
+                except (KeyError, TypeError, ValueError):
+                    feed.generation = -1
+                    continue
+                if event.get("entity") == "car":
+                    feed.changed_cars.add(entity_id)
+                elif event.get("entity") == "renewal":
+                    feed.changed_renewals.add(entity_id)
+                else:
+                    feed.generation = -1
+
+    def document(self, db: Session, household_id: uuid.UUID, alarms: Alarms, *, cache: bool = True) -> CalendarDocument:
+        """The household's current feed. With `cache` False (listener not connected), built and not kept."""
+        if not self.maxsize or not cache:
+            feed = _Feed(household_id, alarms, generation=-1)
+            metrics.inc("calendar.builds")
+            feed.apply(_load(db, household_id, alarms))
+            return feed.document
+
+        key = (household_id, alarms)
+        with self._lock:
+            feed = self._feeds.get(key)
+            if feed is None:
+                feed = self._feeds[key] = _Feed(household_id, alarms, generation=-1)
+                self._by_household.setdefault(str(household_id), set()).add(key)
+                while len(self._feeds) > self.maxsize:
+                    old_key, _ = self._feeds.popitem(last=False)
+                    self._forget(old_key)
+            else:
+                self._feeds.move_to_end(key)
+
+        with feed.lock:
+            with self._lock:
+                generation = self.generation
+                rebuild = feed.generation != generation
+                # Taken before reading, so changes announced while we read are kept for next time.
+                cars, renewals = feed.changed_cars, feed.changed_renewals
+                feed.changed_cars, feed.changed_renewals = set(), set()
+                feed.generation = generation
+            try:
+                if rebuild:
+                    metrics.inc("calendar.builds")
+                    feed.cars, feed.modified = {}, None
+                    feed.apply(_load(db, household_id, alarms))
+                elif cars or renewals:
+                    metrics.inc("calendar.refreshes")
+                    n = feed.apply(_load(db, household_id, alarms, car_ids=cars, renewal_ids=renewals))
+                    metrics.inc("calendar.cars_rerendered", n)
+                else:
+                    metrics.inc("calendar.hits")
+            except BaseException:
+                # The feed may be half updated: hand back what we took and rebuild next time.
+                with self._lock:
+                    feed.generation = -1
+                    feed.changed_cars |= cars
+                    feed.changed_renewals |= renewals
+                raise
+            return feed.document
+
+    def _forget(self, key: tuple[uuid.UUID, Alarms]) -> None:
+        keys = self._by_household.get(str(key[0]))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_household[str(key[0])]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._feeds.clear()
+            self._by_household.clear()
+
+
+_caches: dict[str, CalendarCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_calendar_cache(settings: Settings) -> CalendarCache:
+    """This worker's feed cache, watching the database's change notifications."""
+    cache = _caches.get(settings.database_url)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(settings.database_url)
+            if cache is None:
+                cache = _caches[settings.database_url] = CalendarCache(settings.calendar_cache_size)
+                get_event_hub(settings).watch(cache.on_change)
+    return cache
+
+
+def is_listening(settings: Settings) -> bool:
+    """Whether change notifications are arriving, so cached feeds can be trusted."""
+    return get_event_hub(settings).listening.is_set()
+
+
+def not_modified(
+    if_none_match: str | None, if_modified_since: str | None, *, etag: str, last_modified: datetime | None
+) -> bool:
+    """RFC 9110 13.1: If-None-Match decides when present; If-Modified-Since only without it."""
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=UTC)
+    return last_modified.replace(microsecond=0) <= since
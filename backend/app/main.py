@@ -1,33 +1,198 @@
+"""ASGI entry point.
+
+Build the app with `create_app()` (`uvicorn --factory app.main:create_app`).
+Importing this module is cheap: routers, models and the database driver are
+imported by the factory, and connections are opened in the lifespan, before
+the server accepts traffic. `app.main:app` still works and builds the app on
+first access.
+"""
+
 from __future__ import annotations
 
-from dotenv import load_dotenv
+import dataclasses
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 
+from app.admission import AdmissionMiddleware, get_admission
 from app.config import Settings
-from app.routers import auth, cars, households, renewals, settings
+from app.encoding import CompressionMiddleware, MessagePackMiddleware
+from app.metrics import metrics
+from app.profiling import ProfilingMiddleware, get_profiler
+
+
+def _startup(settings: Settings) -> None:
+    from sqlalchemy.orm import configure_mappers
+
+    from app.audit import get_audit_shipper
+    from app.db import get_engine, get_router, warm_up
+
+    # Resolve relationships and compile mapper state now rather than on the first query.
+    configure_mappers()
+    if settings.pool_warmup_connections > 0:
+        shards = [
+            get_engine(url, prepare_threshold=settings.db_prepare_threshold) for url in settings.database_shards.values()
+        ]
+        warm_up(get_router(settings), settings.pool_warmup_connections, shards=shards)
+    _check_search(settings)
+    get_profiler(settings)  # starts this worker's continuous sampler, unless disabled
+    get_audit_shipper(settings)  # and its audit outbox flusher
+    for url in settings.database_shards.values():
+        get_audit_shipper(dataclasses.replace(settings, database_url=url))  # one per shard
+
+
+def _check_search(settings: Settings) -> None:
+    """Warn at boot, not on the first search, if pg_trgm is missing (see app.search)."""
+    from sqlalchemy.exc import DBAPIError
+
+    from app.db import get_router
+    from app.search import has_trigram
+
+    db = get_router(settings).session(read_only=False)
+    try:
+        has_trigram(db)
+    except DBAPIError:
+        pass  # the database is down: readiness reports that
+    finally:
+        db.close()
+
+
+def create_app(settings: Settings | None = None) -> FastAPI:
+    """Build the app from `settings`, or from the environment (and .env).
+
+    Settings passed in govern the app for its lifetime: request dependencies,
+    admission and the health handlers all use them. Without them the app
+    reads the environment as it runs, as get_settings does.
+    """
+    pinned = settings is not None
+    if settings is None:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        settings = Settings.from_env()
+
+    from app.deps import get_settings
+    from app.health import Thresholds, get_readiness
+    from app.routers import (
+        admin,
+        attachments,
+        audit,
+        auth,
+        calendar,
+        cars,
+        compliance,
+        events,
+        forecast,
+        households,
+        renewals,
+        search,
+        vehicles,
+    )
+    from app.routers import settings as settings_router
+    from app.shards import ShardMoved
+
+    # A bad READINESS_THRESHOLDS stops the boot here, rather than failing every probe with a 500.
+    Thresholds.parse(settings.readiness_thresholds)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await run_in_threadpool(_startup, settings)
+        yield
+
+    app = FastAPI(title="CAR TRACK API", version="1.2-phase2", lifespan=lifespan)
+    current_settings = (lambda: settings) if pinned else Settings.from_env
+    if pinned:
+        app.dependency_overrides[get_settings] = current_settings
+
+    # Innermost first. MessagePack re-encoding happens before compression, so
+    # it is compressed too; admission runs before either does any work.
+    app.add_middleware(MessagePackMiddleware)
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_min_bytes,
+        encodings=settings.compression_encodings,
+    )
+    # Added before CORS so CORS wraps it and shed responses still carry CORS headers.
+    app.add_middleware(AdmissionMiddleware, settings=settings if pinned else None)
+    # Outside admission, so a profiled request's time includes any queueing.
+    app.add_middleware(ProfilingMiddleware, settings=settings)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.exception_handler(ShardMoved)
+    async def shard_moved(request, exc: ShardMoved):
+        # The household moved mid-request and nothing was committed: the retry goes to the new shard.
+        return JSONResponse({"detail": "Household is moving; retry"}, status_code=503, headers={"Retry-After": "1"})
+
+    @app.get("/health")
+    def health():
+        # 503 while cheap reads are being queued to the limit, so a load balancer backs off.
+        # Kept for existing probes; /health/live and /health/ready split the two questions.
+        if get_admission(current_settings()).overloaded():
+            return JSONResponse({"status": "overloaded"}, status_code=503)
+        return {"status": "ok"}
+
+    @app.get("/health/live")
+    async def liveness():
+        # Answered on the event loop: touches nothing, needs no worker thread.
+        return {"status": "ok"}
 
-load_dotenv()
-settings_obj = Settings.from_env()
+    @app.get("/health/ready")
+    async def readiness():
+        current = current_settings()
+        checker = get_readiness(current)
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        threads = {"busy": limiter.borrowed_tokens, "size": int(limiter.total_tokens)}
+        probed = None
+        # With every worker thread taken, don't queue for one: report from the gauges alone.
+        if threads["busy"] < threads["size"]:
+            probed = await run_in_threadpool(checker.probe)
+        ready, body = checker.report(probed, admission=get_admission(current).snapshot(), threads=threads)
+        return JSONResponse(body, status_code=200 if ready else 503)
 
-app = FastAPI(title="CAR TRACK API", version="1.2-phase2")
+    @app.get("/metrics")
+    def get_metrics():
+        counters = metrics.snapshot()
+        # Gauges: current admission state per route group.
+        for group, state in get_admission(current_settings()).snapshot().items():
+            for name, value in state.items():
+                counters[f"admission.{group}.{name}"] = value
+        return counters
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings_obj.cors_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    app.include_router(auth.router)
+    app.include_router(households.router)
+    app.include_router(cars.router)
+    app.include_router(renewals.router)
+    app.include_router(attachments.router)
+    app.include_router(settings_router.router)
+    app.include_router(events.router)
+    app.include_router(search.router)
+    app.include_router(audit.router)
+    app.include_router(calendar.router)
+    app.include_router(compliance.router)
+    app.include_router(forecast.router)
+    app.include_router(vehicles.router)
+    app.include_router(admin.router)
+    return app
 
 
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+_app: FastAPI | None = None
 
 
-app.include_router(auth.router)
-app.include_router(households.router)
-app.include_router(cars.router)
-app.include_router(renewals.router)
-app.include_router(settings.router)
+def __getattr__(name: str):
+    # `from app.main import app` / `uvicorn app.main:app`: one shared instance, built on demand.
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """Process-local counters, exposed as JSON at GET /metrics.
+
+    Deliberately tiny: counters only, keyed by dotted names
+    (e.g. "auth.rate_limited.ip"). Each worker reports its own numbers.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = defaultdict(int)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,202 @@
+"""Declarative partitioning of the renewals table.
+
+Two layouts are supported:
+
+- ``range``: by valid_to, one partition per calendar year plus a DEFAULT
+  partition. Prunes queries with valid_to bounds (due windows, the current
+  record lookup in upcoming_renewals) and lets old years be detached.
+- ``hash``: by car_id, a fixed number of partitions. Every per-car query in
+  app/routers/renewals.py prunes to a single partition.
+
+Postgres requires the partition key in the primary key, so a partitioned
+renewals table has PRIMARY KEY (id, valid_to) or (id, car_id); ids stay
+uuid4 and are still unique in practice. The ORM keeps mapping `id` alone.
+
+Conversions run in the caller's transaction (Alembic migration 0005, or the
+CLI below) and copy rows under an ACCESS EXCLUSIVE lock.
+
+CLI (from backend/):
+    python -m app.partitioning status
+    python -m app.partitioning ensure --years-ahead 2   # create future yearly partitions
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import date
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection
+
+from app.config import Settings
+
+STRATEGIES = ("none", "range", "hash")
+TABLE = "renewals"
+DEFAULT_PARTITION = "renewals_default"
+
+
+def current_strategy(conn: Connection) -> str:
+    strat = conn.execute(
+        text(
+            """
+            SELECT p.partstrat FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = :t AND c.relnamespace = current_schema()::regnamespace
+            """
+        ),
+        {"t": TABLE},
+    ).scalar_one_or_none()
+    return {"r": "range", "h": "hash", None: "none"}.get(strat, "unknown")
+
+
+def partitions(conn: Connection) -> list[str]:
+    return list(
+        conn.execute(
+            text(
+                """
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = :t AND p.relnamespace = current_schema()::regnamespace
+                ORDER BY c.relname
+                """
+            ),
+            {"t": TABLE},
+        ).scalars()
+    )
+
+
+def _secondary_index_defs(conn: Connection) -> list[str]:
+    """CREATE INDEX statements for every renewals index except the primary key."""
+    # A partitioned parent reports its indexes as "ON ONLY", which would not
+    # cascade to the new children.
+    return [
+        ddl.replace(" ON ONLY ", " ON ", 1)
+        for ddl in conn.execute(
+            text(
+                """
+                SELECT indexdef FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = :t AND indexname <> :pk
+                ORDER BY indexname
+                """
+            ),
+            {"t": TABLE, "pk": f"{TABLE}_pkey"},
+        ).scalars()
+    ]
+
+
+def _year_partition_ddl(year: int, parent: str = TABLE) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS renewals_y{year} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+    )
+
+
+def _rebuild(conn: Connection, *, partition_clause: str, pk_cols: str, children: list[str]) -> None:
+    """Replace renewals with a copy declared as `partition_clause` (empty for a plain heap)."""
+    index_defs = _secondary_index_defs(conn)
+    conn.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(
+        text(f"CREATE TABLE renewals_new (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) {partition_clause}")
+    )
+    for ddl in children:
+        conn.execute(text(ddl))
+    conn.execute(text(f"INSERT INTO renewals_new SELECT * FROM {TABLE}"))
+    conn.execute(text(f"DROP TABLE {TABLE}"))
+    conn.execute(text(f"ALTER TABLE renewals_new RENAME TO {TABLE}"))
+    conn.execute(text(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({pk_cols})"))
+    conn.execute(
+        text(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_car_id_fkey "
+            "FOREIGN KEY (car_id) REFERENCES cars (id) ON DELETE CASCADE"
+        )
+    )
+    for ddl in index_defs:
+        conn.execute(text(ddl))
+    conn.execute(text(f"ANALYZE {TABLE}"))
+
+
+def convert(conn: Connection, strategy: str, *, hash_partitions: int = 16, years_ahead: int = 2) -> None:
+    """Rebuild renewals with the given layout ("none" turns it back into a plain table)."""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown partitioning strategy: {strategy!r} (expected one of {STRATEGIES})")
+    if strategy == current_strategy(conn):
+        return
+
+    if strategy == "none":
+        _rebuild(conn, partition_clause="", pk_cols="id", children=[])
+    elif strategy == "range":
+        first = conn.execute(text(f"SELECT min(valid_to) FROM {TABLE}")).scalar_one_or_none() or date.today()
+        last = date.today().year + years_ahead
+        children = [_year_partition_ddl(y, "renewals_new") for y in range(first.year, last + 1)]
+        children.append(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF renewals_new DEFAULT")
+        _rebuild(conn, partition_clause="PARTITION BY RANGE (valid_to)", pk_cols="id, valid_to", children=children)
+    else:
+        children = [
+            f"CREATE TABLE renewals_h{i:02d} PARTITION OF renewals_new "
+            f"FOR VALUES WITH (MODULUS {hash_partitions}, REMAINDER {i})"
+            for i in range(hash_partitions)
+        ]
+        _rebuild(conn, partition_clause="PARTITION BY HASH (car_id)", pk_cols="id, car_id", children=children)
+
+
+def ensure_future_partitions(conn: Connection, *, years_ahead: int = 2, today: date | None = None) -> list[str]:
+    """Create yearly partitions up to `years_ahead` years out (range layout only).
+
+    Rows that already landed in the DEFAULT partition for a new year are moved
+    into it. Returns the names of the partitions created.
+    """
+    if current_strategy(conn) != "range":
+        return []
+    existing = set(partitions(conn))
+    created: list[str] = []
+    this_year = (today or date.today()).year
+    for year in range(this_year, this_year + years_ahead + 1):
+        name = f"renewals_y{year}"
+        if name in existing:
+            continue
+        lo, hi = f"{year}-01-01", f"{year + 1}-01-01"
+        # Attaching validates that DEFAULT holds no rows for the new range, so
+        # move any that are there into a standalone table first.
+        conn.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        if DEFAULT_PARTITION in existing:
+            conn.execute(
+                text(
+                    f"""
+                    WITH moved AS (
+                        DELETE FROM {DEFAULT_PARTITION}
+                        WHERE valid_to >= DATE '{lo}' AND valid_to < DATE '{hi}'
+                        RETURNING *
+                    )
+                    INSERT INTO {name} SELECT * FROM moved
+                    """
+                )
+            )
+        conn.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lo}') TO ('{hi}')"))
+        created.append(name)
+    return created
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.partitioning")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status")
+    ensure = sub.add_parser("ensure")
+    ensure.add_argument("--years-ahead", type=int, default=2)
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = create_engine(Settings.from_env().database_url)
+    with engine.begin() as conn:
+        if args.cmd == "status":
+            print(f"strategy: {current_strategy(conn)}")
+            for name in partitions(conn):
+                print(f"  {name}")
+        else:
+            created = ensure_future_partitions(conn, years_ahead=args.years_ahead)
+            print("created:", ", ".join(created) or "nothing to do")
+
+
+if __name__ == "__main__":
+    main()
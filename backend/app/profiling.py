@@ -0,0 +1,306 @@
+"""Sampling profiler: continuous per worker, and on demand per request.
+
+A sampler thread periodically snapshots every thread's Python stack
+(sys._current_frames) and counts them as folded stacks, one "a;b;c N" line
+per distinct stack. That is the input format of flamegraph.pl, speedscope
+and inferno. Idle threads (thread-pool workers waiting for work, the event
+loop waiting in select) are skipped, so the counts show where busy time
+goes, including time blocked on the database.
+
+The continuous sampler runs every PROFILER_INTERVAL_MS for the life of the
+worker and is read at GET /admin/profiler. It times its own CPU use, so
+the overhead it adds is reported next to the stacks.
+
+A profiled request (X-Profile: 1 plus the admin token, or a random
+PROFILE_REQUEST_RATE fraction of requests) gets its own 1 ms sampler for
+its duration. The profile is kept in a small in-memory store
+(GET /admin/profiles/{id}) and its id is returned in X-Profile-Id. Samples
+come from every busy thread in the worker, so concurrent requests can show
+up too; each profile records how many requests were in flight. One request
+is profiled at a time per worker; others asking meanwhile are served
+unprofiled (profiler.requests.skipped). Long-lived streams
+(admission.UNLIMITED_PATHS) are never profiled: their sampler would run for
+as long as the client stays connected.
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from types import CodeType, FrameType
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.admission import UNLIMITED_PATHS
+from app.config import Settings
+from app.metrics import metrics
+from app.security import is_admin_token
+
+MAX_DEPTH = 128
+# Distinct stacks kept by one sampler; later new ones are counted as TRUNCATED.
+MAX_STACKS = 5_000
+TRUNCATED = "[truncated]"
+REQUEST_INTERVAL_SECONDS = 0.001
+# Our own background threads (event listener, samplers) are never sampled.
+EXCLUDED_THREAD_PREFIX = "cartrack-"
+
+# A thread whose stack, below any waiting in these modules, is one of these
+# loops is idle: a pool worker waiting for work, or the event loop in select().
+_WAIT_MODULES = frozenset({"threading.py", "queue.py", "selectors.py"})
+_IDLE_LOOPS = frozenset(
+    {
+        ("thread.py", "_worker"),  # concurrent.futures
+        ("_asyncio.py", "run"),  # anyio WorkerThread
+        ("base_events.py", "_run_once"),  # asyncio
+    }
+)
+
+_labels: dict[CodeType, str] = {}
+
+
+def _short_path(path: str) -> str:
+    for marker in ("site-packages" + os.sep, "backend" + os.sep, "lib" + os.sep + "python"):
+        i = path.rfind(marker)
+        if i >= 0:
+            return path[i + len(marker) :]
+    return os.path.basename(path)
+
+
+def _label(code: CodeType) -> str:
+    label = _labels.get(code)
+    if label is None:
+        name = getattr(code, "co_qualname", code.co_name)
+        label = f"{name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+        if len(_labels) < 50_000:
+            _labels[code] = label
+    return label
+
+
+def collapse(frame: FrameType | None) -> str | None:
+    """The folded stack (root first) for a thread's top frame, or None if the thread is idle."""
+    codes: list[CodeType] = []
+    while frame is not None and len(codes) < MAX_DEPTH:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    for code in codes:  # leaf first
+        filename = os.path.basename(code.co_filename)
+        if filename in _WAIT_MODULES:
+            continue
+        if (filename, code.co_name) in _IDLE_LOOPS:
+            return None
+        break
+    return ";".join(_label(code) for code in reversed(codes))
+
+
+class Sampler:
+    """Counts the stacks of busy threads every `interval` seconds on a background thread."""
+
+    def __init__(self, interval: float, *, name: str = "cartrack-profiler") -> None:
+        self.interval = interval
+        self.name = name
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.cpu_seconds = 0.0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._excluded: set[int] = set()
+
+    def start(self) -> Sampler:
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            t0 = time.thread_time()
+            self.sample()
+            self.cpu_seconds += time.thread_time() - t0
+
+    def sample(self) -> None:
+        if self.samples % 100 == 0:
+            self._excluded = {
+                t.ident for t in threading.enumerate() if t.name.startswith(EXCLUDED_THREAD_PREFIX) and t.ident
+            }
+        me = threading.get_ident()
+        stacks = [
+            collapse(frame)
+            for ident, frame in sys._current_frames().items()
+            if ident != me and ident not in self._excluded
+        ]
+        with self._lock:
+            self.samples += 1
+            for stack in stacks:
+                if stack is None:
+                    continue
+                if stack in self.stacks or len(self.stacks) < MAX_STACKS:
+                    self.stacks[stack] += 1
+                else:
+                    self.stacks[TRUNCATED] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.cpu_seconds = 0.0
+            self.started_at = time.monotonic()
+
+    def top(self, n: int | None = None) -> list[tuple[str, int]]:
+        with self._lock:
+            return self.stacks.most_common(n)
+
+    def folded(self, n: int | None = None) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.top(n))
+
+    def overhead(self) -> float:
+        """The sampler's CPU time as a fraction of wall time since (re)start."""
+        wall = time.monotonic() - self.started_at
+        return self.cpu_seconds / wall if wall > 0 else 0.0
+
+
+# -------------------------
+# Continuous profiler (one per worker)
+# -------------------------
+
+_profilers: dict[float, Sampler] = {}
+_profilers_lock = threading.Lock()
+
+
+def get_profiler(settings: Settings) -> Sampler | None:
+    """The worker's continuous sampler (started on first use), or None if disabled."""
+    if settings.profiler_interval_ms <= 0:
+        return None
+    key = settings.profiler_interval_ms
+    sampler = _profilers.get(key)
+    if sampler is None:
+        with _profilers_lock:
+            sampler = _profilers.get(key)
+            if sampler is None:
+                sampler = _profilers[key] = Sampler(key / 1000).start()
+    return sampler
+
+
+# -------------------------
+# Per-request profiles
+# -------------------------
+
+
+@dataclass
+class RequestProfile:
+    id: str
+    method: str
+    path: str
+    started_at: datetime
+    in_flight: int
+    status: int | None = None
+    duration_ms: float = 0.0
+    samples: int = 0
+    stacks: list[tuple[str, int]] = field(default_factory=list)
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks)
+
+
+class ProfileStore:
+    """The most recent request profiles of this worker."""
+
+    def __init__(self, maxlen: int = 50) -> None:
+        self._lock = threading.Lock()
+        self._profiles: deque[RequestProfile] = deque(maxlen=maxlen)
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+
+    def get(self, profile_id: str) -> RequestProfile | None:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+    def list(self) -> list[RequestProfile]:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+
+profiles = ProfileStore()
+_ids = itertools.count(1)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware: sample a request's stacks when asked to (see module docstring)."""
+
+    def __init__(self, app: ASGIApp, *, settings: Settings) -> None:
+        self.app = app
+        self.settings = settings
+        self.in_flight = 0
+        # Held while a request is profiled; never waited for.
+        self._sampling = threading.Lock()
+
+    def _wanted(self, scope: Scope) -> bool:
+        if scope["path"].startswith(UNLIMITED_PATHS):
+            return False
+        headers = Headers(scope=scope)
+        if headers.get("x-profile") and is_admin_token(self.settings, headers.get("x-admin-token")):
+            return True
+        rate = self.settings.profile_request_rate
+        return rate > 0 and scope["path"].startswith("/api/") and random.random() < rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.in_flight += 1
+        try:
+            if not self._wanted(scope):
+                await self.app(scope, receive, send)
+                return
+            if not self._sampling.acquire(blocking=False):
+                metrics.inc("profiler.requests.skipped")
+                await self.app(scope, receive, send)
+                return
+            try:
+                await self._profiled(scope, receive, send)
+            finally:
+                self._sampling.release()
+        finally:
+            self.in_flight -= 1
+
+    async def _profiled(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profile = RequestProfile(
+            id=f"{os.getpid()}-{next(_ids)}",
+            method=scope["method"],
+            path=scope["path"],
+            started_at=datetime.now(UTC),
+            in_flight=self.in_flight,
+        )
+
+        async def on_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                MutableHeaders(raw=message["headers"])["x-profile-id"] = profile.id
+            await send(message)
+
+        sampler = Sampler(REQUEST_INTERVAL_SECONDS, name=f"cartrack-profile-{profile.id}").start()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, on_send)
+        finally:
+            sampler.stop()
+            profile.duration_ms = (time.perf_counter() - t0) * 1000
+            profile.samples = sampler.samples
+            profile.stacks = sampler.top()
+            profiles.add(profile)
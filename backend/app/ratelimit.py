@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Protocol
+
+from fastapi import HTTPException, Request, status
+
+from app.config import Settings
+from app.metrics import metrics
+from app.redis_store import redis_client
+
+
+class BucketStore(Protocol):
+    def take(self, key: str, *, capacity: int, refill_per_sec: float) -> float:
+        """Take one token from `key`. Returns 0 if allowed, else seconds until a token is free."""
+        ...
+
+
+class InMemoryBucketStore:
+    """Token buckets for a single worker. O(1) per check, bounded key count (LRU)."""
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self._lock = threading.Lock()
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # key -> (tokens, ts)
+        self._max_keys = max_keys
+
+    def take(self, key: str, *, capacity: int, refill_per_sec: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.pop(key, (float(capacity), now))
+            tokens = min(float(capacity), tokens + (now - ts) * refill_per_sec)
+            retry_after = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / refill_per_sec
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self._max_keys:
+                # The oldest-touched bucket has refilled the longest; dropping it
+                # only forgets a nearly full bucket.
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+# Atomic refill + take. Uses the Redis server clock so all workers agree.
+_TAKE_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or capacity
+local ts = tonumber(b[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local retry = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(retry)
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker through Redis (one round trip per check)."""
+
+    def __init__(self, url: str, *, prefix: str = "cartrack:rl:") -> None:
+        self._take = redis_client(url).register_script(_TAKE_LUA)
+        self._prefix = prefix
+
+    def take(self, key: str, *, capacity: int, refill_per_sec: float) -> float:
+        return float(self._take(keys=[self._prefix + key], args=[capacity, refill_per_sec]))
+
+
+class LoginRateLimiter:
+    """Per-IP and per-email throttling for the password endpoints.
+
+    Runs before the user lookup and bcrypt check, so rejected attempts cost
+    one bucket check instead of a hash.
+    """
+
+    def __init__(self, store: BucketStore, *, per_ip: int, per_email: int) -> None:
+        self.store = store
+        self.per_ip = per_ip
+        self.per_email = per_email
+
+    def _take(self, scope: str, key: str, per_minute: int) -> None:
+        if per_minute <= 0:
+            return
+        try:
+            retry_after = self.store.take(f"{scope}:{key}", capacity=per_minute, refill_per_sec=per_minute / 60)
+        except Exception:
+            # A broken shared store must not lock everyone out; fail open and count it.
+            metrics.inc("auth.rate_limit.store_errors")
+            return
+        if retry_after > 0:
+            metrics.inc(f"auth.rate_limited.{scope}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts. Try again later.",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    def check(self, *, ip: str, email: str) -> None:
+        metrics.inc("auth.rate_limit.checks")
+        self._take("ip", ip, self.per_ip)
+        self._take("email", email.lower(), self.per_email)
+
+
+_limiters: dict[tuple, LoginRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_login_limiter(settings: Settings) -> LoginRateLimiter:
+    """One limiter (and store) per distinct configuration, shared across requests."""
+    key = (settings.redis_url, settings.login_rate_per_ip, settings.login_rate_per_email)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                store = RedisBucketStore(settings.redis_url) if settings.redis_url else InMemoryBucketStore()
+                limiter = LoginRateLimiter(
+                    store,
+                    per_ip=settings.login_rate_per_ip,
+                    per_email=settings.login_rate_per_email,
+                )
+                _limiters[key] = limiter
+    return limiter
+
+
+def reset_login_limiters() -> None:
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def check_login_rate(request: Request, settings: Settings, email: str) -> None:
+    ip = request.client.host if request.client else "unknown"
+    get_login_limiter(settings).check(ip=ip, email=email)
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import threading
+
+_clients: dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def redis_client(url: str):
+    """Shared redis.Redis client per URL (the client pools its own connections).
+
+    redis is an optional dependency ("redis" extra); it is only imported
+    when REDIS_URL is configured.
+    """
+    client = _clients.get(url)
+    if client is None:
+        try:
+            import redis
+        except ImportError as err:  # pragma: no cover - depends on the install
+            raise RuntimeError("REDIS_URL is set but the 'redis' package is not installed") from err
+        with _lock:
+            client = _clients.get(url)
+            if client is None:
+                client = _clients[url] = redis.Redis.from_url(url, socket_timeout=0.25)
+    return client
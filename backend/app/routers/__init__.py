@@ -1,3 +1,18 @@
-from app.routers import auth, cars, households, renewals, settings
+from app.routers import (
+    admin,
+    attachments,
+    audit,
+    auth,
+    calendar,
+    cars,
+    compliance,
+    events,
+    forecast,
+    households,
+    renewals,
+    search,
+    settings,
+    vehicles,
+)
 
-__all__ = ["auth", "cars", "households", "renewals", "settings"]
+__all__ = ["admin", "attachments", "audit", "auth", "calendar", "cars", "compliance", "events", "forecast", "households", "renewals", "search", "settings", "vehicles"]
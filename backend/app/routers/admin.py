@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app.config import Settings
+from app.deps import get_settings, require_admin
+from app.profiling import get_profiler, profiles
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/profiler")
+def hot_stacks(
+    top: int = Query(100, ge=1, le=5000),
+    format: str = Query("folded", pattern="^(folded|json)$"),
+    reset: bool = False,
+    settings: Settings = Depends(get_settings),
+):
+    """This worker's hottest stacks since start (or the last reset).
+
+    `folded` is flamegraph.pl / speedscope input; `json` adds sample counts
+    and the sampler's own overhead.
+    """
+    sampler = get_profiler(settings)
+    if sampler is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiler disabled")
+    if format == "folded":
+        body = sampler.folded(top)
+    else:
+        total = sum(count for _, count in sampler.top()) or 1
+        body = {
+            "interval_ms": sampler.interval * 1000,
+            "samples": sampler.samples,
+            "cpu_seconds": round(sampler.cpu_seconds, 3),
+            "overhead_pct": round(sampler.overhead() * 100, 3),
+            "stacks": [
+                {"stack": stack, "count": count, "pct": round(count * 100 / total, 2)}
+                for stack, count in sampler.top(top)
+            ],
+        }
+    if reset:
+        sampler.reset()
+    return PlainTextResponse(body) if format == "folded" else body
+
+
+@router.get("/profiles")
+def list_profiles():
+    """Recent request profiles in this worker, newest first."""
+    return [
+        {
+            "id": p.id,
+            "method": p.method,
+            "path": p.path,
+            "status": p.status,
+            "started_at": p.started_at,
+            "duration_ms": round(p.duration_ms, 2),
+            "in_flight": p.in_flight,
+            "samples": p.samples,
+        }
+        for p in profiles.list()
+    ]
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: str):
+    """One request's stacks, folded."""
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return profile.folded()
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app import attachments, scoped
+from app.config import Settings
+from app.deps import get_db, get_settings, get_token_user_id
+from app.metrics import metrics
+from app.models import Attachment
+from app.schemas import AttachmentOut
+
+router = APIRouter(prefix="/api", tags=["attachments"])
+
+# Request body pieces are gathered up to this much before each write to the spool.
+_WRITE_BYTES = 1024 * 1024
+
+
+def _to_out(a: Attachment) -> AttachmentOut:
+    return AttachmentOut(
+        id=a.id,
+        renewal_id=a.renewal_id,
+        filename=a.filename,
+        content_type=a.content_type,
+        size=a.size,
+        sha256=a.sha256,
+        created_at=a.created_at,
+    )
+
+
+def _parse_uuid(value: str, *, not_found_detail: str) -> uuid.UUID:
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=not_found_detail) from None
+
+
+def _too_large(settings: Settings) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        detail=f"Attachments are limited to {settings.attachment_max_bytes} bytes",
+    )
+
+
+@router.get("/renewals/{renewal_id}/attachments", response_model=list[AttachmentOut])
+def list_attachments(
+    renewal_id: str,
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_token_user_id),
+):
+    rid = _parse_uuid(renewal_id, not_found_detail="Renewal not found")
+    found = attachments.list_for_renewal(db, user_id, rid)
+    if found is None:
+        raise scoped.not_found(db, user_id, "Renewal not found")
+    return [_to_out(a) for a in found]
+
+
+@router.post("/renewals/{renewal_id}/attachments", response_model=AttachmentOut, status_code=status.HTTP_201_CREATED)
+async def upload_attachment(
+    renewal_id: str,
+    request: Request,
+    filename: str = Query(min_length=1, max_length=255),
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_token_user_id),
+    settings: Settings = Depends(get_settings),
+):
+    """Attach the request body (the raw file, not a form) to a renewal.
+
+    The body streams to a temporary file as it arrives; Content-Type is kept
+    for downloads. A file already stored under the same SHA-256 is not stored again.
+    """
+    rid = _parse_uuid(renewal_id, not_found_detail="Renewal not found")
+    if not await run_in_threadpool(attachments.owns_renewal, db, user_id, rid):
+        raise await run_in_threadpool(scoped.not_found, db, user_id, "Renewal not found")
+    # Don't hold a pooled connection (and an open transaction) while the body trickles in.
+    await run_in_threadpool(db.rollback)
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > settings.attachment_max_bytes:
+        raise _too_large(settings)
+
+    store = attachments.get_blob_store(settings)
+    spool = await run_in_threadpool(store.spool)
+    try:
+        pending = bytearray()
+        async for chunk in request.stream():
+            if spool.size + len(pending) + len(chunk) > settings.attachment_max_bytes:
+                raise _too_large(settings)
+            pending += chunk
+            if len(pending) >= _WRITE_BYTES:
+                await run_in_threadpool(spool.write, bytes(pending))
+                pending.clear()
+        if pending:
+            await run_in_threadpool(spool.write, bytes(pending))
+        content_type = request.headers.get("content-type") or "application/octet-stream"
+        attachment = await run_in_threadpool(
+            attachments.save,
+            db,
+            store,
+            spool,
+            user_id=user_id,
+            renewal_id=rid,
+            filename=filename,
+            content_type=content_type.split(",")[0].strip()[:127],
+        )
+    finally:
+        await run_in_threadpool(spool.discard)
+    if attachment is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Renewal not found")
+    return _to_out(attachment)
+
+
+@router.get("/attachments/{attachment_id}")
+def download_attachment(
+    attachment_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_token_user_id),
+    settings: Settings = Depends(get_settings),
+):
+    """The file, streamed. Honours a single-range Range header (206), If-Range and If-None-Match."""
+    aid = _parse_uuid(attachment_id, not_found_detail="Attachment not found")
+    attachment = attachments.get(db, user_id, aid)
+    if attachment is None:
+        raise scoped.not_found(db, user_id, "Attachment not found")
+
+    etag = f'"{attachment.sha256}"'  # the content's hash: a strong validator
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=3600",
+        "Content-Disposition": attachments.content_disposition(attachment.filename),
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    size = attachment.size
+    if_range = request.headers.get("if-range")
+    try:
+        wanted = attachments.parse_range(request.headers.get("range"), size) if if_range in (None, etag) else None
+    except attachments.RangeNotSatisfiable:
+        return Response(
+            status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{size}"},
+        )
+
+    store = attachments.get_blob_store(settings)
+    if wanted is None:
+        body, code = store.read(attachment.sha256), status.HTTP_200_OK
+        headers["Content-Length"] = str(size)
+    else:
+        body, code = store.read(attachment.sha256, wanted.start, wanted.end), status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Length"] = str(wanted.end - wanted.start)
+        headers["Content-Range"] = wanted.content_range(size)
+        metrics.inc("attachments.range_requests")
+    metrics.inc("attachments.downloads")
+    return StreamingResponse(body, status_code=code, media_type=attachment.content_type, headers=headers)
+
+
+@router.delete("/attachments/{attachment_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_attachment(
+    attachment_id: str,
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_token_user_id),
+    settings: Settings = Depends(get_settings),
+):
+    """Detach the file; its content goes too unless it is also attached elsewhere."""
+    aid = _parse_uuid(attachment_id, not_found_detail="Attachment not found")
+    if not attachments.remove(db, attachments.get_blob_store(settings), user_id, aid):
+        raise scoped.not_found(db, user_id, "Attachment not found")
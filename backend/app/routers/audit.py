@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app import audit
+from app.deps import get_current_household_id, get_db
+from app.schemas import AuditEntryOut
+
+router = APIRouter(prefix="/api", tags=["audit"])
+
+
+@router.get("/audit", response_model=list[AuditEntryOut])
+def audit_log(
+    entity_id: uuid.UUID | None = None,
+    before: datetime | None = None,
+    before_id: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    household_id: uuid.UUID = Depends(get_current_household_id),
+):
+    """Changes to the household's cars and renewals, newest first.
+
+    Filter to one car or renewal with `entity_id`; page with `before` and
+    `before_id` (the `at` and `id` of the last entry seen). Entries appear
+    once flushed from the outbox, normally within a second of the change.
+    """
+    rows = audit.history(db, household_id, entity_id=entity_id, before=before, before_id=before_id, limit=limit)
+    return [
+        AuditEntryOut(
+            id=r.id,
+            at=r.at,
+            entity=r.entity,
+            entity_id=r.entity_id,
+            op=r.op,
+            actor_id=r.actor_id,
+            changes=r.changes,
+        )
+        for r in rows
+    ]
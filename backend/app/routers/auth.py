@@ -1,13 +1,14 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-
 from sqlalchemy.orm import Session
 
 from app.config import Settings
+from app.db import note_principal
 from app.deps import get_db, get_settings
 from app.models import User
+from app.ratelimit import check_login_rate
 from app.schemas import LoginRequest, SignupRequest, TokenResponse, UserOut
 from app.security import create_access_token, hash_password, verify_password
 
@@ -21,6 +22,8 @@ def signup(payload: SignupRequest, db: Session = Depends(get_db)):
 
     user = User(email=payload.email.lower(), password_hash=hash_password(payload.password))
     db.add(user)
+    db.flush()
+    note_principal(db, user_id=user.id)  # reads right after signup stay on the primary
     db.commit()
     db.refresh(user)
     return UserOut(id=user.id, email=user.email, created_at=user.created_at)
@@ -29,9 +32,11 @@ def signup(payload: SignupRequest, db: Session = Depends(get_db)):
 @router.post("/login", response_model=TokenResponse)
 def login(
     payload: LoginRequest,
+    request: Request,
     settings: Settings = Depends(get_settings),
     db: Session = Depends(get_db),
 ):
+    check_login_rate(request, settings, payload.email)
     user = db.query(User).filter(User.email == payload.email.lower()).first()
     if not user or not verify_password(payload.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
@@ -41,10 +46,12 @@ def login(
 
 @router.post("/token", response_model=TokenResponse)
 def token(
+    request: Request,
     form: OAuth2PasswordRequestForm = Depends(),
     settings: Settings = Depends(get_settings),
     db: Session = Depends(get_db),
 ):
+    check_login_rate(request, settings, form.username)
     # Swagger sends "username" but you’re using email as the username
     user = db.query(User).filter(User.email == form.username.lower()).first()
     if not user or not verify_password(form.password, user.password_hash):
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import uuid
+from datetime import UTC
+from email.utils import format_datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app import ical, scoped
+from app.config import Settings
+from app.db import note_principal
+from app.deps import get_current_household_id, get_db, get_settings, get_token_user_id
+from app.models import CalendarFeed, ReminderPreference
+from app.schemas import CalendarFeedOut, default_reminder_preferences
+
+router = APIRouter(prefix="/api/calendar", tags=["calendar"])
+
+
+@router.post("/token", response_model=CalendarFeedOut, status_code=status.HTTP_201_CREATED)
+def create_calendar_token(
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_token_user_id),
+    household_id: uuid.UUID = Depends(get_current_household_id),
+):
+    """A new feed URL for the caller. Any previous one stops working."""
+    token = ical.new_token()
+    stmt = insert(CalendarFeed).values(id=uuid.uuid4(), user_id=user_id, token_hash=ical.hash_token(token))
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[CalendarFeed.user_id],
+            set_={"token_hash": stmt.excluded.token_hash, "created_at": stmt.excluded.created_at},
+        )
+    )
+    db.commit()
+    return CalendarFeedOut(token=token, path=f"{router.prefix}/{token}.ics")
+
+
+@router.delete("/token", status_code=status.HTTP_204_NO_CONTENT)
+def revoke_calendar_token(db: Session = Depends(get_db), user_id: uuid.UUID = Depends(get_token_user_id)):
+    db.execute(delete(CalendarFeed).where(CalendarFeed.user_id == user_id))
+    db.commit()
+
+
+@router.get("/{token}.ics")
+def calendar_feed(
+    token: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    settings: Settings = Depends(get_settings),
+):
+    """The feed owner's renewal due dates as iCalendar, with their reminder offsets as alarms.
+
+    Supports If-None-Match / If-Modified-Since; clients that send them get a
+    304 unless the household changed since.
+    """
+    row = db.execute(
+        select(
+            scoped.household_of(CalendarFeed.user_id),
+            ReminderPreference.preferences_json,
+            ReminderPreference.updated_at,
+        )
+        .select_from(CalendarFeed)
+        .outerjoin(ReminderPreference, ReminderPreference.user_id == CalendarFeed.user_id)
+        .where(CalendarFeed.token_hash == ical.hash_token(token))
+    ).one_or_none()
+    if row is None or row[0] is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calendar not found")
+    household_id, preferences, preferences_updated = row
+    note_principal(db, household_id=household_id)
+
+    alarms = ical.alarms_from(preferences or default_reminder_preferences())
+    doc = ical.get_calendar_cache(settings).document(db, household_id, alarms, cache=ical.is_listening(settings))
+    last_modified = max((t for t in (doc.last_modified, preferences_updated) if t is not None), default=None)
+
+    headers = {"ETag": doc.etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(UTC), usegmt=True)
+    if ical.not_modified(
+        request.headers.get("if-none-match"),
+        request.headers.get("if-modified-since"),
+        etag=doc.etag,
+        last_modified=last_modified,
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return StreamingResponse(doc.stream(), media_type="text/calendar; charset=utf-8", headers=headers)
@@ -1,15 +1,16 @@
 from __future__ import annotations
 
 import uuid
-from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.deps import get_current_household, get_db
+from app import audit, compaction, scoped
+from app.deps import get_current_household_id, get_db, get_token_user_id
+from app.events import notify_change
 from app.models import Car
-from app.schemas import CarCreate, CarOut, CarUpdate
+from app.schemas import CarCreate, CarOut, CarUpdate, normalize_registration
 
 router = APIRouter(prefix="/api/cars", tags=["cars"])
 
@@ -27,19 +28,42 @@ def _to_out(c: Car) -> CarOut:
     )
 
 
-# Use of Depends here (it is part of fastapi). The get_current_household dependency will ensure that the user is authenticated and belongs to a household,
-# and will provide the household object to the route handlers. This allows us to easily scope all car operations to the current household
-# without having to manually check the user's permissions in each handler.
+def _parse_car_id(car_id: str) -> uuid.UUID:
+    try:
+        return uuid.UUID(car_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found") from None
+
+
+def _conflict() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Car already exists for household")
+
+
+def _update_owned_car(db: Session, user_id: uuid.UUID, cid: uuid.UUID, values: dict, *, op: str) -> Car:
+    """Ownership check, write, read-back and change notification in one statement."""
+    try:
+        car = scoped.update_car(db, user_id, cid, values, op=op)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise _conflict() from None
+    if car is None:
+        raise scoped.not_found(db, user_id, "Car not found")
+    return car
+
+
+# Handlers take the caller's user id straight from the token; the statements in
+# app.scoped check that the car belongs to the caller's household as they run,
+# so each handler is one round trip.
 @router.get("", response_model=list[CarOut])
 def list_cars(
     include_archived: bool = False,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
-    q = db.query(Car).filter(Car.household_id == household.id)
-    if not include_archived:
-        q = q.filter(Car.is_archived.is_(False))
-    cars = q.order_by(Car.created_at.desc()).all()
+    cars = scoped.list_cars(db, user_id, include_archived=include_archived)
+    if not cars:
+        scoped.check_member(db, user_id)  # no cars yet, or no household (409)
     return [_to_out(c) for c in cars]
 
 
@@ -47,24 +71,22 @@ def list_cars(
 def create_car(
     payload: CarCreate,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
-    car = Car(
-        household_id=household.id,
-        registration_number=payload.registration_number.upper().strip(),
-        make=payload.make,
-        model=payload.model,
-    )
-    db.add(car)
+    # INSERT ... RETURNING hands back the row as stored, so no refresh SELECT is needed.
+    values = {
+        "registration_number": normalize_registration(payload.registration_number),
+        "make": payload.make,
+        "model": payload.model,
+    }
     try:
+        car = scoped.insert_car(db, user_id, values)
         db.commit()
     except IntegrityError:
         db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Car already exists for household",
-        ) from None
-    db.refresh(car)
+        raise _conflict() from None
+    if car is None:
+        raise scoped.not_found(db, user_id, "Car not found")
     return _to_out(car)
 
 
@@ -72,16 +94,12 @@ def create_car(
 def get_car(
     car_id: str,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
-    try:
-        cid = uuid.UUID(car_id)
-    except ValueError:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found") from None
-
-    car = db.get(Car, cid)
-    if not car or car.household_id != household.id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found")
+    cid = _parse_car_id(car_id)
+    car = scoped.get_car(db, user_id, cid)
+    if car is None:
+        raise scoped.not_found(db, user_id, "Car not found")
     return _to_out(car)
 
 
@@ -90,70 +108,73 @@ def update_car(
     car_id: str,
     payload: CarUpdate,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
-    try:
-        cid = uuid.UUID(car_id)
-    except ValueError:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found") from None
-
-    car = db.get(Car, cid)
-    if not car or car.household_id != household.id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found")
+    cid = _parse_car_id(car_id)
 
+    values: dict = {}
     if payload.registration_number is not None:
-        car.registration_number = payload.registration_number.upper().strip()
+        values["registration_number"] = normalize_registration(payload.registration_number)
     if payload.make is not None:
-        car.make = payload.make
+        values["make"] = payload.make
     if payload.model is not None:
-        car.model = payload.model
+        values["model"] = payload.model
     if payload.is_archived is not None:
-        car.is_archived = payload.is_archived
+        values["is_archived"] = payload.is_archived
 
-    car.updated_at = datetime.utcnow()
-    db.add(car)
-    db.commit()
-    db.refresh(car)
-    return _to_out(car)
+    return _to_out(_update_owned_car(db, user_id, cid, values, op="update"))
 
 
 @router.post("/{car_id}/archive", response_model=CarOut)
 def archive_car(
     car_id: str,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
-    try:
-        cid = uuid.UUID(car_id)
-    except ValueError:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found") from None
-
-    car = db.get(Car, cid)
-    if not car or car.household_id != household.id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found")
-    car.is_archived = True
-    car.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(car)
-    return _to_out(car)
+    cid = _parse_car_id(car_id)
+    return _to_out(_update_owned_car(db, user_id, cid, {"is_archived": True}, op="archive"))
 
 
 @router.post("/{car_id}/unarchive", response_model=CarOut)
 def unarchive_car(
     car_id: str,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
-    try:
-        cid = uuid.UUID(car_id)
-    except ValueError:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found") from None
+    cid = _parse_car_id(car_id)
+    return _to_out(_update_owned_car(db, user_id, cid, {"is_archived": False}, op="unarchive"))
+
 
-    car = db.get(Car, cid)
-    if not car or car.household_id != household.id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found")
-    car.is_archived = False
-    car.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(car)
+@router.post("/{car_id}/restore", response_model=CarOut)
+def restore_car(
+    car_id: str,
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_token_user_id),
+    household_id: uuid.UUID = Depends(get_current_household_id),
+):
+    """Bring a compacted car (and its renewals) back from cold storage; it stays archived."""
+    cid = _parse_car_id(car_id)
+    try:
+        car = compaction.restore_car(db, household_id, cid)
+        if car is not None:
+            notify_change(db, household_id, "car", cid, "restore")
+            audit.record(
+                db,
+                entity="car",
+                entity_id=cid,
+                household_id=household_id,
+                actor_id=user_id,
+                op="restore",
+                before={"in_cold_storage": True},
+                after={"in_cold_storage": False},
+            )
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise _conflict() from None
+    if car is None:
+        # Not in cold storage: fine if it is already back (idempotent), else 404.
+        car = db.get(Car, cid)
+        if not car or car.household_id != household_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found")
     return _to_out(car)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import uuid
+from datetime import date, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from app import compliance
+from app.deps import get_current_household_id, get_db
+from app.schemas import ComplianceCountsOut, ComplianceItemOut, ComplianceOut
+
+router = APIRouter(prefix="/api/compliance", tags=["compliance"])
+
+MAX_SERIES_DAYS = 1_000
+
+
+@router.get("", response_model=ComplianceOut)
+def compliance_on(
+    on: date | None = None,
+    db: Session = Depends(get_db),
+    household_id: uuid.UUID = Depends(get_current_household_id),
+):
+    """Every car's insurance, MOT and tax status on `on` (default today), with totals.
+
+    covered: a live renewal spans the day; lapsed: only earlier ones; missing: none yet.
+    Cars added after `on` are left out. Archived cars are included (flagged):
+    they may still have been in use then. Rows moved to cold storage by
+    compaction are not consulted, so dates that far back can undercount.
+    """
+    on = on or date.today()
+    statuses = compliance.status_on(db, household_id, on)
+    return ComplianceOut(
+        on=on,
+        items=[ComplianceItemOut(**vars(s)) for s in statuses],
+        totals=[ComplianceCountsOut(**vars(c)) for c in compliance.counts_of(statuses, on)],
+    )
+
+
+@router.get("/series", response_model=list[ComplianceCountsOut])
+def compliance_series(
+    start: date,
+    end: date,
+    every: int = Query(1, ge=1, le=366, description="Days between samples"),
+    db: Session = Depends(get_db),
+    household_id: uuid.UUID = Depends(get_current_household_id),
+):
+    """Per-kind covered/lapsed/missing counts on every `every`-th day from `start` to `end`.
+
+    Each day counts the cars added by then, as GET /api/compliance does.
+    """
+    if end < start:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="end is before start")
+    n = (end - start).days // every + 1
+    if n > MAX_SERIES_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"At most {MAX_SERIES_DAYS} days per series; use a larger `every`",
+        )
+    days = [start + timedelta(days=every * i) for i in range(n)]
+    return [ComplianceCountsOut(**vars(c)) for c in compliance.counts_over(db, household_id, days)]
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import uuid
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.config import Settings
+from app.db import get_router
+from app.deps import get_settings, get_token_claims, household_id_for, token_subject
+from app.events import EventHub, format_sse, get_event_hub
+
+router = APIRouter(prefix="/api", tags=["events"])
+
+
+def _lookup_household(settings: Settings, user_id: uuid.UUID) -> uuid.UUID:
+    # A short-lived session: a stream must not hold a pooled connection open.
+    db = get_router(settings).session(read_only=True)
+    try:
+        return household_id_for(db, user_id)
+    finally:
+        db.close()
+
+
+async def _until_listening(hub: EventHub, timeout: float) -> bool:
+    """Wait, without holding a thread, for the hub's LISTEN connections to be up."""
+    deadline = time.monotonic() + timeout
+    while not hub.listening.is_set():
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(0.02)
+    return True
+
+
+@router.get("/events")
+async def household_events(
+    claims: dict = Depends(get_token_claims),
+    settings: Settings = Depends(get_settings),
+):
+    """Server-sent events for changes to the caller's household.
+
+    `change` events carry {"entity": "car"|"renewal", "id", "op"}; `resync`
+    means events were dropped and the client should refetch.
+
+    The `connected` comment is sent once the hub is listening, so changes
+    made after it are delivered. If the listener takes longer than a
+    heartbeat to come up, the stream starts anyway and sends a `resync`
+    when it does.
+    """
+    household_id = await run_in_threadpool(_lookup_household, settings, token_subject(claims))
+    hub = get_event_hub(settings)
+
+    async def stream():
+        sub = hub.subscribe(household_id, maxlen=settings.events_buffer_size)
+        try:
+            missed = not await _until_listening(hub, settings.events_heartbeat_seconds)
+            yield b"retry: 5000\n: connected\n\n"
+            while True:
+                batch = await sub.next_batch(settings.events_heartbeat_seconds)
+                if missed and hub.listening.is_set():
+                    missed = False
+                    batch = [("resync", {}), *(b for b in batch if b[0] != "resync")]
+                if not batch:
+                    yield b": ping\n\n"  # keeps proxies from closing an idle stream
+                for name, data in batch:
+                    yield format_sse(name, data)
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import uuid
+from datetime import date
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.config import Settings
+from app.deps import get_current_household_id, get_db, get_settings
+from app.events import get_event_hub
+from app.schemas import ForecastOut
+
+router = APIRouter(prefix="/api/forecast", tags=["forecast"])
+
+
+@router.get("", response_model=ForecastOut)
+def cost_forecast(
+    months: int = Query(12, ge=1, le=36),
+    as_of: date | None = Query(None, description="Forecast from this date instead of today"),
+    db: Session = Depends(get_db),
+    household_id: uuid.UUID = Depends(get_current_household_id),
+    settings: Settings = Depends(get_settings),
+):
+    """Renewals each active car is projected to need in the next `months`, with estimated costs.
+
+    Due dates follow each car's renewal cadence per kind; estimates are its mean
+    recent cost, else the household's median for the kind (see app/forecast.py).
+    Totals are in pence and leave out unpriced renewals (counted in `unpriced`).
+    """
+    from app.forecast import get_forecast_cache  # NumPy: imported on first use, not at startup
+
+    cache = get_forecast_cache(settings)
+    today = as_of or date.today()
+    # Cached forecasts are only trusted while change notifications are arriving.
+    listening = get_event_hub(settings).listening.is_set()
+    return cache.forecast(db, household_id, today=today, months=months, cache=listening)
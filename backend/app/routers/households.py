@@ -26,6 +26,10 @@ def create_household(payload: HouseholdCreate, db: Session = Depends(get_db), us
 
     member = HouseholdMember(household_id=household.id, user_id=user.id, role="admin")
     db.add(member)
+    shards = db.info.get("shards")
+    if shards is not None:
+        # Placed in the membership's transaction, so the household is never reachable unplaced.
+        shards.place(db, household.id)
     db.commit()
 
     return HouseholdOut(id=household.id, name=household.name, created_at=household.created_at)
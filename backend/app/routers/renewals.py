@@ -1,13 +1,18 @@
 from __future__ import annotations
 
 import uuid
-from datetime import date, datetime
+from datetime import date
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from pydantic import TypeAdapter
+from sqlalchemy import bindparam, func, select
 from sqlalchemy.orm import Session
 
-from app.deps import get_current_household, get_db
+from app import audit, compaction, scoped
+from app.config import Settings
+from app.deps import get_current_household_id, get_db, get_settings, get_token_user_id
 from app.enums import RenewalKind
+from app.events import notify_change
 from app.models import Car, RenewalRecord
 from app.schemas import (
     RenewalCreate,
@@ -15,9 +20,12 @@ from app.schemas import (
     RenewalUpdate,
     UpcomingRenewalOut,
 )
+from app.singleflight import get_singleflight
 
 router = APIRouter(prefix="/api", tags=["renewals"])
 
+_upcoming_list = TypeAdapter(list[UpcomingRenewalOut])
+
 
 def _to_out(r: RenewalRecord) -> RenewalOut:
     return RenewalOut(
@@ -43,26 +51,19 @@ def _parse_uuid(value: str, *, not_found_detail: str):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=not_found_detail) from None
 
 
+# As in cars.py, handlers take the user id from the token and the app.scoped
+# statements check ownership as they run: one round trip per handler.
 @router.get("/cars/{car_id}/renewals", response_model=list[RenewalOut])
 def list_renewals(
     car_id: str,
     kind: RenewalKind | None = None,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
     cid = _parse_uuid(car_id, not_found_detail="Car not found")
-    car = db.get(Car, cid)
-    if not car or car.household_id != household.id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found")
-
-    q = db.query(RenewalRecord).filter(
-        RenewalRecord.car_id == cid,
-        RenewalRecord.is_deleted.is_(False),
-    )
-    if kind is not None:
-        q = q.filter(RenewalRecord.kind == kind)
-
-    rows = q.order_by(RenewalRecord.valid_to.desc()).all()
+    rows = scoped.list_renewals(db, user_id, cid, kind=kind)
+    if rows is None:
+        raise scoped.not_found(db, user_id, "Car not found")
     return [_to_out(r) for r in rows]
 
 
@@ -71,26 +72,13 @@ def create_renewal(
     car_id: str,
     payload: RenewalCreate,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
     cid = _parse_uuid(car_id, not_found_detail="Car not found")
-    car = db.get(Car, cid)
-    if not car or car.household_id != household.id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Car not found")
-
-    r = RenewalRecord(
-        car_id=cid,
-        kind=payload.kind,
-        valid_from=payload.valid_from,
-        valid_to=payload.valid_to,
-        provider=payload.provider,
-        reference=payload.reference,
-        cost_pence=payload.cost_pence,
-        notes=payload.notes,
-    )
-    db.add(r)
+    r = scoped.insert_renewal(db, user_id, cid, payload.model_dump())
+    if r is None:
+        raise scoped.not_found(db, user_id, "Car not found")
     db.commit()
-    db.refresh(r)
     return _to_out(r)
 
 
@@ -99,33 +87,28 @@ def update_renewal(
     renewal_id: str,
     payload: RenewalUpdate,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
     rid = _parse_uuid(renewal_id, not_found_detail="Renewal not found")
-    r = db.get(RenewalRecord, rid)
-    if not r or r.is_deleted:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Renewal not found")
-
-    car = db.get(Car, r.car_id)
-    if not car or car.household_id != household.id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Renewal not found")
 
+    values: dict = {}
     if payload.valid_from is not None:
-        r.valid_from = payload.valid_from
+        values["valid_from"] = payload.valid_from
     if payload.valid_to is not None:
-        r.valid_to = payload.valid_to
+        values["valid_to"] = payload.valid_to
     if payload.provider is not None:
-        r.provider = payload.provider
+        values["provider"] = payload.provider
     if payload.reference is not None:
-        r.reference = payload.reference
+        values["reference"] = payload.reference
     if payload.cost_pence is not None:
-        r.cost_pence = payload.cost_pence
+        values["cost_pence"] = payload.cost_pence
     if payload.notes is not None:
-        r.notes = payload.notes
+        values["notes"] = payload.notes
 
-    r.updated_at = datetime.utcnow()
+    r = scoped.update_renewal(db, user_id, rid, values, op="update")
+    if r is None:
+        raise scoped.not_found(db, user_id, "Renewal not found")
     db.commit()
-    db.refresh(r)
     return _to_out(r)
 
 
@@ -133,73 +116,127 @@ def update_renewal(
 def delete_renewal(
     renewal_id: str,
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    user_id: uuid.UUID = Depends(get_token_user_id),
 ):
     rid = _parse_uuid(renewal_id, not_found_detail="Renewal not found")
-    r = db.get(RenewalRecord, rid)
-    if not r or r.is_deleted:
+    if scoped.update_renewal(db, user_id, rid, {"is_deleted": True}, op="delete") is not None:
+        db.commit()
         return
 
-    car = db.get(Car, r.car_id)
-    if not car or car.household_id != household.id:
+    # Nothing updated: already gone (idempotent 204) or someone else's renewal (404).
+    scoped.check_member(db, user_id)
+    r = db.get(RenewalRecord, rid)
+    if r and not r.is_deleted:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Renewal not found")
+    return
 
-    r.is_deleted = True
-    r.updated_at = datetime.utcnow()
+
+@router.post("/renewals/{renewal_id}/restore", response_model=RenewalOut)
+def restore_renewal(
+    renewal_id: str,
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_token_user_id),
+    household_id: uuid.UUID = Depends(get_current_household_id),
+):
+    """Undelete a renewal, bringing it back from cold storage if it was compacted."""
+    rid = _parse_uuid(renewal_id, not_found_detail="Renewal not found")
+    r = compaction.restore_renewal(db, household_id, rid)
+    if r is not None:
+        notify_change(db, household_id, "renewal", rid, "restore")
+        audit.record(
+            db,
+            entity="renewal",
+            entity_id=rid,
+            household_id=household_id,
+            actor_id=user_id,
+            op="restore",
+            before={"is_deleted": True, "in_cold_storage": True},
+            after={"is_deleted": False, "in_cold_storage": False},
+        )
+    else:
+        r = scoped.update_renewal(db, user_id, rid, {"is_deleted": False}, op="restore", live_only=False)
+    if r is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Renewal not found")
     db.commit()
-    return
+    return _to_out(r)
 
 
 @router.get("/renewals/upcoming", response_model=list[UpcomingRenewalOut])
 def upcoming_renewals(
     days: int = Query(60, ge=1, le=365),
+    as_of: date | None = Query(None, description="Evaluate as of this date instead of today"),
     db: Session = Depends(get_db),
-    household=Depends(get_current_household),
+    household_id: uuid.UUID = Depends(get_current_household_id),
+    settings: Settings = Depends(get_settings),
 ):
-    """Return items that are missing, overdue, or due within the next N days."""
+    """Return items that are missing, overdue, or due within N days of today (or `as_of`)."""
+
+    today = as_of or date.today()
+    # Members opening the dashboard together (or a retrying client) share one computation.
+    return get_singleflight(settings, "upcoming").do(
+        f"{household_id}:{days}:{today.isoformat()}",
+        lambda: _compute_upcoming(db, household_id, days=days, today=today),
+        dumps=_upcoming_list.dump_json,
+        loads=_upcoming_list.validate_json,
+    )
 
-    today = date.today()
 
-    cars = (
-        db.query(Car)
-        .filter(Car.household_id == household.id)
-        .filter(Car.is_archived.is_(False))
-        .order_by(Car.created_at.desc())
-        .all()
+# The dashboard's three statements, built once with bound parameters (see
+# app.scoped); car_ids expands to one placeholder per car when executed.
+_live_cars_of_household = (
+    select(Car)
+    .where(Car.household_id == bindparam("household_id"), Car.is_archived.is_(False))
+    .order_by(Car.created_at.desc())
+)
+# Current cover per (car, kind). The valid_to >= today bound also lets a
+# range-partitioned renewals table skip past years.
+_current_cover = (
+    select(RenewalRecord.car_id, RenewalRecord.kind, func.max(RenewalRecord.valid_to))
+    .where(
+        RenewalRecord.car_id.in_(bindparam("car_ids", expanding=True)),
+        RenewalRecord.is_deleted.is_(False),
+        RenewalRecord.valid_to >= bindparam("today"),
+        RenewalRecord.valid_from <= bindparam("today"),
     )
+    .group_by(RenewalRecord.car_id, RenewalRecord.kind)
+)
+_lapsed_cover = (
+    select(RenewalRecord.car_id, RenewalRecord.kind, func.max(RenewalRecord.valid_to))
+    .where(
+        RenewalRecord.car_id.in_(bindparam("car_ids", expanding=True)),
+        RenewalRecord.is_deleted.is_(False),
+        RenewalRecord.valid_to < bindparam("today"),
+    )
+    .group_by(RenewalRecord.car_id, RenewalRecord.kind)
+)
 
-    out: list[UpcomingRenewalOut] = []
 
-    for car in cars:
-        # load renewals for car in one query per car (fine for Phase 2 scale)
-        rows = (
-            db.query(RenewalRecord)
-            .filter(RenewalRecord.car_id == car.id)
-            .filter(RenewalRecord.is_deleted.is_(False))
-            .order_by(RenewalRecord.valid_from.asc())
-            .all()
-        )
+def _compute_upcoming(db: Session, household_id: uuid.UUID, *, days: int, today: date) -> list[UpcomingRenewalOut]:
+    cars = list(db.scalars(_live_cars_of_household, {"household_id": household_id}))
+
+    car_ids = [car.id for car in cars]
 
-        by_kind: dict[RenewalKind, list[RenewalRecord]] = {k: [] for k in RenewalKind}
-        for r in rows:
-            by_kind[r.kind].append(r)
+    current_to: dict[tuple[uuid.UUID, RenewalKind], date] = {}
+    if car_ids:
+        rows = db.execute(_current_cover, {"car_ids": car_ids, "today": today})
+        current_to = {(car_id, kind): valid_to for car_id, kind, valid_to in rows}
 
+    # Most recent lapsed cover, only for cars with a kind that has nothing current.
+    lacking = [cid for cid in car_ids if any((cid, k) not in current_to for k in RenewalKind)]
+    past_to: dict[tuple[uuid.UUID, RenewalKind], date] = {}
+    if lacking:
+        rows = db.execute(_lapsed_cover, {"car_ids": lacking, "today": today})
+        past_to = {(car_id, kind): valid_to for car_id, kind, valid_to in rows}
+
+    out: list[UpcomingRenewalOut] = []
+
+    for car in cars:
         for kind in RenewalKind:
-            rs = by_kind[kind]
-            # pick the best matches if multiple overlap
-            current = max(
-                (r for r in rs if r.valid_from <= today <= r.valid_to),
-                key=lambda r: r.valid_to,
-                default=None,
-            )
-            past = max(
-                (r for r in rs if r.valid_to < today),
-                key=lambda r: r.valid_to,
-                default=None,
-            )
+            current = current_to.get((car.id, kind))
+            past = past_to.get((car.id, kind))
 
             if current:
-                days_until = (current.valid_to - today).days
+                days_until = (current - today).days
                 if days_until <= days:
                     out.append(
                         UpcomingRenewalOut(
@@ -207,9 +244,9 @@ def upcoming_renewals(
                             car_registration_number=car.registration_number,
                             kind=kind,
                             status="due",
-                            due_date=current.valid_to,
+                            due_date=current,
                             days_until=days_until,
-                            current_valid_to=current.valid_to,
+                            current_valid_to=current,
                         )
                     )
                 continue
@@ -222,8 +259,8 @@ def upcoming_renewals(
                         car_registration_number=car.registration_number,
                         kind=kind,
                         status="overdue",
-                        due_date=past.valid_to,
-                        days_until=-(today - past.valid_to).days,
+                        due_date=past,
+                        days_until=-(today - past).days,
                         current_valid_to=None,
                     )
                 )
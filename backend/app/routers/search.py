@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.deps import get_current_household, get_db
+from app.schemas import SearchResults
+from app.search import search_household
+
+router = APIRouter(prefix="/api", tags=["search"])
+
+
+@router.get("/search", response_model=SearchResults)
+def search(
+    q: str = Query(..., min_length=2, max_length=64),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    household=Depends(get_current_household),
+):
+    """Cars (registration, make, model) and renewals (provider, reference, notes)
+    in the caller's household matching `q`, best match first."""
+    # One extra row tells us whether there is another page.
+    hits = search_household(db, household.id, q, limit=limit + 1, offset=offset)
+    next_offset = offset + limit if len(hits) > limit else None
+    return SearchResults(items=hits[:limit], next_offset=next_offset)
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import uuid
+from datetime import date, timedelta
+
+from fastapi import APIRouter, Body, Depends, HTTPException, status
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app import scoped, vehicles
+from app.config import Settings
+from app.deps import get_current_household_id, get_db, get_settings, get_token_user_id
+from app.enums import RenewalKind
+from app.models import Car, RenewalRecord
+from app.schemas import (
+    CarEnrichmentOut,
+    CarOut,
+    EnrichCarsIn,
+    RenewalSuggestionOut,
+    VehicleLookupIn,
+    VehicleLookupOut,
+    VehicleOut,
+)
+
+router = APIRouter(prefix="/api/vehicles", tags=["vehicles"])
+
+
+def _lookups(settings: Settings) -> vehicles.VehicleLookups:
+    lookups = vehicles.get_vehicle_lookups(settings)
+    if lookups is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Vehicle lookups are not configured")
+    return lookups
+
+
+@router.post("/lookup", response_model=VehicleLookupOut)
+def lookup_vehicles(
+    payload: VehicleLookupIn,
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_token_user_id),
+    settings: Settings = Depends(get_settings),
+):
+    """Registry data for up to 100 registrations, e.g. to prefill a new car."""
+    result = _lookups(settings).lookup(db, payload.registration_numbers)
+    return VehicleLookupOut(
+        vehicles=[VehicleOut(registration_number=r, **vars(v)) for r, v in sorted(result.found.items())],
+        not_found=sorted(result.not_found),
+        unavailable=sorted(result.unavailable),
+    )
+
+
+@router.post("/enrich", response_model=list[CarEnrichmentOut])
+def enrich_cars(
+    payload: EnrichCarsIn = Body(default_factory=EnrichCarsIn),
+    db: Session = Depends(get_db),
+    user_id: uuid.UUID = Depends(get_token_user_id),
+    household_id: uuid.UUID = Depends(get_current_household_id),
+    settings: Settings = Depends(get_settings),
+):
+    """Look up the household's cars in one batch, fill in missing make/model, and suggest renewals.
+
+    MOT and tax dates become suggestions, never records: one is offered when no
+    live renewal of that kind already runs to that date.
+    """
+    lookups = _lookups(settings)
+    stmt = select(Car).where(Car.household_id == household_id)
+    if payload.car_ids is None:
+        stmt = stmt.where(Car.is_archived.is_(False))
+    else:
+        stmt = stmt.where(Car.id.in_(payload.car_ids))
+    cars = list(db.scalars(stmt.order_by(Car.registration_number)))
+    if not cars:
+        return []
+
+    result = lookups.lookup(db, [c.registration_number for c in cars])  # commits around the provider calls
+    covered_to = {
+        (car_id, kind): valid_to
+        for car_id, kind, valid_to in db.execute(
+            select(RenewalRecord.car_id, RenewalRecord.kind, func.max(RenewalRecord.valid_to))
+            .where(
+                RenewalRecord.car_id.in_([c.id for c in cars]),
+                RenewalRecord.kind.in_([RenewalKind.MOT, RenewalKind.TAX]),
+                RenewalRecord.is_deleted.is_(False),
+            )
+            .group_by(RenewalRecord.car_id, RenewalRecord.kind)
+        )
+    }
+
+    today = date.today()
+    out: list[CarEnrichmentOut] = []
+    for car in cars:
+        reg = car.registration_number
+        data = result.found.get(reg)
+        if data is None:
+            out.append(
+                CarEnrichmentOut(
+                    car=CarOut.model_validate(car, from_attributes=True),
+                    lookup="not_found" if reg in result.not_found else "unavailable",
+                    filled=[],
+                    suggestions=[],
+                )
+            )
+            continue
+
+        values = {f: getattr(data, f) for f in ("make", "model") if getattr(data, f) and not getattr(car, f)}
+        if values:
+            car = scoped.update_car(db, user_id, car.id, values, op="enrich") or car
+        # An MOT is valid through its expiry date; tax runs to the day before it is due.
+        last_days = (
+            (RenewalKind.MOT, data.mot_expiry),
+            (RenewalKind.TAX, data.tax_due and data.tax_due - timedelta(days=1)),
+        )
+        suggestions = []
+        for kind, expiry in last_days:
+            recorded = covered_to.get((car.id, kind))
+            if expiry is not None and (recorded is None or recorded < expiry):
+                valid_from, valid_to = vehicles.suggested_cover(expiry, today)
+                suggestions.append(RenewalSuggestionOut(kind=kind, valid_from=valid_from, valid_to=valid_to))
+        out.append(
+            CarEnrichmentOut(
+                car=CarOut.model_validate(car, from_attributes=True),
+                lookup="found",
+                filled=sorted(values),
+                suggestions=suggestions,
+            )
+        )
+    db.commit()
+    return out
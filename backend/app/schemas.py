@@ -40,6 +40,11 @@ class HouseholdOut(BaseModel):
     created_at: datetime
 
 
+def normalize_registration(value: str) -> str:
+    """Registration numbers are stored, compared and searched upper-cased and stripped."""
+    return value.upper().strip()
+
+
 class CarCreate(BaseModel):
     registration_number: str = Field(min_length=2, max_length=16)
     make: str | None = Field(default=None, max_length=64)
@@ -164,3 +169,191 @@ class ReminderPreferencesPayload(BaseModel):
 
 class ReminderPreferencesOut(BaseModel):
     preferences: dict[str, list[int]]
+
+
+def default_reminder_preferences() -> dict[str, list[int]]:
+    # days before expiry to notify; UI can allow per-user/per-car overrides later
+    return {
+        RenewalKind.INSURANCE.value: [30, 7, 1],
+        RenewalKind.MOT.value: [30, 7, 1],
+        RenewalKind.TAX.value: [30, 7, 1],
+    }
+
+
+# -------------------------
+# Search
+# -------------------------
+
+
+class SearchHit(BaseModel):
+    type: Literal["car", "renewal"]
+    id: uuid.UUID
+    car_id: uuid.UUID
+    registration_number: str
+    make: str | None
+    model: str | None
+    is_archived: bool
+
+    # renewal hits only
+    kind: RenewalKind | None = None
+    provider: str | None = None
+    reference: str | None = None
+
+    score: float
+
+
+class SearchResults(BaseModel):
+    items: list[SearchHit]
+    next_offset: int | None = None
+
+
+# -------------------------
+# Audit trail
+# -------------------------
+
+
+class AuditEntryOut(BaseModel):
+    # With `at`, the cursor for the next page (before, before_id).
+    id: int
+    at: datetime
+    entity: Literal["car", "renewal"]
+    entity_id: uuid.UUID
+    op: str
+    actor_id: uuid.UUID | None
+    # {"field": [before, after]}
+    changes: dict[str, list]
+
+
+# -------------------------
+# Calendar feed
+# -------------------------
+
+
+class CalendarFeedOut(BaseModel):
+    # Shown once: only its hash is stored. Creating a new one revokes the old.
+    token: str
+    path: str
+
+
+# -------------------------
+# Compliance (see app/compliance.py)
+# -------------------------
+
+
+class ComplianceCountsOut(BaseModel):
+    on: date
+    kind: RenewalKind
+    covered: int
+    lapsed: int
+    missing: int
+
+
+class ComplianceItemOut(BaseModel):
+    car_id: uuid.UUID
+    registration_number: str
+    is_archived: bool
+    kind: RenewalKind
+    status: Literal["covered", "lapsed", "missing"]
+    # covered: when the cover spanning the day ends; lapsed: when the last one before it ended
+    valid_to: date | None = None
+
+
+class ComplianceOut(BaseModel):
+    on: date
+    items: list[ComplianceItemOut]
+    totals: list[ComplianceCountsOut]
+
+
+# -------------------------
+# Vehicle data (see app/vehicles.py)
+# -------------------------
+
+
+class VehicleLookupIn(BaseModel):
+    registration_numbers: list[str] = Field(min_length=1, max_length=100)
+
+
+class VehicleOut(BaseModel):
+    registration_number: str
+    make: str | None = None
+    model: str | None = None
+    mot_expiry: date | None = None
+    tax_due: date | None = None
+
+
+class VehicleLookupOut(BaseModel):
+    vehicles: list[VehicleOut]
+    not_found: list[str]
+    # The provider is failing or the circuit breaker is open: try again later.
+    unavailable: list[str]
+
+
+class EnrichCarsIn(BaseModel):
+    # None: every car of the household that is not archived.
+    car_ids: list[uuid.UUID] | None = Field(default=None, max_length=500)
+
+
+class RenewalSuggestionOut(BaseModel):
+    # Ready to POST to /api/cars/{car_id}/renewals once the user confirms it.
+    kind: RenewalKind
+    valid_from: date
+    valid_to: date
+
+
+class CarEnrichmentOut(BaseModel):
+    car: CarOut
+    lookup: Literal["found", "not_found", "unavailable"]
+    # Make/model filled in from the lookup (only where they were empty).
+    filled: list[str]
+    suggestions: list[RenewalSuggestionOut]
+
+
+# -------------------------
+# Attachments (see app/attachments.py)
+# -------------------------
+
+
+class AttachmentOut(BaseModel):
+    id: uuid.UUID
+    renewal_id: uuid.UUID
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    created_at: datetime
+
+
+# -------------------------
+# Cost forecast (see app/forecast.py)
+# -------------------------
+
+
+class ForecastItemOut(BaseModel):
+    kind: RenewalKind
+    due_date: date
+    estimate_pence: int | None
+    # car: from its own past costs; kind: median of the household's other cars; null: unpriced
+    basis: Literal["car", "kind"] | None
+
+
+class CarForecastOut(BaseModel):
+    car_id: uuid.UUID
+    registration_number: str
+    total_pence: int
+    renewals: list[ForecastItemOut]
+
+
+class MonthTotalOut(BaseModel):
+    month: date
+    total_pence: int
+    renewals: int
+
+
+class ForecastOut(BaseModel):
+    as_of: date
+    until: date
+    total_pence: int
+    unpriced: int
+    by_month: list[MonthTotalOut]
+    by_kind: dict[RenewalKind, int]
+    cars: list[CarForecastOut]
@@ -0,0 +1,265 @@
+"""Ownership-scoped statements for the car and renewal handlers.
+
+Each function is the whole database work of one handler, in one statement.
+Rather than resolving the caller's household first (users row, membership,
+household: three round trips), the statement checks ownership itself. A car
+qualifies only if its household is the caller's, and that household is a
+subquery on household_members keyed by the token's user id.
+
+A statement that matches nothing can mean "no such row", "not yours" or
+"you have no household yet". Only then do `not_found` / `check_member`
+run the queries that tell these apart.
+
+Reads are pinned to the primary (app.db.note_principal) by user and, when
+a replica would serve them, by household: the dependency that reads the
+token looks up the user's household on the replica first. A member sees
+their own writes and other members' writes at once. Writes pin both ids.
+
+The hot reads (list_cars, get_car, list_renewals) are module-level
+statements with bound parameters rather than built per call. A statement
+object memoizes its cache key, so executing a prebuilt one skips both
+construction and key generation and goes straight to the engine's
+compiled cache (counted as db.statement_cache.* in GET /metrics).
+"""
+
+from __future__ import annotations
+
+import uuid
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, bindparam, func, insert, literal, null, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import BindParameter, ColumnElement
+
+from app import audit
+from app.db import note_principal
+from app.deps import household_id_for
+from app.enums import RenewalKind
+from app.events import change_notification
+from app.models import Car, HouseholdMember, RenewalRecord, User
+
+
+def household_of(user_id: uuid.UUID | BindParameter) -> ColumnElement:
+    """The user's (first) household id, as a scalar subquery (see deps.household_id_for)."""
+    return (
+        select(HouseholdMember.household_id)
+        .where(HouseholdMember.user_id == user_id)
+        .order_by(HouseholdMember.created_at.asc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def check_member(db: Session, user_id: uuid.UUID) -> None:
+    """401 if the user is gone, 409 if they have no household yet."""
+    if db.scalar(select(HouseholdMember.id).where(HouseholdMember.user_id == user_id).limit(1)) is None:
+        if db.get(User, user_id) is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        household_id_for(db, user_id)  # raises the 409
+
+
+def not_found(db: Session, user_id: uuid.UUID, detail: str) -> HTTPException:
+    """The error for a scoped statement that matched nothing: see check_member, else 404."""
+    check_member(db, user_id)
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+# -------------------------
+# Cars
+# -------------------------
+
+
+_owned = Car.household_id == household_of(bindparam("user_id"))
+_all_cars = select(Car).where(_owned).order_by(Car.created_at.desc())
+_live_cars = select(Car).where(_owned, Car.is_archived.is_(False)).order_by(Car.created_at.desc())
+_one_car = select(Car).where(Car.id == bindparam("car_id"), _owned)
+
+
+def list_cars(db: Session, user_id: uuid.UUID, *, include_archived: bool) -> list[Car]:
+    stmt = _all_cars if include_archived else _live_cars
+    return list(db.scalars(stmt, {"user_id": user_id}))
+
+
+def get_car(db: Session, user_id: uuid.UUID, car_id: uuid.UUID) -> Car | None:
+    return db.scalars(_one_car, {"user_id": user_id, "car_id": car_id}).one_or_none()
+
+
+def insert_car(db: Session, user_id: uuid.UUID, values: dict) -> Car | None:
+    """INSERT ... SELECT from the user's membership, so no household means no row (None).
+
+    Raises IntegrityError for a duplicate registration. The caller commits.
+    """
+    now = datetime.utcnow()
+    # Every column spelled out: the id goes into the audit entry, and column
+    # defaults are not applied to an INSERT ... SELECT that carries CTEs.
+    values = {"id": uuid.uuid4(), **values, "is_archived": False, "created_at": now, "updated_at": now}
+    columns = list(values)
+    src = (
+        select(HouseholdMember.household_id, *(audit.typed(Car.__table__, c, values[c]).label(c) for c in columns))
+        .where(HouseholdMember.user_id == user_id)
+        .order_by(HouseholdMember.created_at.asc())
+        .limit(1)
+        .cte("src")
+    )
+    after = audit.built(Car.__table__, values).op("||")(
+        func.jsonb_build_object(literal("household_id"), src.c.household_id)
+    )
+    logged = audit.outbox(
+        select(literal(values["id"], Car.id.type), src.c.household_id, null(), after),
+        entity="car",
+        op="create",
+        actor_id=user_id,
+    )
+    stmt = (
+        insert(Car)
+        .from_select(["household_id", *columns], select(src.c.household_id, *(src.c[c] for c in columns)))
+        .returning(Car, change_notification(Car.household_id, "car", Car.id, "create"))
+        .add_cte(src, logged)
+    )
+    car = db.scalars(stmt).one_or_none()
+    if car is not None:
+        note_principal(db, household_id=car.household_id)
+    return car
+
+
+def update_car(db: Session, user_id: uuid.UUID, car_id: uuid.UUID, values: dict, *, op: str) -> Car | None:
+    """UPDATE ... RETURNING for a car in the user's household; None if there is none.
+
+    Raises IntegrityError for a duplicate registration. The caller commits.
+    """
+    values = {**values, "updated_at": datetime.utcnow()}
+    old = (
+        select(Car.__table__)
+        .where(Car.id == car_id, Car.household_id == household_of(user_id))
+        .with_for_update()
+        .cte("old")
+    )
+    logged = audit.outbox(
+        select(old.c.id, old.c.household_id, audit.image(old), audit.patched(old, Car.__table__, values)),
+        entity="car",
+        op=op,
+        actor_id=user_id,
+    )
+    stmt = (
+        update(Car)
+        .where(Car.id == old.c.id)
+        .values(**values)
+        .returning(Car, change_notification(Car.household_id, "car", Car.id, op))
+        .add_cte(old, logged)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    car = db.scalars(stmt).one_or_none()
+    if car is not None:
+        note_principal(db, household_id=car.household_id)
+    return car
+
+
+# -------------------------
+# Renewals
+# -------------------------
+
+
+def list_renewals(
+    db: Session, user_id: uuid.UUID, car_id: uuid.UUID, *, kind: RenewalKind | None = None
+) -> list[RenewalRecord] | None:
+    """A car's live renewals, newest cover first; None if the car is not the user's.
+
+    The car is outer-joined to its renewals, so an owned car with none still
+    yields one row (with no renewal) and tells the two cases apart.
+    """
+    if kind is None:
+        rows = db.execute(_renewals_of_car, {"user_id": user_id, "car_id": car_id}).all()
+    else:
+        rows = db.execute(_renewals_of_car_kind, {"user_id": user_id, "car_id": car_id, "kind": kind}).all()
+    if not rows:
+        return None
+    return [r for _, r in rows if r is not None]
+
+
+def _renewals_of(*on: ColumnElement):
+    return (
+        select(Car.id, RenewalRecord)
+        .select_from(Car)
+        .outerjoin(RenewalRecord, and_(RenewalRecord.car_id == Car.id, RenewalRecord.is_deleted.is_(False), *on))
+        .where(Car.id == bindparam("car_id"), _owned)
+        .order_by(RenewalRecord.valid_to.desc())
+    )
+
+
+_renewals_of_car = _renewals_of()
+_renewals_of_car_kind = _renewals_of(RenewalRecord.kind == bindparam("kind"))
+
+
+def insert_renewal(db: Session, user_id: uuid.UUID, car_id: uuid.UUID, values: dict) -> RenewalRecord | None:
+    """INSERT ... SELECT from the owned car, so a car that isn't the user's inserts nothing (None).
+
+    The caller commits.
+    """
+    now = datetime.utcnow()
+    values = {"id": uuid.uuid4(), **values, "is_deleted": False, "created_at": now, "updated_at": now}
+    columns = list(values)
+    table = RenewalRecord.__table__
+    src = (
+        select(Car.id.label("car_id"), Car.household_id, *(audit.typed(table, c, values[c]).label(c) for c in columns))
+        .where(Car.id == car_id, Car.household_id == household_of(user_id))
+        .cte("src")
+    )
+    after = audit.built(table, values).op("||")(func.jsonb_build_object(literal("car_id"), src.c.car_id))
+    src_household = household_of(user_id)  # the car's, since the car qualified
+    logged = audit.outbox(
+        select(literal(values["id"], RenewalRecord.id.type), src.c.household_id, null(), after),
+        entity="renewal",
+        op="create",
+        actor_id=user_id,
+    )
+    stmt = (
+        insert(RenewalRecord)
+        .from_select(["car_id", *columns], select(src.c.car_id, *(src.c[c] for c in columns)))
+        .returning(RenewalRecord, src_household, change_notification(src_household, "renewal", RenewalRecord.id, "create"))
+        .add_cte(src, logged)
+    )
+    row = db.execute(stmt).one_or_none()
+    if row is None:
+        return None
+    note_principal(db, household_id=row[1])
+    return row[0]
+
+
+def update_renewal(
+    db: Session, user_id: uuid.UUID, renewal_id: uuid.UUID, values: dict, *, op: str, live_only: bool = True
+) -> RenewalRecord | None:
+    """UPDATE renewals ... FROM the locked old row, for a renewal of one of the user's cars.
+
+    None if there is none. `live_only` skips soft-deleted renewals. The caller commits.
+    """
+    values = {**values, "updated_at": datetime.utcnow()}
+    table = RenewalRecord.__table__
+    where = [
+        RenewalRecord.id == renewal_id,
+        RenewalRecord.car_id == Car.id,
+        Car.household_id == household_of(user_id),
+    ]
+    if live_only:
+        where.append(RenewalRecord.is_deleted.is_(False))
+    old = select(table).where(*where).with_for_update(of=table).cte("old")
+    logged = audit.outbox(
+        select(old.c.id, household_of(user_id), audit.image(old), audit.patched(old, table, values)),
+        entity="renewal",
+        op=op,
+        actor_id=user_id,
+    )
+    household = household_of(user_id)  # the car's, since the renewal qualified
+    stmt = (
+        update(RenewalRecord)
+        .where(RenewalRecord.id == old.c.id)
+        .values(**values)
+        .returning(RenewalRecord, household, change_notification(household, "renewal", RenewalRecord.id, op))
+        .add_cte(old, logged)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    row = db.execute(stmt).one_or_none()
+    if row is None:
+        return None
+    note_principal(db, household_id=row[1])
+    return row[0]
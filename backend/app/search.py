@@ -0,0 +1,147 @@
+"""Household search across cars and renewals.
+
+With pg_trgm installed (migration 0007), a term matches a field when it is a
+substring of it (ILIKE '%term%') or a close fuzzy match for a word in it
+(word similarity, pg_trgm's %> operator); GIN trigram indexes serve both.
+Hits are ranked by word_similarity, with substring matches always above
+fuzzy-only ones. Without the extension only substring matches are found,
+ranked exact > prefix > substring, and nothing is indexed. That is logged
+as a warning (at startup and on the first search) and counted as
+search.trigram_missing in GET /metrics. A missing extension is looked for
+again every TRIGRAM_RECHECK_SECONDS, so installing it needs no restart.
+
+Queries are always scoped to one household: for a typical household the
+planner starts from its handful of cars, and the trigram indexes take over
+for large fleets.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+
+from sqlalchemy import Text, case, cast, func, literal, null, or_, select, text, union_all
+from sqlalchemy.orm import Session
+
+from app.metrics import metrics
+from app.models import Car, RenewalRecord
+from app.schemas import SearchHit, normalize_registration
+
+CAR_FIELDS = (Car.registration_number, Car.make, Car.model)
+RENEWAL_FIELDS = (RenewalRecord.provider, RenewalRecord.reference, RenewalRecord.notes)
+
+log = logging.getLogger(__name__)
+
+TRIGRAM_RECHECK_SECONDS = 60.0
+
+# engine URL -> (installed, time.monotonic() of the check)
+_trigram: dict[str, tuple[bool, float]] = {}
+_trigram_lock = threading.Lock()
+
+
+def has_trigram(db: Session) -> bool:
+    """Whether pg_trgm is installed in the session's database.
+
+    Checked once per engine when it is; when it isn't, again after
+    TRIGRAM_RECHECK_SECONDS.
+    """
+    bind = db.get_bind()
+    key = getattr(bind, "engine", bind).url.render_as_string(hide_password=True)
+    now = time.monotonic()
+    cached = _trigram.get(key)
+    if cached is not None and (cached[0] or now - cached[1] < TRIGRAM_RECHECK_SECONDS):
+        return cached[0]
+    found = db.execute(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")).scalar_one()
+    with _trigram_lock:
+        first, _trigram[key] = key not in _trigram, (found, now)
+    if first and not found:
+        log.warning("pg_trgm is not installed in %s: search is unindexed and has no fuzzy matching", key)
+        metrics.inc("search.trigram_missing")
+    return found
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _match_and_score(fields, term: str, *, trigram: bool):
+    contains = f"%{_escape_like(term)}%"
+    substring = or_(*(f.ilike(contains, escape="\\") for f in fields))
+    if trigram:
+        similarity = func.greatest(*(func.word_similarity(term, func.coalesce(f, "")) for f in fields))
+        fuzzy = or_(*(f.op("%>")(term) for f in fields))
+        return or_(substring, fuzzy), similarity + case((substring, 1.0), else_=0.0)
+
+    prefix = f"{_escape_like(term)}%"
+    score = func.greatest(
+        *(
+            case(
+                (func.upper(f) == term, 2.0),
+                (f.ilike(prefix, escape="\\"), 1.8),
+                (f.ilike(contains, escape="\\"), 1.5),
+                else_=0.0,
+            )
+            for f in fields
+        )
+    )
+    return substring, score
+
+
+def search_household(
+    db: Session,
+    household_id: uuid.UUID,
+    q: str,
+    *,
+    limit: int,
+    offset: int = 0,
+    trigram: bool | None = None,
+) -> list[SearchHit]:
+    """Cars and live renewals of the household matching `q`, best first.
+
+    `q` is normalized like a stored registration number. One statement.
+    """
+    term = normalize_registration(q)
+    if trigram is None:
+        trigram = has_trigram(db)
+
+    car_match, car_score = _match_and_score(CAR_FIELDS, term, trigram=trigram)
+    cars = select(
+        literal("car").label("type"),
+        Car.id.label("id"),
+        Car.id.label("car_id"),
+        Car.registration_number,
+        Car.make,
+        Car.model,
+        Car.is_archived,
+        cast(null(), RenewalRecord.kind.type).label("kind"),
+        cast(null(), Text).label("provider"),
+        cast(null(), Text).label("reference"),
+        car_score.label("score"),
+    ).where(Car.household_id == household_id, car_match)
+
+    renewal_match, renewal_score = _match_and_score(RENEWAL_FIELDS, term, trigram=trigram)
+    renewals = (
+        select(
+            literal("renewal").label("type"),
+            RenewalRecord.id,
+            RenewalRecord.car_id,
+            Car.registration_number,
+            Car.make,
+            Car.model,
+            Car.is_archived,
+            RenewalRecord.kind,
+            RenewalRecord.provider,
+            RenewalRecord.reference,
+            renewal_score.label("score"),
+        )
+        .join(Car, Car.id == RenewalRecord.car_id)
+        .where(Car.household_id == household_id, RenewalRecord.is_deleted.is_(False), renewal_match)
+    )
+
+    hits = union_all(cars, renewals).subquery("hits")
+    rows = db.execute(
+        select(hits).order_by(hits.c.score.desc(), hits.c.type, hits.c.id).limit(limit).offset(offset)
+    ).mappings()
+    return [SearchHit(**row) for row in rows]
@@ -1,25 +1,148 @@
 from __future__ import annotations
 
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
 from datetime import UTC, datetime, timedelta
-
-import bcrypt
-from jose import jwt
+from typing import Any
 
 from app.config import Settings
+from app.metrics import metrics
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+# bcrypt and python-jose (which pulls in cryptography) are imported on first
+# use, not at startup: most processes that import this module never hash.
 
 
 def hash_password(password: str) -> str:
+    import bcrypt
+
     # Store as a string in the DB (bcrypt returns bytes)
     hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=12))
     return hashed.decode("utf-8")
 
 
 def verify_password(password: str, password_hash: str) -> bool:
+    import bcrypt
+
     return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
 
 
 def create_access_token(*, settings: Settings, subject: str, minutes: int) -> str:
+    from jose import jwt
+
     now = datetime.now(UTC)
     exp = now + timedelta(minutes=minutes)
     payload = {"sub": subject, "iat": int(now.timestamp()), "exp": int(exp.timestamp())}
     return jwt.encode(payload, settings.jwt_secret, algorithm=settings.jwt_alg)
+
+
+class TokenCache:
+    """Bounded LRU of verified tokens -> claims.
+
+    Keyed by a SHA-256 digest (never the raw token) that also covers the
+    secret and algorithm, so rotating JWT_SECRET invalidates every entry.
+    Entries are dropped once their `exp` has passed.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[bytes, tuple[dict[str, Any], float]] = OrderedDict()
+
+    @staticmethod
+    def key(settings: Settings, token: str) -> bytes:
+        h = hashlib.sha256(f"{settings.jwt_alg}\0{settings.jwt_secret}\0".encode())
+        h.update(token.encode())
+        return h.digest()
+
+    def get(self, key: bytes, now: float) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            claims, exp = entry
+            if exp <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return claims
+
+    def put(self, key: bytes, claims: dict[str, Any], exp: float) -> None:
+        with self._lock:
+            self._entries[key] = (claims, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_token_cache = TokenCache(maxsize=10_000)
+
+
+def _decode_jose(token: str, settings: Settings) -> dict[str, Any]:
+    from jose import JWTError, jwt
+
+    try:
+        return jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_alg])
+    except JWTError as err:
+        raise InvalidToken(str(err)) from err
+
+
+def _decode_pyjwt(token: str, settings: Settings) -> dict[str, Any]:
+    import jwt as pyjwt  # optional "pyjwt" extra; imported lazily
+
+    try:
+        return pyjwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_alg])
+    except pyjwt.PyJWTError as err:
+        raise InvalidToken(str(err)) from err
+
+
+_DECODERS = {"jose": _decode_jose, "pyjwt": _decode_pyjwt}
+
+
+def decode_access_token(*, settings: Settings, token: str) -> dict[str, Any]:
+    """Verify `token` and return its claims, using the verified-token cache.
+
+    Raises InvalidToken for a bad signature, expired token or unknown backend.
+    """
+    decode = _DECODERS.get(settings.jwt_backend)
+    if decode is None:
+        raise InvalidToken(f"Unknown JWT backend: {settings.jwt_backend}")
+    if settings.jwt_cache_size <= 0:
+        return decode(token, settings)
+
+    _token_cache.maxsize = settings.jwt_cache_size
+    key = TokenCache.key(settings, token)
+    now = time.time()
+    claims = _token_cache.get(key, now)
+    if claims is not None:
+        metrics.inc("auth.token_cache.hits")
+        return claims
+
+    metrics.inc("auth.token_cache.misses")
+    claims = decode(token, settings)
+    exp = claims.get("exp")
+    if isinstance(exp, int | float):
+        _token_cache.put(key, claims, float(exp))
+    return claims
+
+
+def clear_token_cache() -> None:
+    _token_cache.clear()
+
+
+def is_admin_token(settings: Settings, token: str | None) -> bool:
+    """True if `token` is the configured ADMIN_TOKEN (never when none is configured)."""
+    if not settings.admin_token or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), settings.admin_token.encode())
@@ -0,0 +1,589 @@
+"""Tenant sharding: each household's cars and renewals on one of several databases.
+
+DATABASE_URL is the directory. It holds what is not owned by one household
+(users, households and their members, reminder preferences, calendar feeds,
+vehicle lookups) and household_shards, which says where each household's
+data lives. It is also the "default" shard: households without a row there
+are on it, which is every household from before sharding was turned on.
+DATABASE_SHARDS names the other shards. Every database has the full schema
+(run `DATABASE_URL=<shard> alembic upgrade head` for each).
+
+Routing: a ShardedSession sends statements that touch only directory tables
+to the directory, and everything else to the shard of the household the
+request acts for (app.db.note_principal). A user-only principal is resolved
+to its household first. Workers cache user -> household and household ->
+shard for SHARD_CACHE_SECONDS; a move notifies every worker, which drops
+its copy at once. The household's own users, households and
+household_members rows are copied onto its shard, so the statements that
+check ownership with a join or subquery on household_members (app.scoped)
+run unchanged on a single database.
+
+Placement: a new household goes to the shard a consistent-hash ring picks
+for its id, and gets a household_shards row. From then on the row is
+authoritative, so adding a shard to the ring never moves anyone; `move`
+does, explicitly.
+
+Moving a household (`python -m app.shards move`) keeps it online:
+  1. copy its rows to the target without locks, in one target transaction;
+  2. cutover: lock the household row on the source (FOR UPDATE), plus its
+     cars, renewals and audit outbox entries; copy what changed since step
+     1 (a diff by primary key, so only changes are written); commit the
+     target; point household_shards at the target and notify; delete the
+     rows from the source; commit the source.
+Writes only wait (or fail) during step 2. Each write transaction on a shard
+starts with a fence: before its first write it takes a KEY SHARE lock on
+the household row, NOWAIT, and re-reads the directory. Mid-cutover the
+lock is taken and afterwards the directory points elsewhere, so a write
+routed by a stale cache raises ShardMoved (a 503 with Retry-After) instead
+of landing in a copy that is about to be deleted. Once the lock is held, a
+cutover waits for the transaction to end. The fence costs two primary-key
+lookups per write transaction. Audit entries are copied
+without their ids, which are per-database sequences.
+
+Not covered: read replicas are not used for sharded sessions; fleet-wide
+jobs run once per database (`python -m app.compaction`, `python -m
+app.audit flush` with DATABASE_URL set to each shard).
+
+CLI (from backend/):
+    python -m app.shards list
+    python -m app.shards move <household_id> <shard>
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import hashlib
+import json
+import threading
+import time
+import uuid
+import weakref
+from collections.abc import Iterable
+
+from dotenv import load_dotenv
+from sqlalchemy import (
+    ColumnElement,
+    Delete,
+    Insert,
+    Table,
+    Update,
+    bindparam,
+    delete,
+    event,
+    exists,
+    func,
+    insert,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.util import find_tables
+
+from app.config import Settings
+from app.db import get_engine, make_engine
+from app.events import CHANNEL, get_event_hub
+from app.metrics import metrics
+from app.models import (
+    Attachment,
+    AuditLog,
+    AuditOutbox,
+    Car,
+    CarArchive,
+    Household,
+    HouseholdMember,
+    HouseholdShard,
+    RenewalArchive,
+    RenewalRecord,
+    User,
+)
+
+DEFAULT = "default"
+
+# Statements touching only these run on the directory.
+GLOBAL_TABLES = frozenset(
+    {
+        "users",
+        "households",
+        "household_members",
+        "reminder_preferences",
+        "calendar_feeds",
+        "vehicle_lookups",
+        "household_shards",
+    }
+)
+
+
+class ShardMoved(Exception):
+    """The household moved to another shard while this transaction was writing to the old one."""
+
+    def __init__(self, household_id: uuid.UUID) -> None:
+        super().__init__(f"household {household_id} moved to another shard")
+        self.household_id = household_id
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of household ids onto shard names.
+
+    Each shard has `vnodes` points on the ring, so load spreads evenly and
+    adding a shard takes keys from every other one, about 1/n of them.
+    """
+
+    def __init__(self, names: Iterable[str], *, vnodes: int = 64) -> None:
+        points = sorted((_point(f"{name}#{i}"), name) for name in names for i in range(vnodes))
+        if not points:
+            raise ValueError("a hash ring needs at least one shard")
+        self._points = [p for p, _ in points]
+        self._names = [name for _, name in points]
+
+    def node(self, key: uuid.UUID | str) -> str:
+        i = bisect.bisect(self._points, _point(str(key)))
+        return self._names[i % len(self._names)]
+
+
+# -------------------------
+# Routing
+# -------------------------
+
+_first_household = (
+    select(HouseholdMember.household_id)
+    .where(HouseholdMember.user_id == bindparam("user_id"))
+    .order_by(HouseholdMember.created_at.asc())
+    .limit(1)
+)
+_shard_of = select(HouseholdShard.shard).where(HouseholdShard.household_id == bindparam("household_id"))
+_fence = (
+    select(Household.id)
+    .where(Household.id == bindparam("household_id"))
+    .with_for_update(key_share=True, nowait=True)
+)
+
+# Tables per statement, worked out once for the prebuilt ones (app.scoped).
+_statement_tables: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _tables(mapper, clause) -> frozenset[str]:
+    if clause is not None:
+        names = _statement_tables.get(clause)
+        if names is None:
+            names = _statement_tables[clause] = frozenset(t.name for t in find_tables(clause, include_crud=True))
+        if names:
+            return names
+    if mapper is not None:
+        return frozenset(t.name for t in mapper.tables)
+    return frozenset()
+
+
+class ShardRouter:
+    """The directory engine, one engine per shard, and this worker's cached placements."""
+
+    def __init__(self, directory: Engine, shards: dict[str, Engine], *, cache_seconds: float = 5.0) -> None:
+        self.directory = directory
+        self.engines = {DEFAULT: directory} | shards
+        self.ring = HashRing(self.engines)
+        self.cache_seconds = cache_seconds
+        self._lock = threading.Lock()
+        self._households: dict[uuid.UUID, uuid.UUID] = {}
+        self._placements: dict[uuid.UUID, tuple[str, float]] = {}
+        self._factory = sessionmaker(
+            bind=directory,
+            class_=ShardedSession,
+            autoflush=False,
+            autocommit=False,
+            expire_on_commit=False,
+        )
+
+    def session(self) -> ShardedSession:
+        return self._factory(info={"shards": self})
+
+    def household_of_user(self, user_id: uuid.UUID) -> uuid.UUID | None:
+        """The user's (first) household; memberships don't change, so only found ones are kept."""
+        household_id = self._households.get(user_id)
+        if household_id is None:
+            with self.directory.connect() as conn:
+                household_id = conn.scalar(_first_household, {"user_id": user_id})
+            if household_id is not None:
+                with self._lock:
+                    if len(self._households) >= 100_000:
+                        self._households.clear()
+                    self._households[user_id] = household_id
+        return household_id
+
+    def shard_of(self, household_id: uuid.UUID, *, fresh: bool = False) -> str:
+        if not fresh:
+            cached = self._placements.get(household_id)
+            if cached is not None and cached[1] > time.monotonic():
+                return cached[0]
+        metrics.inc("shards.lookups")
+        with self.directory.connect() as conn:
+            name = conn.scalar(_shard_of, {"household_id": household_id}) or DEFAULT
+        self._remember(household_id, name)
+        return name
+
+    def _remember(self, household_id: uuid.UUID, name: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._placements) >= 100_000:
+                self._placements = {h: p for h, p in self._placements.items() if p[1] > now}
+            self._placements[household_id] = (name, now + self.cache_seconds)
+
+    def forget(self, household_id: uuid.UUID | None = None) -> None:
+        with self._lock:
+            if household_id is None:
+                self._placements.clear()
+            else:
+                self._placements.pop(household_id, None)
+
+    def on_change(self, household_id: str | None, event: dict | None) -> None:
+        """EventHub watcher: a move (or a listener reconnect, when one may have been missed) drops placements."""
+        if event is None:
+            self.forget()
+        elif event.get("entity") == "household" and event.get("op") == "move":
+            self.forget(uuid.UUID(household_id))
+
+    def place(self, db: Session, household_id: uuid.UUID) -> str:
+        """Pick a shard for a new household and copy its identity rows there.
+
+        The household_shards row is added to `db`, so it commits with the
+        membership: nobody can reach the household before it is placed.
+        """
+        name = self.ring.node(household_id)
+        db.flush()
+        engine = self.engines[name]
+        if engine is not self.directory:
+            source = db.connection(bind_arguments={"bind": self.directory})
+            with engine.begin() as target:
+                _sync(source, target, _identity_scopes(household_id, _user_ids(source, household_id)))
+        db.add(HouseholdShard(household_id=household_id, shard=name))
+        self._remember(household_id, name)
+        metrics.inc("shards.placed")
+        return name
+
+    def scalars_everywhere(self, stmt) -> list:
+        """`stmt` run on every database, the directory included, results concatenated."""
+        found = []
+        for engine in self.engines.values():
+            with engine.connect() as conn:
+                found.extend(conn.scalars(stmt))
+        return found
+
+    def fence(self, db: Session, household_id: uuid.UUID, name: str) -> None:
+        """Raise ShardMoved unless `household_id` still lives on `name`; keeps it there until `db` commits."""
+        conn = db.connection(bind_arguments={"bind": self.engines[name]})
+        try:
+            held = conn.scalar(_fence, {"household_id": household_id})
+        except OperationalError as err:
+            if getattr(err.orig, "sqlstate", None) != "55P03":  # lock_not_available: a move is cutting over
+                raise
+            held = None
+        if held is None or self.shard_of(household_id, fresh=True) != name:
+            self.forget(household_id)
+            metrics.inc("shards.fenced")
+            raise ShardMoved(household_id)
+
+
+class ShardedSession(Session):
+    """Session that sends directory-only statements to the directory and the rest
+    to the shard of the household the request acts for."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kw):
+        if bind is not None:
+            return bind
+        router: ShardRouter | None = self.info.get("shards")
+        if router is None:
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+        tables = _tables(mapper, clause)
+        if tables and tables <= GLOBAL_TABLES:
+            return router.directory
+        name = self._shard(router)
+        household_id = self.info["shard_household"]
+        if (
+            household_id is not None
+            and not self.info.get("fenced")
+            and (self._flushing or isinstance(clause, Insert | Update | Delete))
+        ):
+            # Before the transaction's first write: a write blocked behind a cutover would
+            # otherwise wake up to a household deleted from under it.
+            self.info["fenced"] = True
+            router.fence(self, household_id, name)
+        return router.engines[name]
+
+    def _shard(self, router: ShardRouter) -> str:
+        principal = (self.info.get("household_id"), self.info.get("user_id"))
+        if self.info.get("shard_principal") != principal:
+            household_id, user_id = principal
+            if household_id is None and user_id is not None:
+                household_id = router.household_of_user(user_id)
+            self.info["shard_household"] = household_id
+            self.info["shard"] = DEFAULT if household_id is None else router.shard_of(household_id)
+            self.info["shard_principal"] = principal
+        return self.info["shard"]
+
+
+@event.listens_for(ShardedSession, "after_transaction_end")
+def _unfence(session: ShardedSession, transaction) -> None:
+    if transaction.parent is None:
+        session.info.pop("fenced", None)
+
+
+_routers: dict[tuple, ShardRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_shard_router(settings: Settings) -> ShardRouter:
+    key = (
+        settings.database_url,
+        tuple(sorted(settings.database_shards.items())),
+        settings.shard_cache_seconds,
+        settings.db_prepare_threshold,
+    )
+    router = _routers.get(key)
+    if router is None:
+        with _routers_lock:
+            router = _routers.get(key)
+            if router is None:
+                shards = {
+                    name: get_engine(url, prepare_threshold=settings.db_prepare_threshold)
+                    for name, url in settings.database_shards.items()
+                }
+                router = _routers[key] = ShardRouter(
+                    make_engine(settings), shards, cache_seconds=settings.shard_cache_seconds
+                )
+                get_event_hub(settings).watch(router.on_change)
+    return router
+
+
+# -------------------------
+# Copying a household between databases
+# -------------------------
+
+
+def _user_ids(conn: Connection, household_id: uuid.UUID) -> list[uuid.UUID]:
+    """Members, plus anyone who attached a file to the household's renewals (attachments.created_by)."""
+    members = select(HouseholdMember.user_id).where(HouseholdMember.household_id == household_id)
+    creators = select(Attachment.created_by).where(
+        Attachment.created_by.is_not(None), _attachment_scope(household_id)
+    )
+    return list(conn.scalars(members.union(creators)))
+
+
+def _identity_scopes(household_id: uuid.UUID, user_ids: list[uuid.UUID]) -> list[tuple[Table, ColumnElement]]:
+    return [
+        (User.__table__, User.id.in_(user_ids)),
+        (Household.__table__, Household.id == household_id),
+        (HouseholdMember.__table__, HouseholdMember.household_id == household_id),
+    ]
+
+
+def _cars(household_id: uuid.UUID):
+    return select(Car.id).where(Car.household_id == household_id)
+
+
+def _archived_cars(household_id: uuid.UUID):
+    return select(CarArchive.id).where(CarArchive.household_id == household_id)
+
+
+def _attachment_scope(household_id: uuid.UUID) -> ColumnElement:
+    renewals = select(RenewalRecord.id).where(RenewalRecord.car_id.in_(_cars(household_id)))
+    archived = select(RenewalArchive.id).where(_renewal_archive_scope(household_id))
+    return or_(Attachment.renewal_id.in_(renewals), Attachment.renewal_id.in_(archived))
+
+
+def _renewal_archive_scope(household_id: uuid.UUID) -> ColumnElement:
+    return or_(
+        RenewalArchive.car_id.in_(_cars(household_id)), RenewalArchive.car_id.in_(_archived_cars(household_id))
+    )
+
+
+def _data_scopes(household_id: uuid.UUID) -> list[tuple[Table, ColumnElement]]:
+    """The household's rows per table, parents before children."""
+    return [
+        (Car.__table__, Car.household_id == household_id),
+        (RenewalRecord.__table__, RenewalRecord.car_id.in_(_cars(household_id))),
+        (CarArchive.__table__, CarArchive.household_id == household_id),
+        (RenewalArchive.__table__, _renewal_archive_scope(household_id)),
+        (Attachment.__table__, _attachment_scope(household_id)),
+    ]
+
+
+def _sync(source: Connection, target: Connection, scopes: list[tuple[Table, ColumnElement]]) -> int:
+    """Make the target's rows in each scope match the source's, by primary key. Returns rows written.
+
+    Deletes go children first, inserts and updates parents first, so foreign keys hold throughout.
+    """
+    plan = []
+    for table, where in scopes:
+        theirs = {r["id"]: dict(r) for r in source.execute(select(table).where(where)).mappings()}
+        ours = {r["id"]: dict(r) for r in target.execute(select(table).where(where)).mappings()}
+        stale = [i for i in ours if i not in theirs]
+        new = [r for i, r in theirs.items() if i not in ours]
+        changed = [r | {"_id": i} for i, r in theirs.items() if i in ours and r != ours[i]]
+        plan.append((table, stale, new, changed))
+    written = 0
+    for table, stale, _, _ in reversed(plan):
+        if stale:
+            target.execute(delete(table).where(table.c.id.in_(stale)))
+            written += len(stale)
+    for table, _, new, changed in plan:
+        if new:
+            target.execute(insert(table), new)
+        if changed:
+            # SET comes from the parameter names; _id only feeds the WHERE.
+            target.execute(update(table).where(table.c.id == bindparam("_id")), changed)
+        written += len(new) + len(changed)
+    return written
+
+
+_AUDIT_COLUMNS = {
+    AuditLog.__table__: [c.name for c in AuditLog.__table__.columns if c.name != "id"],
+    AuditOutbox.__table__: [c.name for c in AuditOutbox.__table__.columns if c.name != "id"],
+}
+
+
+def _copy_audit(
+    source: Connection, target: Connection, table: Table, household_id: uuid.UUID, *, skip: set[int]
+) -> set[int]:
+    """Append the source's audit rows for the household (bar `skip`) to the target, with new ids.
+
+    Returns the source ids copied.
+    """
+    columns = _AUDIT_COLUMNS[table]
+    rows = source.execute(
+        select(table.c.id, *(table.c[name] for name in columns)).where(table.c.household_id == household_id)
+    ).mappings()
+    copied: set[int] = set()
+    values = []
+    for row in rows:
+        if row["id"] not in skip:
+            copied.add(row["id"])
+            values.append({name: row[name] for name in columns})
+    if values:
+        target.execute(insert(table), values)
+    return copied
+
+
+def _purge(conn: Connection, household_id: uuid.UUID, user_ids: list[uuid.UUID], *, identity: bool) -> None:
+    """Delete the household's rows (and, off the directory, its identity rows) from a source shard."""
+    conn.execute(delete(AuditOutbox).where(AuditOutbox.household_id == household_id))
+    conn.execute(delete(AuditLog).where(AuditLog.household_id == household_id))
+    for table, where in reversed(_data_scopes(household_id)):
+        conn.execute(delete(table).where(where))
+    if not identity:
+        return
+    conn.execute(delete(HouseholdMember).where(HouseholdMember.household_id == household_id))
+    conn.execute(delete(Household).where(Household.id == household_id))
+    still_member = exists().where(HouseholdMember.user_id == User.id)
+    conn.execute(delete(User).where(User.id.in_(user_ids), ~still_member))
+
+
+def _flip(conn: Connection, household_id: uuid.UUID, target: str) -> None:
+    """Point the directory at the target and tell every worker, on commit."""
+    stmt = pg_insert(HouseholdShard.__table__).values(household_id=household_id, shard=target)
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[HouseholdShard.household_id], set_={"shard": target, "updated_at": func.now()}
+        )
+    )
+    payload = {"household_id": str(household_id), "entity": "household", "id": str(household_id), "op": "move"}
+    conn.execute(select(func.pg_notify(CHANNEL, json.dumps(payload))))
+
+
+def move(router: ShardRouter, household_id: uuid.UUID, target: str, *, lock_timeout_ms: int = 5_000) -> dict:
+    """Move a household's data to `target` while it stays in use (see the module docstring).
+
+    Returns what it did: the shards and the rows written in each step.
+    """
+    if target not in router.engines:
+        raise ValueError(f"Unknown shard {target!r} (expected one of {sorted(router.engines)})")
+    with router.directory.connect() as conn:
+        if conn.scalar(select(Household.id).where(Household.id == household_id)) is None:
+            raise LookupError(f"No household {household_id}")
+    source = router.shard_of(household_id, fresh=True)
+    if source == target:
+        return {"source": source, "target": target, "copied": 0, "synced": 0}
+    src_engine, dst_engine = router.engines[source], router.engines[target]
+    from_directory = src_engine is router.directory
+
+    # 1. Bulk copy, no locks held on the source.
+    with src_engine.connect() as src, dst_engine.begin() as dst:
+        user_ids = _user_ids(src, household_id)
+        # Leftovers of an earlier attempt: audit rows can't be matched by id.
+        for table in (AuditOutbox.__table__, AuditLog.__table__):
+            dst.execute(delete(table).where(table.c.household_id == household_id))
+        copied = _sync(src, dst, _identity_scopes(household_id, user_ids) + _data_scopes(household_id))
+        logged = _copy_audit(src, dst, AuditLog.__table__, household_id, skip=set())
+
+    # 2. Cutover: writers wait (or are fenced) from here to the source commit.
+    with src_engine.connect() as src, src.begin():
+        src.execute(text(f"SET LOCAL lock_timeout = {int(lock_timeout_ms)}"))
+        src.execute(select(Household.id).where(Household.id == household_id).with_for_update())
+        src.execute(select(Car.id).where(Car.household_id == household_id).with_for_update())
+        src.execute(
+            select(RenewalRecord.id).where(RenewalRecord.car_id.in_(_cars(household_id))).with_for_update()
+        )
+        # Locked entries are skipped by the audit shipper, so none move to audit_log behind our back.
+        src.execute(select(AuditOutbox.id).where(AuditOutbox.household_id == household_id).with_for_update())
+        user_ids = _user_ids(src, household_id)
+        with dst_engine.begin() as dst:
+            synced = _sync(src, dst, _identity_scopes(household_id, user_ids) + _data_scopes(household_id))
+            synced += len(_copy_audit(src, dst, AuditLog.__table__, household_id, skip=logged))
+            synced += len(_copy_audit(src, dst, AuditOutbox.__table__, household_id, skip=set()))
+        if from_directory:
+            _flip(src, household_id, target)  # commits with the purge
+        else:
+            with router.directory.begin() as directory:
+                _flip(directory, household_id, target)
+        # The directory keeps every identity row, whichever shard the household is on.
+        _purge(src, household_id, user_ids, identity=not from_directory)
+    router.forget(household_id)
+    metrics.inc("shards.moves")
+    return {"source": source, "target": target, "copied": copied, "synced": synced}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.shards")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    run = sub.add_parser("move")
+    run.add_argument("household_id", type=uuid.UUID)
+    run.add_argument("shard")
+    args = parser.parse_args()
+
+    load_dotenv()
+    settings = Settings.from_env()
+    if not settings.database_shards:
+        parser.error("DATABASE_SHARDS is not set")
+    router = get_shard_router(settings)
+    if args.cmd == "list":
+        with router.directory.connect() as conn:
+            counts = dict(
+                conn.execute(
+                    select(func.coalesce(HouseholdShard.shard, DEFAULT), func.count())
+                    .select_from(Household)
+                    .outerjoin(HouseholdShard, HouseholdShard.household_id == Household.id)
+                    .group_by(1)
+                ).all()
+            )
+        for name in router.engines:
+            print(f"{name:<16} {counts.get(name, 0):>10} households")
+        return
+    t0 = time.perf_counter()
+    result = move(router, args.household_id, args.shard)
+    print(
+        f"moved {args.household_id} from {result['source']} to {result['target']}: "
+        f"{result['copied']} rows copied, {result['synced']} synced at cutover, "
+        f"{time.perf_counter() - t0:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
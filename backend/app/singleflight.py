@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.config import Settings
+from app.metrics import metrics
+from app.redis_store import redis_client
+
+
+@dataclass
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: BaseException | None = None
+
+
+class SingleFlight:
+    """Coalesce identical concurrent computations within one process.
+
+    The first caller for a key runs `fn`; callers that arrive while it runs
+    wait for it and get the same result (or exception). Nothing is cached
+    afterwards: the next caller after completion computes afresh. A waiter
+    that gives up after `timeout` seconds computes on its own.
+    """
+
+    def __init__(self, name: str, *, timeout: float = 5.0) -> None:
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        *,
+        dumps: Callable[[Any], bytes] | None = None,
+        loads: Callable[[bytes], Any] | None = None,
+    ) -> Any:
+        """Run `fn` once per key at a time. `dumps`/`loads` are only used across workers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.timeout):
+                metrics.inc(f"singleflight.{self.name}.coalesced")
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            metrics.inc(f"singleflight.{self.name}.timeouts")
+            return fn()
+
+        metrics.inc(f"singleflight.{self.name}.leaders")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+# Delete the lock only if we still own it; it may have expired and been taken over.
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisSingleFlight(SingleFlight):
+    """SingleFlight across workers: in-process first, then a Redis lock.
+
+    The process-local leader takes a short Redis lock for the key. If another
+    worker holds it, we poll for the result that worker publishes (kept for
+    `result_ttl` seconds) instead of computing. Results cross the wire, so
+    the caller supplies `dumps`/`loads`. If Redis misbehaves or the wait
+    times out, we compute locally.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        *,
+        timeout: float = 5.0,
+        result_ttl: float = 2.0,
+        poll_interval: float = 0.02,
+        prefix: str = "cartrack:sf:",
+    ) -> None:
+        super().__init__(name, timeout=timeout)
+        self._redis = redis_client(url)
+        self._release_script = self._redis.register_script(_RELEASE_LUA)
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._prefix = f"{prefix}{name}:"
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        *,
+        dumps: Callable[[Any], bytes] | None = None,
+        loads: Callable[[bytes], Any] | None = None,
+    ) -> Any:
+        if dumps is None or loads is None:
+            return super().do(key, fn)
+        return super().do(key, lambda: self._across_workers(key, fn, dumps, loads))
+
+    def _across_workers(self, key: str, fn, dumps, loads) -> Any:
+        lock_key, result_key = self._prefix + "lock:" + key, self._prefix + "result:" + key
+        token = uuid.uuid4().hex
+        try:
+            acquired = self._redis.set(lock_key, token, nx=True, px=int(self.timeout * 1000))
+            if acquired:
+                # A result left by an earlier leader is stale for callers waiting on us.
+                self._redis.delete(result_key)
+        except Exception:
+            metrics.inc(f"singleflight.{self.name}.redis_errors")
+            return fn()
+
+        if acquired:
+            try:
+                result = fn()
+                try:
+                    self._redis.set(result_key, dumps(result), px=int(self.result_ttl * 1000))
+                except Exception:
+                    metrics.inc(f"singleflight.{self.name}.redis_errors")
+                return result
+            finally:
+                self._release(lock_key, token)
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                raw = self._redis.get(result_key)
+                if raw is None and not self._redis.exists(lock_key):
+                    # Released since we looked: either just published, or the
+                    # other worker failed without a result.
+                    raw = self._redis.get(result_key)
+                    if raw is None:
+                        return fn()
+            except Exception:
+                metrics.inc(f"singleflight.{self.name}.redis_errors")
+                return fn()
+            if raw is not None:
+                metrics.inc(f"singleflight.{self.name}.coalesced_remote")
+                return loads(raw)
+            if time.monotonic() >= deadline:
+                metrics.inc(f"singleflight.{self.name}.timeouts")
+                return fn()
+            time.sleep(self.poll_interval)
+
+    def _release(self, lock_key: str, token: str) -> None:
+        try:
+            self._release_script(keys=[lock_key], args=[token])
+        except Exception:
+            metrics.inc(f"singleflight.{self.name}.redis_errors")
+
+
+_flights: dict[tuple, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+
+def get_singleflight(settings: Settings, name: str) -> SingleFlight:
+    """One coalescing group per name and configuration, shared across requests."""
+    key = (name, settings.redis_url, settings.singleflight_timeout_seconds)
+    flight = _flights.get(key)
+    if flight is None:
+        with _flights_lock:
+            flight = _flights.get(key)
+            if flight is None:
+                timeout = settings.singleflight_timeout_seconds
+                if settings.redis_url:
+                    flight = RedisSingleFlight(name, settings.redis_url, timeout=timeout)
+                else:
+                    flight = SingleFlight(name, timeout=timeout)
+                _flights[key] = flight
+    return flight
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.enums import RenewalKind
+from app.models import Car, RenewalRecord
+
+# Column layout (one slot per renewal row):
+#   car     int32  index into RenewalSnapshot.car_ids
+#   kind    int8   index into _KINDS
+#   start   int32  valid_from as a proleptic ordinal (date.toordinal())
+#   end     int32  valid_to as an ordinal
+#   cost    int32  cost_pence, NO_COST when NULL
+#   live    bool   False for soft-deleted rows
+# plus, per car code, whether the car is archived (RenewalSnapshot._archived).
+_KINDS: tuple[RenewalKind, ...] = tuple(RenewalKind)
+_KIND_CODE = {k: i for i, k in enumerate(_KINDS)}
+NO_COST = -1
+
+# updated_at is written client-side, so concurrent writers can commit slightly
+# out of order. Re-read a small overlap on every refresh; applying a row twice
+# is harmless.
+_REFRESH_OVERLAP = timedelta(seconds=5)
+
+_LOAD_COLUMNS = (
+    RenewalRecord.id,
+    RenewalRecord.car_id,
+    RenewalRecord.kind,
+    RenewalRecord.valid_from,
+    RenewalRecord.valid_to,
+    RenewalRecord.cost_pence,
+    RenewalRecord.is_deleted,
+    RenewalRecord.updated_at,
+)
+_CAR_COLUMNS = (Car.id, Car.is_archived, Car.updated_at)
+
+
+@dataclass(frozen=True)
+class DueCounts:
+    due: int
+    overdue: int
+
+
+class RenewalSnapshot:
+    """Read-only, array-backed copy of renewal state for fleet-wide scans.
+
+    Loads only the columns needed for windowed questions into NumPy arrays
+    and answers them with vectorized operations, instead of hydrating one
+    RenewalRecord per row. Call refresh() to pull rows changed since the last
+    load (by updated_at), cars archived or restored included. Hard deletes are
+    not observed; call load() to rebuild.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._n = 0
+        self._car = np.empty(0, dtype=np.int32)
+        self._kind = np.empty(0, dtype=np.int8)
+        self._start = np.empty(0, dtype=np.int32)
+        self._end = np.empty(0, dtype=np.int32)
+        self._cost = np.empty(0, dtype=np.int32)
+        self._live = np.empty(0, dtype=np.bool_)
+
+        self._row_of: dict[int, int] = {}  # renewal uuid.int -> row
+        self.car_ids: list[uuid.UUID] = []
+        self._car_code: dict[uuid.UUID, int] = {}
+        self._archived = np.zeros(0, dtype=np.bool_)  # by car code; cars seen since may be missing
+
+        self._cover: tuple[int, np.ndarray, np.ndarray] | None = None  # (day, current, lapsed), cached
+        self.watermark: datetime | None = None
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the populated part of the columns (excludes the id index)."""
+        per_row = sum(a.itemsize for a in (self._car, self._kind, self._start, self._end, self._cost, self._live))
+        return per_row * self._n
+
+    # -------------------------
+    # loading
+    # -------------------------
+
+    def load(self, db: Session) -> int:
+        """Full (re)load. Returns the number of renewal rows in the snapshot."""
+        with self._lock:
+            self._reset()
+        return self._apply(db, since=None)
+
+    def refresh(self, db: Session) -> int:
+        """Apply rows changed since the last load/refresh. Returns renewal rows applied."""
+        if self.watermark is None:
+            return self.load(db)
+        return self._apply(db, since=self.watermark - _REFRESH_OVERLAP)
+
+    def _apply(self, db: Session, *, since: datetime | None) -> int:
+        cars = select(*_CAR_COLUMNS)
+        if since is not None:
+            cars = cars.where(Car.updated_at >= since)
+        for chunk in db.execute(cars.execution_options(yield_per=50_000)).partitions():
+            with self._lock:
+                self._apply_cars(chunk)
+
+        stmt = select(*_LOAD_COLUMNS)
+        if since is not None:
+            stmt = stmt.where(RenewalRecord.updated_at >= since)
+
+        applied = 0
+        # Stream in chunks so a full load never holds every Row tuple at once.
+        result = db.execute(stmt.execution_options(yield_per=50_000))
+        for chunk in result.partitions():
+            with self._lock:
+                self._apply_chunk(chunk)
+            applied += len(chunk)
+        return applied
+
+    def _apply_chunk(self, rows) -> None:
+        ids, car_ids, kinds, starts, ends, costs, deleted, updated = zip(*rows, strict=True)
+        self._reserve(self._n + len(ids))
+
+        idx = np.fromiter((self._slot(rid.int) for rid in ids), dtype=np.int64, count=len(ids))
+        self._car[idx] = [self._code(c) for c in car_ids]
+        self._kind[idx] = [_KIND_CODE[k] for k in kinds]
+        self._start[idx] = [d.toordinal() for d in starts]
+        self._end[idx] = [d.toordinal() for d in ends]
+        self._cost[idx] = [NO_COST if c is None else c for c in costs]
+        self._live[idx] = np.logical_not(deleted)
+
+        self._advance(max(updated))
+        self._cover = None
+
+    def _apply_cars(self, rows) -> None:
+        car_ids, archived, updated = zip(*rows, strict=True)
+        codes = [self._code(c) for c in car_ids]
+        if len(self._archived) < len(self.car_ids):
+            grown = np.zeros(max(len(self.car_ids), len(self._archived) * 2), dtype=np.bool_)
+            grown[: len(self._archived)] = self._archived
+            self._archived = grown
+        self._archived[codes] = archived
+        self._advance(max(updated))
+        self._cover = None  # new cars add rows to it
+
+    def _advance(self, newest: datetime) -> None:
+        if self.watermark is None or newest > self.watermark:
+            self.watermark = newest
+
+    def _slot(self, key: int) -> int:
+        i = self._row_of.get(key)
+        if i is None:
+            i = self._row_of[key] = self._n
+            self._n += 1
+        return i
+
+    def _code(self, car_id: uuid.UUID) -> int:
+        code = self._car_code.get(car_id)
+        if code is None:
+            code = self._car_code[car_id] = len(self.car_ids)
+            self.car_ids.append(car_id)
+        return code
+
+    def _reserve(self, n: int) -> None:
+        cap = len(self._car)
+        if n <= cap:
+            return
+        cap = max(n, cap * 2, 1024)
+        for name in ("_car", "_kind", "_start", "_end", "_cost", "_live"):
+            old = getattr(self, name)
+            new = np.zeros(cap, dtype=old.dtype)
+            new[: self._n] = old[: self._n]
+            setattr(self, name, new)
+
+    # -------------------------
+    # queries
+    # -------------------------
+
+    def _kind_mask(self, kind: RenewalKind | None) -> np.ndarray:
+        live = self._live[: self._n]
+        if kind is None:
+            return live
+        return live & (self._kind[: self._n] == _KIND_CODE[kind])
+
+    def _cover_on(self, t: int) -> tuple[np.ndarray, np.ndarray]:
+        """Per (car, kind), shape (cars, kinds), -1 where none: the latest valid_to of live
+        cover current on day `t` (valid_from <= t <= valid_to), and of cover lapsed before it."""
+        if self._cover is None or self._cover[0] != t:
+            n, size = self._n, len(self.car_ids) * len(_KINDS)
+            live, start, end = self._live[:n], self._start[:n], self._end[:n]
+            keys = self._car[:n].astype(np.int64) * len(_KINDS) + self._kind[:n]
+            covers = []
+            for mask in (live & (start <= t) & (end >= t), live & (end < t)):
+                latest = np.full(size, -1, dtype=np.int32)
+                np.maximum.at(latest, keys[mask], end[mask])
+                covers.append(latest.reshape(len(self.car_ids), len(_KINDS)))
+            self._cover = (t, *covers)
+        return self._cover[1], self._cover[2]
+
+    def due_counts(self, *, today: date, days: int, kind: RenewalKind | None = None) -> DueCounts:
+        """Count (car, kind) pairs whose current cover ends within `days`, or that have
+        no current cover and a lapsed one.
+
+        Mirrors upcoming_renewals: archived cars are left out, cover booked to
+        start after `today` is ignored, and only the most recent record per car
+        and kind counts.
+        """
+        with self._lock:
+            current, lapsed = self._cover_on(today.toordinal())
+            archived = self._archived[: len(self.car_ids)]
+            active = np.ones(len(self.car_ids), dtype=np.bool_)
+            active[: len(archived)] = ~archived
+        current, lapsed = current[active], lapsed[active]
+        if kind is not None:
+            current, lapsed = current[:, _KIND_CODE[kind]], lapsed[:, _KIND_CODE[kind]]
+        t = today.toordinal()
+        due = (current >= 0) & (current <= t + days)
+        overdue = (current < 0) & (lapsed >= 0)
+        return DueCounts(due=int(np.count_nonzero(due)), overdue=int(np.count_nonzero(overdue)))
+
+    def cars_expiring(self, *, today: date, days: int, kind: RenewalKind) -> int:
+        """Number of distinct cars whose current `kind` cover ends in [today, today + days]."""
+        return self.due_counts(today=today, days=days, kind=kind).due
+
+    def cost_sum(self, *, start: date, end: date, kind: RenewalKind | None = None) -> int:
+        """Total cost_pence of live records whose valid_from falls in [start, end]."""
+        with self._lock:
+            n = self._n
+            s = self._start[:n]
+            mask = self._kind_mask(kind) & (s >= start.toordinal()) & (s <= end.toordinal())
+            cost = self._cost[:n][mask]
+        return int(cost[cost != NO_COST].sum(dtype=np.int64))
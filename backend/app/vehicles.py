@@ -0,0 +1,460 @@
+"""Vehicle data lookups: make, model, MOT expiry and tax due date by registration.
+
+A VehicleDataProvider answers a batch of registration numbers. Built in:
+
+  stub   deterministic made-up data (development and tests; never in production)
+  dvla   the DVLA Vehicle Enquiry Service (VEHICLE_DATA_API_KEY); one registration
+         per call, and it has no model
+  ""     lookups are off (the endpoints return 503)
+
+Others can be added with register_provider().
+
+VehicleLookups sits in front of the provider:
+
+- Answers, including "not found", are cached in vehicle_lookups for
+  VEHICLE_DATA_TTL_HOURS. The cache is shared by every household: it holds
+  registry data, not anything a user typed.
+- Misses are split into provider-sized batches. The batches run on a small
+  per-worker thread pool, so at most VEHICLE_DATA_CONCURRENCY calls are in
+  flight whatever the number of requests.
+- Transient failures are retried with jittered exponential backoff.
+- After VEHICLE_DATA_BREAKER_FAILURES batches fail in a row, a circuit breaker
+  fails lookups fast for VEHICLE_DATA_BREAKER_RESET_SECONDS. Then one trial
+  batch goes through and decides whether it closes. A request the provider
+  refuses as malformed (a bad registration) answers that the provider is up,
+  so it never counts toward opening the breaker.
+
+Registrations that could not be looked up come back as unavailable and
+are not cached. Counters (GET /metrics): vehicles.cache.hits/misses,
+vehicles.provider.calls/ms/errors/retries and vehicles.breaker.opened/rejected.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import date, timedelta
+from typing import Protocol
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.config import Settings
+from app.metrics import metrics
+from app.models import VehicleLookup
+from app.schemas import normalize_registration
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class VehicleData:
+    make: str | None = None
+    model: str | None = None
+    mot_expiry: date | None = None
+    tax_due: date | None = None
+
+    def to_json(self) -> dict:
+        return {k: v.isoformat() if isinstance(v, date) else v for k, v in asdict(self).items()}
+
+    @classmethod
+    def from_json(cls, data: dict) -> VehicleData:
+        def day(v: str | None) -> date | None:
+            return date.fromisoformat(v) if v else None
+
+        return cls(
+            make=data.get("make"),
+            model=data.get("model"),
+            mot_expiry=day(data.get("mot_expiry")),
+            tax_due=day(data.get("tax_due")),
+        )
+
+
+class ProviderError(Exception):
+    """A lookup failed. `retryable` is False for errors a retry won't fix (bad key, bad request).
+
+    `bad_request` marks a request refused for what it asked (a malformed
+    registration): the provider itself is fine, so the breaker ignores it.
+    """
+
+    def __init__(self, message: str, *, retryable: bool = True, bad_request: bool = False) -> None:
+        super().__init__(message)
+        self.retryable = retryable and not bad_request
+        self.bad_request = bad_request
+
+
+class VehicleDataProvider(Protocol):
+    name: str
+    # Most registrations one lookup() call accepts.
+    batch_size: int
+
+    def lookup(self, registrations: list[str]) -> dict[str, VehicleData | None]:
+        """Data for each registration (None: no such vehicle). Raises ProviderError."""
+        ...
+
+
+# -------------------------
+# Providers
+# -------------------------
+
+
+_STUB_MAKES = ("Ford", "Vauxhall", "Volkswagen", "Toyota", "BMW", "Audi", "Nissan", "Kia")
+_STUB_MODELS = ("Fiesta", "Corsa", "Golf", "Yaris", "3 Series", "A3", "Qashqai", "Sportage")
+
+
+class StubProvider:
+    """Made-up but stable data for any registration, or exactly `vehicles` if given.
+
+    In `vehicles`, None means "no such vehicle". `latency` seconds are slept per call.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        vehicles: dict[str, VehicleData | None] | None = None,
+        *,
+        batch_size: int = 50,
+        latency: float = 0.0,
+    ) -> None:
+        self.vehicles = vehicles
+        self.batch_size = batch_size
+        self.latency = latency
+
+    def lookup(self, registrations: list[str]) -> dict[str, VehicleData | None]:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.vehicles is not None:
+            return {r: self.vehicles.get(r) for r in registrations}
+        return {r: self._made_up(r) for r in registrations}
+
+    @staticmethod
+    def _made_up(registration: str) -> VehicleData:
+        h = int.from_bytes(hashlib.sha256(registration.encode()).digest()[:8], "big")
+        today = date.today()
+        return VehicleData(
+            make=_STUB_MAKES[h % len(_STUB_MAKES)],
+            model=_STUB_MODELS[(h >> 8) % len(_STUB_MODELS)],
+            mot_expiry=today + timedelta(days=(h >> 16) % 365),
+            tax_due=(today.replace(day=1) + timedelta(days=32 * (1 + (h >> 24) % 11))).replace(day=1),
+        )
+
+
+class DvlaProvider:
+    """The DVLA Vehicle Enquiry Service (one registration per request)."""
+
+    name = "dvla"
+    batch_size = 1
+    url = "https://driver-vehicle-licensing.api.gov.uk/vehicle-enquiry/v1/vehicles"
+
+    def __init__(self, api_key: str, *, timeout: float = 5.0) -> None:
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def lookup(self, registrations: list[str]) -> dict[str, VehicleData | None]:
+        return {r: self._one(r) for r in registrations}
+
+    def _one(self, registration: str) -> VehicleData | None:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"registrationNumber": registration.replace(" ", "")}).encode(),
+            headers={"x-api-key": self.api_key, "Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.load(response)
+        except urllib.error.HTTPError as err:
+            if err.code == 404:
+                return None
+            raise ProviderError(
+                f"DVLA returned {err.code}",
+                retryable=err.code == 429 or err.code >= 500,
+                bad_request=err.code in (400, 422),
+            ) from err
+        except (OSError, ValueError) as err:  # URLError, timeouts, a garbled body
+            raise ProviderError(f"DVLA request failed: {err}") from err
+
+        def day(v: str | None) -> date | None:
+            return date.fromisoformat(v) if v else None
+
+        try:
+            make = body.get("make")
+            return VehicleData(
+                make=make.title() if make else None,
+                mot_expiry=day(body.get("motExpiryDate")),
+                tax_due=day(body.get("taxDueDate")),
+            )
+        except (AttributeError, TypeError, ValueError) as err:  # not the shape we expect
+            raise ProviderError(f"DVLA sent an unexpected body: {err}", retryable=False) from err
+
+
+def _stub(settings: Settings) -> VehicleDataProvider:
+    return StubProvider()
+
+
+def _dvla(settings: Settings) -> VehicleDataProvider:
+    if not settings.vehicle_data_api_key:
+        raise RuntimeError("VEHICLE_DATA_PROVIDER=dvla needs VEHICLE_DATA_API_KEY")
+    return DvlaProvider(settings.vehicle_data_api_key)
+
+
+_PROVIDERS: dict[str, Callable[[Settings], VehicleDataProvider]] = {"stub": _stub, "dvla": _dvla}
+
+
+def register_provider(name: str, factory: Callable[[Settings], VehicleDataProvider]) -> None:
+    """Make VEHICLE_DATA_PROVIDER=`name` build its provider with `factory(settings)`."""
+    _PROVIDERS[name] = factory
+
+
+# -------------------------
+# Circuit breaker
+# -------------------------
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failures; after `reset_seconds` lets one trial call through."""
+
+    def __init__(self, *, failures: int, reset_seconds: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failed = 0
+        self._opened_at: float | None = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._clock() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or self._clock() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial = True
+            return True
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self._failed = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failed(self) -> None:
+        with self._lock:
+            self._failed += 1
+            if self._trial or (self._opened_at is None and self.failures > 0 and self._failed >= self.failures):
+                self._opened_at = self._clock()
+                metrics.inc("vehicles.breaker.opened")
+            self._trial = False
+
+
+# -------------------------
+# Cached, batched lookups
+# -------------------------
+
+
+@dataclass
+class LookupResult:
+    found: dict[str, VehicleData] = field(default_factory=dict)
+    not_found: set[str] = field(default_factory=set)
+    # Provider failing or breaker open: try again later.
+    unavailable: set[str] = field(default_factory=set)
+
+
+class VehicleLookups:
+    def __init__(
+        self,
+        provider: VehicleDataProvider,
+        *,
+        ttl: timedelta,
+        concurrency: int = 4,
+        retries: int = 2,
+        backoff_seconds: float = 0.2,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.provider = provider
+        self.ttl = ttl
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker or CircuitBreaker(failures=5, reset_seconds=30)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="cartrack-vehicles")
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def lookup(self, db: Session, registrations: Iterable[str]) -> LookupResult:
+        """Look up each registration, from the cache where fresh, and cache the fresh answers.
+
+        Commits `db` when anything has to be fetched: once before the provider
+        calls, so no transaction sits idle in the database while they run, and
+        again after storing the answers in a short transaction of their own.
+        """
+        wanted = sorted({normalize_registration(r) for r in registrations})
+        result = LookupResult()
+        if not wanted:
+            return result
+
+        cached = db.execute(
+            select(VehicleLookup.registration_number, VehicleLookup.data).where(
+                VehicleLookup.provider == self.provider.name,
+                VehicleLookup.registration_number.in_(wanted),
+                VehicleLookup.expires_at > func.now(),
+            )
+        ).all()
+        for registration, data in cached:
+            self._record(result, registration, None if data is None else VehicleData.from_json(data))
+        misses = [r for r in wanted if r not in result.found and r not in result.not_found]
+        metrics.inc("vehicles.cache.hits", len(cached))
+        metrics.inc("vehicles.cache.misses", len(misses))
+        if not misses:
+            return result
+        db.commit()
+
+        size = max(1, self.provider.batch_size)
+        batches = [misses[i : i + size] for i in range(0, len(misses), size)]
+        fetched: dict[str, VehicleData | None] = {}
+        for batch, answers in zip(batches, self._pool.map(self._fetch, batches), strict=True):
+            if answers is None:
+                result.unavailable.update(batch)
+                continue
+            for registration in batch:
+                fetched[registration] = answers.get(registration)
+                self._record(result, registration, fetched[registration])
+        if fetched:
+            self._store(db, fetched)
+            db.commit()
+        return result
+
+    @staticmethod
+    def _record(result: LookupResult, registration: str, data: VehicleData | None) -> None:
+        if data is None:
+            result.not_found.add(registration)
+        else:
+            result.found[registration] = data
+
+    def _fetch(self, batch: list[str]) -> dict[str, VehicleData | None] | None:
+        """One batch through the breaker, with retries; None if it could not be looked up."""
+        if not self.breaker.allow():
+            metrics.inc("vehicles.breaker.rejected")
+            return None
+        for attempt in range(self.retries + 1):
+            t0 = time.monotonic()
+            try:
+                answers, error = self.provider.lookup(batch), None
+            except ProviderError as err:
+                answers, error = None, err
+            except Exception as err:  # a provider bug must still settle the breaker's trial
+                log.exception("vehicle data provider %s failed", self.provider.name)
+                answers, error = None, ProviderError(f"{type(err).__name__}: {err}", retryable=False)
+            metrics.inc("vehicles.provider.calls")
+            metrics.inc("vehicles.provider.ms", int((time.monotonic() - t0) * 1000))
+            if error is None:
+                self.breaker.succeeded()
+                return answers
+            metrics.inc("vehicles.provider.errors")
+            if error.bad_request:
+                self.breaker.succeeded()  # it answered; the batch just can't be looked up
+                return None
+            if not error.retryable or attempt == self.retries:
+                break
+            metrics.inc("vehicles.provider.retries")
+            time.sleep(self.backoff_seconds * 2**attempt * random.uniform(0.5, 1.5))
+        self.breaker.failed()
+        return None
+
+    def _store(self, db: Session, fetched: dict[str, VehicleData | None]) -> None:
+        stmt = insert(VehicleLookup).values(
+            [
+                {
+                    "provider": self.provider.name,
+                    "registration_number": registration,
+                    "data": None if data is None else data.to_json(),
+                    "fetched_at": func.now(),
+                    "expires_at": func.now() + self.ttl,
+                }
+                for registration, data in fetched.items()
+            ]
+        )
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[VehicleLookup.provider, VehicleLookup.registration_number],
+                set_={c: stmt.excluded[c] for c in ("data", "fetched_at", "expires_at")},
+            )
+        )
+
+
+_lookups: dict[tuple, VehicleLookups] = {}
+_lookups_lock = threading.Lock()
+
+
+def get_vehicle_lookups(settings: Settings) -> VehicleLookups | None:
+    """This worker's lookup for the configured provider, or None if lookups are off."""
+    name = settings.vehicle_data_provider
+    if not name:
+        return None
+    key = (
+        name,
+        settings.vehicle_data_api_key,
+        settings.vehicle_data_ttl_hours,
+        settings.vehicle_data_concurrency,
+        settings.vehicle_data_retries,
+        settings.vehicle_data_breaker_failures,
+        settings.vehicle_data_breaker_reset_seconds,
+    )
+    lookup = _lookups.get(key)
+    if lookup is None:
+        with _lookups_lock:
+            lookup = _lookups.get(key)
+            if lookup is None:
+                factory = _PROVIDERS.get(name)
+                if factory is None:
+                    raise RuntimeError(f"Unknown VEHICLE_DATA_PROVIDER: {name}")
+                lookup = _lookups[key] = VehicleLookups(
+                    factory(settings),
+                    ttl=timedelta(hours=settings.vehicle_data_ttl_hours),
+                    concurrency=settings.vehicle_data_concurrency,
+                    retries=settings.vehicle_data_retries,
+                    breaker=CircuitBreaker(
+                        failures=settings.vehicle_data_breaker_failures,
+                        reset_seconds=settings.vehicle_data_breaker_reset_seconds,
+                    ),
+                )
+    return lookup
+
+
+def close_vehicle_lookups() -> None:
+    with _lookups_lock:
+        for lookup in _lookups.values():
+            lookup.close()
+        _lookups.clear()
+
+
+# -------------------------
+# Suggestions
+# -------------------------
+
+
+def suggested_cover(expiry: date, today: date) -> tuple[date, date]:
+    """(valid_from, valid_to) for a year of cover ending on `expiry`, starting no later than today."""
+    try:
+        start = expiry.replace(year=expiry.year - 1) + timedelta(days=1)
+    except ValueError:  # 29 February
+        start = expiry - timedelta(days=364)
+    return min(start, today), expiry
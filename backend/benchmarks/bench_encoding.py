@@ -0,0 +1,127 @@
+"""Bytes on the wire and CPU cost of the response encodings.
+
+Builds renewal histories of several sizes (with long `notes`, the case
+that hurts on mobile), serializes them the way FastAPI does, and for JSON
+and MessagePack x identity/gzip/br/zstd reports the body size and the CPU
+time per response to encode (and, for reference, for the client to decode).
+No database needed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_encoding --rows 10 100 1000 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import random
+import time
+import uuid
+import zlib
+from datetime import UTC, date, datetime, timedelta
+
+from pydantic import TypeAdapter
+
+from app.encoding import available_encodings, compress
+from app.enums import RenewalKind
+from app.schemas import RenewalOut
+
+_renewals = TypeAdapter(list[RenewalOut])
+
+_ADVISORIES = [
+    "Nearside front tyre worn close to the legal limit.",
+    "Brake pipes corroded, covered in grease or other material.",
+    "Oil leak, but not excessive.",
+    "Offside rear suspension arm pin or bush worn.",
+    "Windscreen damaged but not adversely affecting the driver's view.",
+    "Exhaust has a minor leak of exhaust gases.",
+]
+
+
+def _history(n: int) -> bytes:
+    rng = random.Random(n)
+    now = datetime.now(UTC)
+    car_id = uuid.uuid4()
+    rows = []
+    for i in range(n):
+        valid_from = date.today() - timedelta(days=365 * (i // 3 % 50))
+        rows.append(
+            RenewalOut(
+                id=uuid.uuid4(),
+                car_id=car_id,
+                kind=list(RenewalKind)[i % 3],
+                valid_from=valid_from,
+                valid_to=valid_from + timedelta(days=364),
+                provider=f"Provider {rng.randrange(13)}",
+                reference=f"REF-{rng.getrandbits(32):08X}",
+                cost_pence=rng.randrange(10_000, 100_000),
+                notes=" ".join(rng.choices(_ADVISORIES, k=rng.randrange(2, 8))),
+                is_deleted=False,
+                created_at=now,
+                updated_at=now,
+            )
+        )
+    return _renewals.dump_json(rows)  # what FastAPI sends for response_model=list[RenewalOut]
+
+
+def _cpu_ms(fn, repeat: int) -> float:
+    t0 = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - t0) * 1000 / repeat
+
+
+def _decompress(encoding: str, data: bytes) -> bytes:
+    if encoding == "gzip":
+        return zlib.decompress(data, 31)
+    if encoding == "br":
+        import brotli
+
+        return brotli.decompress(data)
+    from compression import zstd
+
+    return zstd.decompress(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    formats = ["json"]
+    if importlib.util.find_spec("msgpack"):
+        import msgpack
+
+        formats.append("msgpack")
+    else:
+        print("msgpack not installed: JSON only")
+    encodings = ["identity", *reversed(available_encodings())]
+    print(f"encodings: {', '.join(encodings)}")
+    print(f"{'rows':>6} {'format':<8} {'encoding':<9} {'bytes':>10} {'ratio':>6} {'encode ms':>10} {'decode ms':>10}")
+
+    for n in args.rows:
+        body = _history(n)
+        repeat = max(3, 20_000 // max(n, 1))
+        bodies = {"json": body}
+        encode_cost = {"json": 0.0}  # the JSON itself is produced either way
+        if "msgpack" in formats:
+            bodies["msgpack"] = msgpack.packb(json.loads(body), use_bin_type=True)
+            # what MessagePackMiddleware adds: parse the JSON, pack it
+            encode_cost["msgpack"] = _cpu_ms(lambda body=body: msgpack.packb(json.loads(body), use_bin_type=True), repeat)
+        for fmt, data in bodies.items():
+            for enc in encodings:
+                if enc == "identity":
+                    out, enc_ms, dec_ms = data, 0.0, 0.0
+                else:
+                    out = compress(enc, data)
+                    enc_ms = _cpu_ms(lambda enc=enc, data=data: compress(enc, data), repeat)
+                    dec_ms = _cpu_ms(lambda enc=enc, out=out: _decompress(enc, out), repeat)
+                print(
+                    f"{n:>6} {fmt:<8} {enc:<9} {len(out):>10} {len(out) / len(body):>6.2f} "
+                    f"{encode_cost[fmt] + enc_ms:>10.3f} {dec_ms:>10.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
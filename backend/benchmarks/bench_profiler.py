@@ -0,0 +1,77 @@
+"""Overhead of the sampling profiler.
+
+Runs a CPU-bound, request-like workload (validate and serialize renewal
+histories with pydantic) on a few threads, first without a sampler and then
+with one at each interval, and reports the slowdown next to the CPU share
+the sampler itself measured. No database needed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_profiler --threads 4 --intervals 20 10 5 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import threading
+import time
+
+from app.profiling import Sampler
+from benchmarks.bench_encoding import _history, _renewals
+
+
+def _workload(threads: int, iterations: int, body: bytes) -> float:
+    def work() -> None:
+        for _ in range(iterations):
+            _renewals.dump_json(_renewals.validate_json(body))
+
+    pool = [threading.Thread(target=work) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--intervals", type=float, nargs="+", default=[20, 10, 5, 1], help="milliseconds")
+    args = parser.parse_args()
+
+    body = _history(args.rows)
+    _workload(args.threads, args.iterations // 10, body)  # warm up
+
+    # Interleaved (off, 20ms, 10ms, ... per round) so drift in machine load hits every configuration.
+    configs: list[float | None] = [None, *args.intervals]
+    times: dict[float | None, list[float]] = {c: [] for c in configs}
+    overheads: dict[float | None, list[float]] = {c: [] for c in configs}
+    stacks: dict[float | None, int] = {}
+    for _ in range(args.repeat):
+        for interval_ms in configs:
+            sampler = Sampler(interval_ms / 1000).start() if interval_ms else None
+            times[interval_ms].append(_workload(args.threads, args.iterations, body))
+            if sampler is not None:
+                sampler.stop()
+                overheads[interval_ms].append(sampler.overhead())
+                stacks[interval_ms] = len(sampler.top())
+
+    base = statistics.median(times[None])
+    print(f"{args.threads} threads x {args.iterations} x {args.rows}-row histories, median of {args.repeat}")
+    print(f"{'interval':>9} {'wall s':>8} {'slowdown':>9} {'sampler cpu':>12} {'stacks':>7}")
+    print(f"{'off':>9} {base:>8.3f}")
+    for interval in args.intervals:
+        wall = statistics.median(times[interval])
+        overhead = statistics.median(overheads[interval])
+        print(
+            f"{interval:>7g}ms {wall:>8.3f} {(wall / base - 1) * 100:>8.2f}% "
+            f"{overhead * 100:>11.2f}% {stacks[interval]:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import os
+import statistics
+import time
+from collections.abc import Callable
+
+from alembic.config import Config
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+
+from alembic import command
+
+
+def bench_engine() -> Engine:
+    """Engine for the benchmark database, migrated to head.
+
+    Reads BENCH_DATABASE_URL (falling back to DATABASE_URL). Seeding truncates
+    tables, so we refuse anything that is not clearly a bench/test database.
+    """
+    load_dotenv(".env")
+    url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    assert url, "BENCH_DATABASE_URL (or DATABASE_URL) must be set"
+    assert "bench" in url or "test" in url, f"Refusing to seed a non-bench DB: {url}"
+
+    alembic_cfg = Config("alembic.ini")
+    alembic_cfg.set_main_option("sqlalchemy.url", url)
+    os.environ["DATABASE_URL"] = url  # alembic/env.py reads Settings.from_env()
+    command.upgrade(alembic_cfg, "head")
+
+    return create_engine(url, pool_pre_ping=True)
+
+
+def truncate_all(conn: Connection) -> None:
+    conn.execute(
+        text(
+            "TRUNCATE TABLE renewals, reminder_preferences, cars, household_members, households, users, "
+            "renewals_archive, cars_archive, audit_outbox, audit_log "
+            "RESTART IDENTITY CASCADE"
+        )
+    )
+
+
+def seed_fleet(conn: Connection, *, renewals: int, cars_per_household: int = 5, years: int = 3) -> dict:
+    """Seed a synthetic fleet with roughly `renewals` renewal rows.
+
+    Every car gets `years` records per renewal kind, so the car count is
+    renewals / (3 * years). Each household gets one admin user. Everything is
+    generated server-side with generate_series, so 10M rows is feasible. Cars
+    are added before their oldest record, so compliance counts them all along.
+    """
+    per_car = 3 * years
+    cars = max(1, renewals // per_car)
+    households = max(1, cars // cars_per_household)
+
+    truncate_all(conn)
+    conn.execute(text("SELECT setseed(0.42)"))
+    conn.execute(
+        text(
+            """
+            INSERT INTO households (id, name, created_at)
+            SELECT gen_random_uuid(), 'bench-' || g, now()
+            FROM generate_series(1, :n) AS g
+            """
+        ),
+        {"n": households},
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO users (id, email, password_hash, created_at)
+            SELECT gen_random_uuid(), 'bench-' || h.name || '@example.com', 'x', now()
+            FROM households h
+            """
+        )
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO household_members (id, household_id, user_id, role, created_at)
+            SELECT gen_random_uuid(), h.id, u.id, 'admin', now()
+            FROM households h
+            JOIN users u ON u.email = 'bench-' || h.name || '@example.com'
+            """
+        )
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO cars (id, household_id, registration_number, make, model, is_archived, created_at, updated_at)
+            SELECT gen_random_uuid(), h.id,
+                   upper(substr(md5(h.id::text || c), 1, 7)),
+                   'Make' || (c % 7), 'Model' || (c % 11),
+                   random() < 0.05, now() - (:years + 1) * interval '1 year', now() - interval '1 day'
+            FROM households h, generate_series(1, :per) AS c
+            LIMIT :cars
+            """
+        ),
+        {"per": cars_per_household, "cars": cars, "years": years},
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO renewals (id, car_id, kind, valid_from, valid_to, provider, reference,
+                                  cost_pence, notes, is_deleted, created_at, updated_at)
+            SELECT gen_random_uuid(), v.car_id, v.kind,
+                   v.valid_from, v.valid_from + 364,
+                   'Provider ' || (v.y % 13), 'REF-' || substr(md5(v.car_id::text || v.kind || v.y), 1, 8),
+                   (10000 + random() * 90000)::int, NULL,
+                   random() < 0.02, v.ts, v.ts
+            FROM (
+                SELECT c.id AS car_id, k.kind, y,
+                       current_date - 300 - y * 365 + (random() * 120)::int AS valid_from,
+                       now() - (1 + random() * 300) * interval '1 day' AS ts
+                FROM cars c
+                CROSS JOIN unnest(ARRAY['INSURANCE', 'MOT', 'TAX']::renewal_kind[]) AS k(kind)
+                CROSS JOIN generate_series(0, :years - 1) AS y
+            ) AS v
+            """
+        ),
+        {"years": years},
+    )
+    conn.execute(text("ANALYZE"))
+    return {"households": households, "cars": cars, "renewals": cars * per_car}
+
+
+def timeit(fn: Callable[[], object], *, repeat: int = 20) -> dict[str, float]:
+    """Run `fn` repeatedly and return latency stats in milliseconds."""
+    samples: list[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "min_ms": samples[0],
+        "p50_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "max_ms": samples[-1],
+    }
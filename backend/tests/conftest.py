@@ -1,16 +1,21 @@
 import os
 import uuid
 from collections.abc import Generator
+from contextlib import contextmanager
 
 import pytest
 from alembic.config import Config
 from dotenv import load_dotenv
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, text
 
 from alembic import command
+from app.admission import reset_admission
+from app.db import make_session_factory
 from app.main import app
+from app.metrics import metrics
+from app.ratelimit import reset_login_limiters
+from app.security import clear_token_cache
 
 try:
     from app.db import get_db  # type: ignore
@@ -42,7 +47,9 @@ def _apply_migrations() -> None:
 
 @pytest.fixture()
 def db_session(engine):
-    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    # Same session options as production (notably expire_on_commit=False), so
+    # statement counts in tests match what a real request issues.
+    SessionLocal = make_session_factory(engine)
     session = SessionLocal()
     try:
         yield session
@@ -57,6 +64,9 @@ def _clean_db(db_session):
     Adjust table names if your schema differs.
     """
     db_session.execute(text("TRUNCATE TABLE renewals RESTART IDENTITY CASCADE;"))
+    db_session.execute(text("TRUNCATE TABLE renewals_archive, cars_archive;"))
+    db_session.execute(text("TRUNCATE TABLE audit_outbox, audit_log;"))
+    db_session.execute(text("TRUNCATE TABLE vehicle_lookups;"))
     db_session.execute(text("TRUNCATE TABLE reminder_preferences RESTART IDENTITY CASCADE;"))
     db_session.execute(text("TRUNCATE TABLE cars RESTART IDENTITY CASCADE;"))
     db_session.execute(text("TRUNCATE TABLE household_members RESTART IDENTITY CASCADE;"))
@@ -66,6 +76,16 @@ def _clean_db(db_session):
     yield
 
 
+@pytest.fixture(autouse=True)
+def _reset_process_state():
+    # Rate-limit buckets, token cache and counters live for the whole process; isolate tests.
+    reset_login_limiters()
+    reset_admission()
+    clear_token_cache()
+    metrics.reset()
+    yield
+
+
 @pytest.fixture()
 def client(db_session) -> Generator[TestClient]:
     def override_get_db():
@@ -76,6 +96,32 @@ def client(db_session) -> Generator[TestClient]:
         yield c
     app.dependency_overrides.clear()
 
+
+@pytest.fixture()
+def count_queries(engine, db_session):
+    """Context manager collecting the SQL statements issued inside it.
+
+    Expunges the shared test session first, so identity-map hits left over
+    from setup requests don't hide queries a fresh per-request session would run.
+    """
+
+    @contextmanager
+    def _count():
+        statements: list[str] = []
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        db_session.expunge_all()
+        event.listen(engine, "before_cursor_execute", _before)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", _before)
+
+    return _count
+
+
 @pytest.fixture()
 def unique_email() -> str:
     return f"user_{uuid.uuid4().hex[:10]}@example.com"
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.admission import ConcurrencyGroup, Rejected, get_admission, route_group
+from app.config import Settings
+from app.metrics import metrics
+from app.routers import renewals
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _setup(client) -> str:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": "Busy"})
+    return token
+
+
+def test_route_groups():
+    assert route_group("POST", "/api/auth/login") == "auth"
+    assert route_group("GET", "/api/renewals/upcoming") == "upcoming"
+    assert route_group("GET", "/api/cars") == "default"
+    assert route_group("GET", "/health") is None
+
+
+def test_queue_admits_in_order_and_sheds_when_full_or_late():
+    group = ConcurrencyGroup("g", limit=1, queue_size=1, queue_timeout=0.2)
+
+    async def scenario():
+        await group.acquire()  # holds the only slot
+        waiter = asyncio.ensure_future(group.acquire())
+        await asyncio.sleep(0)
+        assert group.queued == 1
+        with pytest.raises(Rejected):
+            await group.acquire()  # queue full: rejected at once
+        group.release()  # handed to the waiter
+        await waiter
+        assert (group.in_flight, group.queued) == (1, 0)
+        # nobody releases now: the next one waits out its deadline
+        with pytest.raises(Rejected) as exc:
+            await group.acquire()
+        assert exc.value.retry_after == 1
+        group.release()
+        assert group.in_flight == 0
+
+    asyncio.run(scenario())
+    assert metrics.get("admission.g.shed_queue_full") == 1
+    assert metrics.get("admission.g.shed_timeout") == 1
+
+
+def test_expensive_group_is_shed_without_blocking_cheap_reads(client, monkeypatch):
+    monkeypatch.setenv("ADMISSION_LIMITS", "upcoming=1,default=8")
+    monkeypatch.setenv("ADMISSION_QUEUE_SIZE", "0")
+    token = _setup(client)
+
+    entered, release = threading.Event(), threading.Event()
+    compute = renewals._compute_upcoming
+
+    def blocked_compute(*args, **kwargs):
+        entered.set()
+        release.wait(5)
+        return compute(*args, **kwargs)
+
+    monkeypatch.setattr(renewals, "_compute_upcoming", blocked_compute)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        first = pool.submit(client.get, "/api/renewals/upcoming", headers=_auth(token))
+        deadline = time.monotonic() + 5
+        while client.get("/metrics").json().get("admission.upcoming.in_flight") != 1:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        # past its auth queries: the shared test session is free for the requests below
+        assert entered.wait(5)
+
+        shed = client.get("/api/renewals/upcoming?days=30", headers=_auth(token))
+        assert shed.status_code == 503, shed.text
+        assert shed.headers["Retry-After"] == "2"
+
+        # other groups are unaffected
+        assert client.get("/api/cars", headers=_auth(token)).status_code == 200
+        assert client.get("/health").json() == {"status": "ok"}
+
+        release.set()
+        assert first.result().status_code == 200
+
+    counters = client.get("/metrics").json()
+    assert counters["admission.upcoming.shed"] == 1
+    assert counters["admission.upcoming.in_flight"] == 0
+
+
+def test_auth_group_rejects_with_429_and_health_reports_overload(client, monkeypatch):
+    monkeypatch.setenv("ADMISSION_LIMITS", "auth=0,default=8")
+    _setup(client)  # a disabled group (0) admits everything
+    monkeypatch.setenv("ADMISSION_LIMITS", "auth=1,default=1")
+    monkeypatch.setenv("ADMISSION_QUEUE_SIZE", "0")
+
+    groups = get_admission(Settings.from_env()).groups
+    groups["auth"].in_flight = 1  # as if a bcrypt check were running
+    r = client.post("/api/auth/login", json={"email": "a@example.com", "password": "x"})
+    assert r.status_code == 429, r.text
+    assert "Retry-After" in r.headers
+    assert client.get("/health").status_code == 200
+
+    groups["default"].in_flight = 1  # cheap reads saturated: take this instance out of rotation
+    r = client.get("/health")
+    assert r.status_code == 503 and r.json() == {"status": "overloaded"}
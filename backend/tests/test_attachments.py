@@ -0,0 +1,220 @@
+import hashlib
+import os
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+from app import attachments
+from app.metrics import metrics
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _household(client, name: str) -> str:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": name})
+    return token
+
+
+def _renewal(client, token: str, registration: str) -> str:
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": registration}).json()
+    today = date.today()
+    payload = {
+        "kind": "INSURANCE",
+        "valid_from": today.isoformat(),
+        "valid_to": (today + timedelta(days=364)).isoformat(),
+    }
+    r = client.post(f"/api/cars/{car['id']}/renewals", headers=_auth(token), json=payload)
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def _upload(client, token: str, renewal_id: str, content, filename="policy.pdf", content_type="application/pdf"):
+    return client.post(
+        f"/api/renewals/{renewal_id}/attachments",
+        headers={**_auth(token), "Content-Type": content_type},
+        params={"filename": filename},
+        content=content,
+    )
+
+
+@pytest.fixture()
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("ATTACHMENT_STORAGE", "local")
+    monkeypatch.setenv("ATTACHMENT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _blobs(root) -> list[str]:
+    return sorted(p.name for p in root.glob("??/??/*"))
+
+
+def test_upload_download_and_content_addressed_dedupe(client, store_dir):
+    token = _household(client, "Attach")
+    first, second = _renewal(client, token, "AT1"), _renewal(client, token, "AT2")
+    pdf = b"%PDF-1.7\n" + os.urandom(300_000)
+    digest = hashlib.sha256(pdf).hexdigest()
+
+    # streamed in pieces, as a browser or curl would send a file
+    pieces = (pdf[i : i + 65_536] for i in range(0, len(pdf), 65_536))
+    r = _upload(client, token, first, pieces, filename="Police – 2026.pdf")
+    assert r.status_code == 201, r.text
+    a = r.json()
+    assert (a["size"], a["sha256"], a["content_type"]) == (len(pdf), digest, "application/pdf")
+    assert a["filename"] == "Police – 2026.pdf"
+    b = _upload(client, token, second, pdf, filename="copy.pdf").json()
+    assert _blobs(store_dir) == [digest]  # stored once
+    assert metrics.get("attachments.uploads") == 2 and metrics.get("attachments.deduplicated") == 1
+
+    listed = client.get(f"/api/renewals/{first}/attachments", headers=_auth(token)).json()
+    assert [x["id"] for x in listed] == [a["id"]]
+
+    r = client.get(f"/api/attachments/{a['id']}", headers=_auth(token))
+    assert r.status_code == 200 and r.content == pdf
+    assert r.headers["content-type"] == "application/pdf" and r.headers["content-length"] == str(len(pdf))
+    assert r.headers["etag"] == f'"{digest}"' and r.headers["accept-ranges"] == "bytes"
+    assert "filename*=UTF-8''Police%20%E2%80%93%202026.pdf" in r.headers["content-disposition"]
+    cached = client.get(f"/api/attachments/{a['id']}", headers={**_auth(token), "If-None-Match": f'"{digest}"'})
+    assert cached.status_code == 304
+
+    # other households see nothing
+    other = _household(client, "Other")
+    assert client.get(f"/api/attachments/{a['id']}", headers=_auth(other)).status_code == 404
+    assert _upload(client, other, first, b"x").status_code == 404
+    assert client.delete(f"/api/attachments/{a['id']}", headers=_auth(other)).status_code == 404
+
+    # the blob goes with the last attachment using it
+    assert client.delete(f"/api/attachments/{a['id']}", headers=_auth(token)).status_code == 204
+    assert _blobs(store_dir) == [digest]
+    assert client.get(f"/api/attachments/{b['id']}", headers=_auth(token)).content == pdf
+    assert client.delete(f"/api/attachments/{b['id']}", headers=_auth(token)).status_code == 204
+    assert _blobs(store_dir) == []
+    assert client.get(f"/api/attachments/{b['id']}", headers=_auth(token)).status_code == 404
+
+
+def test_attachments_of_a_deleted_renewal_are_hidden(client, store_dir):
+    token = _household(client, "Deleted")
+    renewal = _renewal(client, token, "AT5")
+    a = _upload(client, token, renewal, b"%PDF-1.7\n").json()
+    assert client.delete(f"/api/renewals/{renewal}", headers=_auth(token)).status_code == 204
+
+    assert client.get(f"/api/attachments/{a['id']}", headers=_auth(token)).status_code == 404
+    assert client.delete(f"/api/attachments/{a['id']}", headers=_auth(token)).status_code == 404
+    assert client.get(f"/api/renewals/{renewal}/attachments", headers=_auth(token)).status_code == 404
+
+    # restored, it has them back
+    assert client.post(f"/api/renewals/{renewal}/restore", headers=_auth(token)).status_code == 200
+    assert client.get(f"/api/attachments/{a['id']}", headers=_auth(token)).status_code == 200
+
+
+def test_range_requests(client, store_dir):
+    token = _household(client, "Ranges")
+    renewal = _renewal(client, token, "RG1")
+    data = bytes(range(256)) * 4_000  # 1,024,000 bytes
+    a = _upload(client, token, renewal, data, content_type="application/octet-stream").json()
+    url = f"/api/attachments/{a['id']}"
+
+    def get(range_header: str, **extra):
+        return client.get(url, headers={**_auth(token), "Range": range_header, **extra})
+
+    r = get("bytes=100-199")
+    assert r.status_code == 206 and r.content == data[100:200]
+    assert r.headers["content-range"] == f"bytes 100-199/{len(data)}" and r.headers["content-length"] == "100"
+    r = get("bytes=1000000-")
+    assert r.status_code == 206 and r.content == data[1_000_000:]
+    r = get("bytes=-10")
+    assert r.status_code == 206 and r.content == data[-10:]
+    r = get("bytes=500000-99999999")  # clamped to the end
+    assert r.status_code == 206 and r.content == data[500_000:]
+
+    r = get(f"bytes={len(data)}-")
+    assert r.status_code == 416 and r.headers["content-range"] == f"bytes */{len(data)}"
+    assert get("bytes=0-1,5-6").status_code == 200  # multiple ranges: the whole file
+    assert get("bytes=0-9", **{"If-Range": '"stale"'}).status_code == 200
+    assert get("bytes=0-9", **{"If-Range": r.headers["etag"]}).status_code == 206
+    assert metrics.get("attachments.range_requests") == 5
+
+
+def test_ranged_downloads_are_never_compressed(client, store_dir):
+    token = _household(client, "Squeezed")
+    renewal = _renewal(client, token, "GZ1")
+    text = b"policy wording, line after line\n" * 2_000
+    a = _upload(client, token, renewal, text, filename="terms.txt", content_type="text/plain").json()
+    url = f"/api/attachments/{a['id']}"
+
+    # Compressing would leave a strong ETag and Accept-Ranges describing bytes that were never sent.
+    r = client.get(url, headers={**_auth(token), "Accept-Encoding": "gzip"})
+    assert r.status_code == 200 and "content-encoding" not in r.headers and r.content == text
+    assert r.headers["etag"] == f'"{a["sha256"]}"' and r.headers["accept-ranges"] == "bytes"
+    # so resuming that download splices the right bytes
+    headers = {**_auth(token), "Accept-Encoding": "gzip", "Range": "bytes=1000-", "If-Range": r.headers["etag"]}
+    resumed = client.get(url, headers=headers)
+    assert resumed.status_code == 206 and text[:1000] + resumed.content == text
+
+
+def test_upload_limits_and_gc(client, store_dir, monkeypatch, db_session):
+    token = _household(client, "Limits")
+    renewal = _renewal(client, token, "LM1")
+    monkeypatch.setenv("ATTACHMENT_MAX_BYTES", "1000")
+    assert _upload(client, token, renewal, b"x" * 1001).status_code == 413
+    chunks = (b"y" * 300 for _ in range(4))  # no Content-Length: caught while streaming
+    assert _upload(client, token, renewal, chunks).status_code == 413
+    assert _upload(client, token, renewal, b"z" * 1000).status_code == 201
+    assert len(_blobs(store_dir)) == 1
+    assert list((store_dir / "tmp").iterdir()) == []  # no leftover spools
+
+    assert _upload(client, token, str(uuid.uuid4()), b"x").status_code == 404
+    assert client.get(f"/api/renewals/{uuid.uuid4()}/attachments", headers=_auth(token)).status_code == 404
+
+    # a blob left behind by a crash is swept; referenced ones stay
+    store = attachments.LocalBlobStore(store_dir)
+    spool = store.spool()
+    spool.write(b"orphan")
+    assert store.put(spool)
+    assert len(_blobs(store_dir)) == 2
+    assert attachments.gc(db_session, store) == 1
+    assert len(_blobs(store_dir)) == 1
+
+
+def test_parse_range():
+    parse = attachments.parse_range
+    assert parse(None, 10) is None
+    assert parse("bytes=2-4", 10) == attachments.ByteRange(2, 5)
+    assert parse("bytes=-3", 10) == attachments.ByteRange(7, 10)
+    assert parse("bytes=-30", 10) == attachments.ByteRange(0, 10)
+    for ignored in ("items=0-1", "bytes=5-2", "bytes=a-b", "bytes=3"):
+        assert parse(ignored, 10) is None
+    for unsatisfiable in ("bytes=10-", "bytes=-0"):
+        with pytest.raises(attachments.RangeNotSatisfiable):
+            parse(unsatisfiable, 10)
+
+
+@pytest.mark.skipif(
+    not os.getenv("TEST_S3_ENDPOINT_URL"), reason="set TEST_S3_ENDPOINT_URL (e.g. compose's MinIO) to test the S3 store"
+)
+def test_s3_store():
+    pytest.importorskip("boto3")
+    bucket = os.getenv("TEST_S3_BUCKET", "cartrack-test")
+    store = attachments.S3BlobStore(bucket, endpoint_url=os.environ["TEST_S3_ENDPOINT_URL"])
+    try:
+        store.client.create_bucket(Bucket=bucket)
+    except store.client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    data = os.urandom(6 * 1024 * 1024)
+    spool = store.spool()
+    spool.write(data)
+    digest = spool.digest
+    assert store.put(spool) is True
+    again = store.spool()
+    again.write(data)
+    assert store.put(again) is False
+    assert b"".join(store.read(digest)) == data
+    assert b"".join(store.read(digest, 10, 20)) == data[10:20]
+    assert digest in set(store.digests())
+    store.delete(digest)
+    assert digest not in set(store.digests())
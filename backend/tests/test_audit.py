@@ -0,0 +1,152 @@
+import uuid
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func, select, text
+
+from app import audit
+from app.models import AuditLog, AuditOutbox
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(autouse=True)
+def _manual_flush(client):
+    """No background flushing here (once the app has started it): each test moves the outbox itself."""
+    audit.stop_audit_shippers()
+    yield
+    audit.stop_audit_shippers()
+
+
+def _household(client, name: str) -> str:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": name})
+    return token
+
+
+def _renewal(client, token: str, car_id: str, **fields) -> dict:
+    today = date.today()
+    payload = {"kind": "INSURANCE", "valid_from": today.isoformat(), "valid_to": (today + timedelta(days=365)).isoformat()}
+    r = client.post(f"/api/cars/{car_id}/renewals", headers=_auth(token), json={**payload, **fields})
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def _history(client, token: str, **params) -> list[dict]:
+    r = client.get("/api/audit", headers=_auth(token), params=params)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_renewal_edits_keep_before_and_after(client, engine):
+    token = _household(client, "Audited")
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "AU1"}).json()
+    renewal = _renewal(client, token, car["id"], provider="Admiral", cost_pence=45_000)
+    client.patch(f"/api/renewals/{renewal['id']}", headers=_auth(token), json={"cost_pence": 52_000, "notes": "renewed"})
+    client.delete(f"/api/renewals/{renewal['id']}", headers=_auth(token))
+    r = client.post(f"/api/renewals/{renewal['id']}/restore", headers=_auth(token))
+    assert r.status_code == 200, r.text
+
+    assert audit.flush(engine) == 5
+    restored, deleted, updated, created = _history(client, token, entity_id=renewal["id"])
+
+    assert created["op"] == "create" and created["entity"] == "renewal"
+    assert created["changes"]["provider"] == [None, "Admiral"]
+    assert created["changes"]["kind"] == [None, "INSURANCE"]
+    assert created["changes"]["car_id"] == [None, car["id"]]
+    assert updated["op"] == "update"
+    assert updated["changes"] == {"cost_pence": [45_000, 52_000], "notes": [None, "renewed"]}
+    assert deleted["changes"] == {"is_deleted": [False, True]}
+    assert restored["op"] == "restore" and restored["changes"] == {"is_deleted": [True, False]}
+    assert len({e["actor_id"] for e in (created, updated, deleted, restored)}) == 1
+
+    car_entries = _history(client, token, entity_id=car["id"])
+    assert [e["op"] for e in car_entries] == ["create"]
+    assert car_entries[0]["changes"]["registration_number"] == [None, "AU1"]
+
+
+def test_car_changes_and_paging(client, engine):
+    token = _household(client, "Paging")
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "AU2"}).json()
+    client.patch(f"/api/cars/{car['id']}", headers=_auth(token), json={"make": "Ford"})
+    client.post(f"/api/cars/{car['id']}/archive", headers=_auth(token))
+    audit.flush(engine)
+
+    newest, middle, oldest = _history(client, token)
+    assert (newest["op"], newest["changes"]) == ("archive", {"is_archived": [False, True]})
+    assert middle["changes"] == {"make": [None, "Ford"]}
+    assert oldest["op"] == "create"
+
+    (page,) = _history(client, token, before=middle["at"], limit=1)
+    assert page == oldest
+
+
+def test_paging_keeps_entries_that_share_a_timestamp(client, engine, db_session):
+    token = _household(client, "Ties")
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "AU6"}).json()
+    for n in range(4):
+        client.patch(f"/api/cars/{car['id']}", headers=_auth(token), json={"model": f"Mk{n}"})
+    audit.flush(engine)
+    db_session.execute(text("UPDATE audit_log SET at = now()"))  # one transaction: one timestamp
+    db_session.commit()
+
+    everything = _history(client, token)
+    assert len(everything) == 5 and len({e["at"] for e in everything}) == 1
+    paged, params = [], {"limit": 2}
+    while page := _history(client, token, **params):
+        paged += page
+        params = {"limit": 2, "before": page[-1]["at"], "before_id": page[-1]["id"]}
+    assert paged == everything
+
+
+def test_failed_writes_leave_no_entry(client, db_session):
+    token = _household(client, "Atomic")
+    client.post("/api/cars", headers=_auth(token), json={"registration_number": "AU3"})
+    r = client.post("/api/cars", headers=_auth(token), json={"registration_number": "au3"})
+    assert r.status_code == 409
+    r = client.patch(f"/api/cars/{uuid.uuid4()}", headers=_auth(token), json={"make": "X"})
+    assert r.status_code == 404
+
+    pending = db_session.scalar(select(func.count()).select_from(AuditOutbox))
+    assert pending == 1  # the one car that was created
+
+
+def test_flush_moves_batches_in_write_order(client, engine, db_session):
+    token = _household(client, "Batches")
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "AU4"}).json()
+    for n in range(4):
+        client.patch(f"/api/cars/{car['id']}", headers=_auth(token), json={"model": f"Mk{n}"})
+
+    assert audit.flush_batch(engine, batch_size=2) == 2
+    assert db_session.scalar(select(func.count()).select_from(AuditOutbox)) == 3
+    assert audit.flush(engine, batch_size=2) == 3
+    assert db_session.scalar(select(func.count()).select_from(AuditOutbox)) == 0
+
+    models = [c["model"][1] for c in db_session.scalars(select(AuditLog.changes).order_by(AuditLog.id)) if "model" in c]
+    assert models == ["Mk0", "Mk1", "Mk2", "Mk3"]
+
+
+def test_history_is_household_scoped(client, engine):
+    mine = _household(client, "Mine")
+    theirs = _household(client, "Theirs")
+    car = client.post("/api/cars", headers=_auth(mine), json={"registration_number": "AU5"}).json()
+    audit.flush(engine)
+
+    assert len(_history(client, mine)) == 1
+    assert _history(client, theirs) == []
+    assert _history(client, theirs, entity_id=car["id"]) == []
+
+
+def test_audit_log_lookups_use_indexes(db_session):
+    db_session.execute(text("SET LOCAL enable_seqscan = off"))
+    some_id = uuid.uuid4()
+    for where in (f"entity_id = '{some_id}'", f"household_id = '{some_id}' ORDER BY at DESC"):
+        plan = "\n".join(db_session.scalars(text(f"EXPLAIN SELECT * FROM audit_log WHERE {where}")))
+        assert "Index" in plan, plan
+    plan = "\n".join(db_session.scalars(text("EXPLAIN SELECT * FROM audit_log WHERE at > now() - interval '1 day'")))
+    assert "Index" in plan, plan
+    db_session.rollback()
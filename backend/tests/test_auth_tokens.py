@@ -0,0 +1,70 @@
+import uuid
+from dataclasses import replace
+
+import pytest
+from sqlalchemy import text
+
+from app.config import Settings
+from app.metrics import metrics
+from app.security import InvalidToken, TokenCache, create_access_token, decode_access_token
+
+
+def _signup_and_login(client) -> tuple[str, str]:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    r = client.post("/api/auth/login", json={"email": email, "password": "string1234"})
+    assert r.status_code == 200, r.text
+    return r.json()["access_token"], email
+
+
+def test_decode_uses_cache_and_checks_signature():
+    settings = Settings.from_env()
+    token = create_access_token(settings=settings, subject=str(uuid.uuid4()), minutes=5)
+
+    first = decode_access_token(settings=settings, token=token)
+    second = decode_access_token(settings=settings, token=token)
+    assert first == second
+    assert metrics.get("auth.token_cache.misses") == 1
+    assert metrics.get("auth.token_cache.hits") == 1
+
+    # a rotated secret must not be served from the cache
+    with pytest.raises(InvalidToken):
+        decode_access_token(settings=replace(settings, jwt_secret="rotated"), token=token)
+
+
+def test_token_cache_honours_exp_and_bound():
+    cache = TokenCache(maxsize=2)
+    cache.put(b"a", {"sub": "a"}, exp=100.0)
+    assert cache.get(b"a", now=99.0) == {"sub": "a"}
+    assert cache.get(b"a", now=100.0) is None
+
+    cache.put(b"b", {}, exp=1e12)
+    cache.put(b"c", {}, exp=1e12)
+    cache.put(b"d", {}, exp=1e12)
+    assert cache.get(b"b", now=0) is None
+    assert cache.get(b"d", now=0) == {}
+
+
+def test_pyjwt_backend_accepts_jose_tokens():
+    pytest.importorskip("jwt")
+    settings = Settings.from_env()
+    token = create_access_token(settings=settings, subject="abc", minutes=5)
+    claims = decode_access_token(settings=replace(settings, jwt_backend="pyjwt", jwt_cache_size=0), token=token)
+    assert claims["sub"] == "abc"
+
+
+def test_trust_claims_skips_user_fetch_on_reads_only(client, db_session, monkeypatch):
+    token, email = _signup_and_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    db_session.execute(text("DELETE FROM users WHERE email = :e"), {"e": email})
+    db_session.commit()
+
+    r = client.get("/api/settings/reminders", headers=headers)
+    assert r.status_code == 401, r.text
+
+    monkeypatch.setenv("AUTH_TRUST_CLAIMS", "true")
+    r = client.get("/api/settings/reminders", headers=headers)
+    assert r.status_code == 200, r.text
+
+    r = client.put("/api/settings/reminders", headers=headers, json={"preferences": {"MOT": [7]}})
+    assert r.status_code == 401, r.text
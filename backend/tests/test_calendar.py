@@ -0,0 +1,207 @@
+import hashlib
+import time
+import uuid
+from datetime import UTC, date, datetime, timedelta
+from email.utils import parsedate_to_datetime
+
+import pytest
+
+from app import ical
+from app.config import Settings
+from app.enums import RenewalKind
+from app.events import get_event_hub
+from app.metrics import metrics
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _household(client, name: str) -> str:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": name})
+    return token
+
+
+def _renewal(client, token: str, car_id: str, kind: str, valid_to: date) -> dict:
+    valid_from = min(valid_to - timedelta(days=364), date.today())
+    payload = {"kind": kind, "valid_from": valid_from.isoformat(), "valid_to": valid_to.isoformat()}
+    r = client.post(f"/api/cars/{car_id}/renewals", headers=_auth(token), json=payload)
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def _feed_path(client, token: str) -> str:
+    r = client.post("/api/calendar/token", headers=_auth(token))
+    assert r.status_code == 201, r.text
+    return r.json()["path"]
+
+
+def _events(body: str) -> list[str]:
+    return body.split("BEGIN:VEVENT\r\n")[1:]
+
+
+@pytest.fixture()
+def listening(client):
+    """Change notifications flowing, so feeds are cached and kept current by them."""
+    settings = Settings.from_env()
+    ical.get_calendar_cache(settings)
+    hub = get_event_hub(settings)
+    assert hub.listening.wait(5), "listener did not start"
+    return settings
+
+
+def test_feed_has_latest_cover_per_kind_with_reminder_alarms(client):
+    token = _household(client, "Calendars")
+    client.put("/api/settings/reminders", headers=_auth(token), json={"preferences": {"MOT": [14, 0], "TAX": [3]}})
+    car = client.post(
+        "/api/cars",
+        headers=_auth(token),
+        json={"registration_number": "IC1", "make": "Volkswagen", "model": "Golf, 2.0 TDI; long-wheelbase estate edition"},
+    ).json()
+    today = date.today()
+    _renewal(client, token, car["id"], "MOT", today + timedelta(days=20))
+    _renewal(client, token, car["id"], "MOT", today + timedelta(days=385))  # next year's, already booked
+    _renewal(client, token, car["id"], "TAX", today - timedelta(days=3))  # lapsed, still shown
+    old = client.post("/api/cars", headers=_auth(token), json={"registration_number": "OLD1"}).json()
+    _renewal(client, token, old["id"], "MOT", today + timedelta(days=10))
+    client.patch(f"/api/cars/{old['id']}", headers=_auth(token), json={"is_archived": True})
+
+    path = _feed_path(client, token)
+    r = client.get(path)
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("text/calendar")
+    assert r.headers["etag"].startswith('"') and r.headers["last-modified"].endswith("GMT")
+    body = r.text
+    assert body.startswith("BEGIN:VCALENDAR\r\n") and body.endswith("END:VCALENDAR\r\n")
+    assert all(len(line.encode()) <= 75 for line in body.split("\r\n"))
+
+    mot, tax = _events(body)
+    assert f"UID:{car['id']}-mot@cartrack" in mot
+    assert f"DTSTART;VALUE=DATE:{today + timedelta(days=385):%Y%m%d}" in mot
+    assert "SUMMARY:IC1 (Volkswagen Golf\\, 2.0 TDI\\; long-wheelbase estate edition) MOT expires" in mot.replace(
+        "\r\n ", ""
+    )
+    assert mot.count("BEGIN:VALARM") == 2 and "TRIGGER:-P14D" in mot and "TRIGGER:PT0S" in mot
+    assert f"DTSTART;VALUE=DATE:{today - timedelta(days=3):%Y%m%d}" in tax and "TRIGGER:-P3D" in tax
+    assert "OLD1" not in body  # archived
+
+    # rendering is deterministic, so the same feed has the same ETag
+    assert client.get(path).headers["etag"] == r.headers["etag"]
+
+
+def test_feed_tokens(client):
+    token = _household(client, "Tokens")
+    assert client.get(f"/api/calendar/{uuid.uuid4().hex}.ics").status_code == 404
+
+    first = _feed_path(client, token)
+    assert client.get(first).status_code == 200
+    second = _feed_path(client, token)  # rotating revokes the old URL
+    assert client.get(first).status_code == 404
+    assert client.get(second).status_code == 200
+    assert client.delete("/api/calendar/token", headers=_auth(token)).status_code == 204
+    assert client.get(second).status_code == 404
+
+    no_household = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": no_household, "password": "string1234"})
+    login = client.post("/api/auth/login", json={"email": no_household, "password": "string1234"}).json()
+    assert client.post("/api/calendar/token", headers=_auth(login["access_token"])).status_code == 409
+
+
+def _poll_until_changed(client, path: str, etag: str) -> dict:
+    deadline = time.monotonic() + 5
+    while True:
+        r = client.get(path, headers={"If-None-Match": etag})
+        if r.status_code == 200:
+            return r
+        assert time.monotonic() < deadline, "feed never picked up the change"
+        time.sleep(0.02)
+
+
+def test_unchanged_feed_is_a_304_and_a_change_rerenders_only_that_car(client, listening, count_queries):
+    token = _household(client, "Polled")
+    today = date.today()
+    cars = [client.post("/api/cars", headers=_auth(token), json={"registration_number": f"PL{i}"}).json() for i in range(5)]
+    renewals = [_renewal(client, token, c["id"], "INSURANCE", today + timedelta(days=30 + i)) for i, c in enumerate(cars)]
+    path = _feed_path(client, token)
+
+    first = client.get(path)
+    assert first.status_code == 200 and len(_events(first.text)) == 5
+    assert metrics.get("calendar.builds") == 1
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+    with count_queries() as statements:
+        r = client.get(path, headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.headers["etag"] == etag and not r.content
+    assert len(statements) == 1  # the token lookup; no renewal scan
+    assert metrics.get("calendar.hits") == 1
+    assert client.get(path, headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    moved = today + timedelta(days=90)
+    client.patch(f"/api/renewals/{renewals[2]['id']}", headers=_auth(token), json={"valid_to": moved.isoformat()})
+    r = _poll_until_changed(client, path, etag)
+    assert r.headers["etag"] != etag
+    assert f"DTSTART;VALUE=DATE:{moved:%Y%m%d}" in r.text
+    assert metrics.get("calendar.builds") == 1
+    assert metrics.get("calendar.refreshes") == 1 and metrics.get("calendar.cars_rerendered") == 1
+    assert parsedate_to_datetime(r.headers["last-modified"]) >= parsedate_to_datetime(last_modified)
+    assert client.get(path, headers={"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}).status_code == 200
+
+    # archiving a car drops its event; a reconnect of the listener rebuilds
+    etag = r.headers["etag"]
+    client.patch(f"/api/cars/{cars[0]['id']}", headers=_auth(token), json={"is_archived": True})
+    r = _poll_until_changed(client, path, etag)
+    assert len(_events(r.text)) == 4
+    ical.get_calendar_cache(listening).on_change(None, None)
+    assert client.get(path, headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+    assert metrics.get("calendar.builds") == 2
+
+
+def test_a_failed_refresh_is_not_forgotten(client, listening, monkeypatch):
+    token = _household(client, "Flaky")
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "FL1"}).json()
+    renewal = _renewal(client, token, car["id"], "INSURANCE", date.today() + timedelta(days=30))
+    path = _feed_path(client, token)
+    etag = client.get(path).headers["etag"]
+    household_id = uuid.UUID(client.get("/api/households/current", headers=_auth(token)).json()["id"])
+    (feed,) = (f for f in ical.get_calendar_cache(listening)._feeds.values() if f.household_id == household_id)
+
+    moved = date.today() + timedelta(days=90)
+    client.patch(f"/api/renewals/{renewal['id']}", headers=_auth(token), json={"valid_to": moved.isoformat()})
+    deadline = time.monotonic() + 5
+    while not feed.changed_renewals:
+        assert time.monotonic() < deadline, "change notification never arrived"
+        time.sleep(0.02)
+
+    load = ical._load
+
+    def failing(*args, **kwargs):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(ical, "_load", failing)
+    with pytest.raises(RuntimeError):
+        client.get(path, headers={"If-None-Match": etag})
+    monkeypatch.setattr(ical, "_load", load)
+
+    r = client.get(path, headers={"If-None-Match": etag})  # not a 304 of the old feed
+    assert r.status_code == 200 and f"DTSTART;VALUE=DATE:{moved:%Y%m%d}" in r.text
+
+
+def test_large_feed_streams_in_pieces():
+    cars = {}
+    for i in range(2_000):
+        events = ical.render_car(
+            uuid.UUID(int=i),
+            f"FLEET{i}",
+            [(RenewalKind.MOT, date(2030, 1, 1))],
+            modified=datetime(2026, 1, 1, tzinfo=UTC),
+            alarms=ical.alarms_from({"MOT": [30, 7, 1]}),
+        )
+        cars[uuid.UUID(int=i)] = (events, hashlib.sha256(events).digest())
+    doc = ical._document(cars, None)
+    pieces = list(doc.stream())
+    assert len(pieces) > 5
+    assert all(len(p) < 2 * ical._STREAM_CHUNK_BYTES for p in pieces)
+    assert doc.body().count(b"BEGIN:VEVENT") == 2_000
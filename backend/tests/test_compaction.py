@@ -0,0 +1,93 @@
+import uuid
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from app.compaction import compact, table_sizes
+from app.metrics import metrics
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _setup(client) -> str:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": "Cold"})
+    return token
+
+
+def _car(client, token: str, vrm: str) -> str:
+    r = client.post("/api/cars", headers=_auth(token), json={"registration_number": vrm})
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def _renewal(client, token: str, car_id: str, kind: str = "MOT") -> str:
+    today = date.today()
+    payload = {"kind": kind, "valid_from": (today - timedelta(days=10)).isoformat(), "valid_to": today.isoformat()}
+    r = client.post(f"/api/cars/{car_id}/renewals", headers=_auth(token), json=payload)
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def test_compaction_moves_cold_rows_and_restore_brings_them_back(client, engine, db_session):
+    token = _setup(client)
+    live_car = _car(client, token, "L1VE")
+    old_car = _car(client, token, "0LD")
+    keep = _renewal(client, token, live_car, "MOT")
+    gone = _renewal(client, token, live_car, "TAX")
+    old_renewal = _renewal(client, token, old_car)
+    assert client.delete(f"/api/renewals/{gone}", headers=_auth(token)).status_code == 204
+    assert client.post(f"/api/cars/{old_car}/archive", headers=_auth(token)).status_code == 200
+
+    db_session.rollback()
+    with engine.begin() as conn:
+        before = table_sizes(conn)
+    assert (before["renewals"]["rows"], before["cars"]["rows"]) == (3, 2)
+
+    # Nothing is old enough yet.
+    assert compact(engine, deleted_retention_days=90, archived_car_retention_days=365).renewals_archived == 0
+
+    later = datetime.utcnow() + timedelta(days=400)
+    result = compact(engine, deleted_retention_days=90, archived_car_retention_days=365, batch_size=1, now=later)
+    assert (result.renewals_archived, result.cars_archived) == (2, 1)
+    assert metrics.get("compaction.renewals_archived") == 2
+
+    with engine.begin() as conn:
+        after = table_sizes(conn)
+        assert conn.execute(text("SELECT id FROM renewals")).scalar_one() == uuid.UUID(keep)
+    assert (after["renewals"]["rows"], after["cars"]["rows"]) == (1, 1)
+    assert (after["renewals_archive"]["rows"], after["cars_archive"]["rows"]) == (2, 1)
+
+    r = client.get("/api/cars?include_archived=true", headers=_auth(token))
+    assert [c["id"] for c in r.json()] == [live_car]
+
+    # The soft-deleted renewal comes back live.
+    r = client.post(f"/api/renewals/{gone}/restore", headers=_auth(token))
+    assert r.status_code == 200 and r.json()["is_deleted"] is False, r.text
+    assert len(client.get(f"/api/cars/{live_car}/renewals", headers=_auth(token)).json()) == 2
+
+    # The car comes back archived, with its renewals; restoring again is a no-op.
+    for _ in range(2):
+        r = client.post(f"/api/cars/{old_car}/restore", headers=_auth(token))
+        assert r.status_code == 200 and r.json()["is_archived"] is True, r.text
+    renewals = client.get(f"/api/cars/{old_car}/renewals", headers=_auth(token)).json()
+    assert [x["id"] for x in renewals] == [old_renewal]
+
+
+def test_restore_is_scoped_to_the_household(client, engine, db_session):
+    owner = _setup(client)
+    car_id = _car(client, owner, "M1NE")
+    rid = _renewal(client, owner, car_id)
+    client.delete(f"/api/renewals/{rid}", headers=_auth(owner))
+    client.post(f"/api/cars/{car_id}/archive", headers=_auth(owner))
+    db_session.rollback()
+    compact(engine, deleted_retention_days=0, archived_car_retention_days=0, now=datetime.utcnow() + timedelta(days=1))
+
+    other = _setup(client)
+    assert client.post(f"/api/cars/{car_id}/restore", headers=_auth(other)).status_code == 404
+    assert client.post(f"/api/renewals/{rid}/restore", headers=_auth(other)).status_code == 404
+    assert client.post(f"/api/cars/{car_id}/restore", headers=_auth(owner)).status_code == 200
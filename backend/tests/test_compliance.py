@@ -0,0 +1,162 @@
+import uuid
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from app import compliance
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _household(client, name: str) -> str:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": name})
+    return token
+
+
+def _renewal(client, token: str, car_id: str, kind: str, valid_from: date, valid_to: date) -> dict:
+    payload = {"kind": kind, "valid_from": valid_from.isoformat(), "valid_to": valid_to.isoformat()}
+    r = client.post(f"/api/cars/{car_id}/renewals", headers=_auth(token), json=payload)
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def _added(db_session, car_id: str, on: date) -> None:
+    db_session.execute(text("UPDATE cars SET created_at = :on WHERE id = :id"), {"on": on, "id": car_id})
+    db_session.commit()
+
+
+def _fleet(client, db_session, token: str, today: date) -> dict[str, dict]:
+    """Three cars with a history: lapses, a gap, overlapping covers, a deleted renewal, an archived car.
+
+    All three were added 500 days ago, before any of their cover.
+    """
+    d = lambda n: today - timedelta(days=n)  # noqa: E731
+    cars = {
+        reg: client.post("/api/cars", headers=_auth(token), json={"registration_number": reg}).json()
+        for reg in ("CA1", "CB2", "CC3")
+    }
+    a, b, c = (cars[r]["id"] for r in ("CA1", "CB2", "CC3"))
+    _renewal(client, token, a, "INSURANCE", d(400), d(200))
+    _renewal(client, token, a, "INSURANCE", d(150), d(10))  # gap of 50 days before it, lapsed since
+    _renewal(client, token, a, "INSURANCE", d(160), d(100))  # overlaps the previous one
+    _renewal(client, token, a, "MOT", d(300), today + timedelta(days=60))
+    _renewal(client, token, b, "INSURANCE", d(100), today + timedelta(days=200))
+    _renewal(client, token, b, "INSURANCE", d(101), d(101))  # touches the next one: one island
+    deleted = _renewal(client, token, b, "TAX", d(300), today + timedelta(days=50))
+    assert client.delete(f"/api/renewals/{deleted['id']}", headers=_auth(token)).status_code == 204
+    _renewal(client, token, c, "TAX", d(50), d(20))
+    client.patch(f"/api/cars/{c}", headers=_auth(token), json={"is_archived": True})
+    for car_id in (a, b, c):
+        _added(db_session, car_id, d(500))
+    return cars
+
+
+def _by(items: list[dict]) -> dict[tuple[str, str], tuple[str, str | None]]:
+    return {(i["registration_number"], i["kind"]): (i["status"], i["valid_to"]) for i in items}
+
+
+def test_status_on_a_past_date(client, db_session):
+    token = _household(client, "Compliance")
+    today = date.today()
+    _fleet(client, db_session, token, today)
+
+    r = client.get("/api/compliance", headers=_auth(token), params={"on": (today - timedelta(days=175)).isoformat()})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["on"] == (today - timedelta(days=175)).isoformat()
+    items = _by(body["items"])
+    assert len(items) == 9  # every car and kind, the archived car included
+    assert items[("CA1", "INSURANCE")] == ("lapsed", (today - timedelta(days=200)).isoformat())
+    assert items[("CA1", "MOT")] == ("covered", (today + timedelta(days=60)).isoformat())
+    assert items[("CB2", "INSURANCE")] == ("missing", None)
+    assert items[("CB2", "TAX")] == ("missing", None)  # deleted renewals don't count
+    assert items[("CC3", "TAX")] == ("missing", None)
+    assert [i["registration_number"] for i in body["items"]][::3] == ["CA1", "CB2", "CC3"]
+    totals = {t["kind"]: (t["covered"], t["lapsed"], t["missing"]) for t in body["totals"]}
+    assert totals == {"INSURANCE": (0, 1, 2), "MOT": (1, 0, 2), "TAX": (0, 0, 3)}
+
+    today_items = _by(client.get("/api/compliance", headers=_auth(token)).json()["items"])
+    assert today_items[("CA1", "INSURANCE")] == ("lapsed", (today - timedelta(days=10)).isoformat())
+    assert today_items[("CB2", "INSURANCE")][0] == "covered"
+    assert today_items[("CC3", "TAX")][0] == "lapsed"
+
+
+def test_series_matches_the_single_day_status(client, db_session):
+    token = _household(client, "Series")
+    today = date.today()
+    cars = _fleet(client, db_session, token, today)
+    _added(db_session, cars["CC3"]["id"], today - timedelta(days=30))  # after its tax cover started
+    household_id = db_session.execute(
+        text("SELECT household_id FROM cars WHERE id = :id"), {"id": cars["CA1"]["id"]}
+    ).scalar_one()
+
+    start = today - timedelta(days=420)
+    r = client.get(
+        "/api/compliance/series",
+        headers=_auth(token),
+        params={"start": start.isoformat(), "end": (today + timedelta(days=250)).isoformat(), "every": 3},
+    )
+    assert r.status_code == 200, r.text
+    series = r.json()
+    assert len(series) == (670 // 3 + 1) * 3
+    for point in series:
+        on = date.fromisoformat(point["on"])
+        expected = {
+            c.kind.value: (c.covered, c.lapsed, c.missing)
+            for c in compliance.counts_of(compliance.status_on(db_session, household_id, on), on)
+        }
+        assert (point["covered"], point["lapsed"], point["missing"]) == expected[point["kind"]], point
+
+    assert compliance.counts_over(db_session, household_id, []) == []
+
+
+def test_cars_count_from_the_day_they_were_added(client, db_session):
+    token = _household(client, "Added")
+    today = date.today()
+    old = client.post("/api/cars", headers=_auth(token), json={"registration_number": "AD1"}).json()
+    new = client.post("/api/cars", headers=_auth(token), json={"registration_number": "AD2"}).json()
+    _renewal(client, token, new["id"], "MOT", today - timedelta(days=100), today + timedelta(days=100))
+    _added(db_session, old["id"], today - timedelta(days=100))
+    _added(db_session, new["id"], today - timedelta(days=5))
+
+    before = client.get("/api/compliance", headers=_auth(token), params={"on": (today - timedelta(days=6)).isoformat()})
+    assert {i["registration_number"] for i in before.json()["items"]} == {"AD1"}
+    after = client.get("/api/compliance", headers=_auth(token), params={"on": (today - timedelta(days=5)).isoformat()})
+    assert _by(after.json()["items"])[("AD2", "MOT")][0] == "covered"
+
+    params = {"start": (today - timedelta(days=6)).isoformat(), "end": (today - timedelta(days=5)).isoformat()}
+    series = client.get("/api/compliance/series", headers=_auth(token), params=params).json()
+    mot = [(p["on"], p["covered"], p["lapsed"], p["missing"]) for p in series if p["kind"] == "MOT"]
+    assert mot == [(params["start"], 0, 0, 1), (params["end"], 1, 0, 1)]
+
+
+def test_series_bounds(client):
+    token = _household(client, "Bounds")
+    today = date.today()
+    params = {"start": today.isoformat(), "end": (today - timedelta(days=1)).isoformat()}
+    assert client.get("/api/compliance/series", headers=_auth(token), params=params).status_code == 422
+    params = {"start": (today - timedelta(days=2000)).isoformat(), "end": today.isoformat()}
+    assert client.get("/api/compliance/series", headers=_auth(token), params=params).status_code == 422
+    assert client.get("/api/compliance/series", headers=_auth(token), params={**params, "every": 7}).status_code == 200
+
+
+def test_upcoming_as_of(client):
+    token = _household(client, "AsOf")
+    today = date.today()
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "AO1"}).json()
+    _renewal(client, token, car["id"], "MOT", today - timedelta(days=300), today - timedelta(days=30))
+
+    now = client.get("/api/renewals/upcoming", headers=_auth(token)).json()
+    assert {i["kind"]: i["status"] for i in now}["MOT"] == "overdue"
+    then = client.get(
+        "/api/renewals/upcoming",
+        headers=_auth(token),
+        params={"as_of": (today - timedelta(days=50)).isoformat(), "days": 30},
+    ).json()
+    mot = next(i for i in then if i["kind"] == "MOT")
+    assert mot["status"] == "due" and mot["days_until"] == 20
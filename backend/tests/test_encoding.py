@@ -0,0 +1,129 @@
+import uuid
+from dataclasses import replace
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.deps import get_db
+from app.encoding import available_encodings, choose_encoding, prefers_msgpack
+from app.main import create_app
+from app.metrics import metrics
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture()
+def gzip_client(db_session):
+    """The app with gzip as the only encoding, so assertions don't depend on installed codecs."""
+    app = create_app(replace(Settings.from_env(), compression_encodings=["gzip"]))
+
+    def override_get_db():
+        yield db_session
+
+    app.dependency_overrides[get_db] = override_get_db
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture()
+def history(gzip_client):
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    gzip_client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = gzip_client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    gzip_client.post("/api/households", headers=_auth(token), json={"name": "Long notes"})
+    car = gzip_client.post("/api/cars", headers=_auth(token), json={"registration_number": "GZ1"}).json()
+    start = date.today() - timedelta(days=365 * 10)
+    for year in range(10):
+        valid_from = start + timedelta(days=365 * year)
+        gzip_client.post(
+            f"/api/cars/{car['id']}/renewals",
+            headers=_auth(token),
+            json={
+                "kind": "MOT",
+                "valid_from": valid_from.isoformat(),
+                "valid_to": (valid_from + timedelta(days=364)).isoformat(),
+                "notes": "Advisory: nearside front tyre worn close to the legal limit. " * 8,
+            },
+        )
+    return token, car["id"]
+
+
+def test_choose_encoding():
+    offered = ("zstd", "br", "gzip")
+    assert choose_encoding("gzip, deflate, br, zstd", offered) == "zstd"  # ties go to our order
+    assert choose_encoding("gzip;q=1.0, br;q=0.5", offered) == "gzip"
+    assert choose_encoding("*;q=0.1, gzip;q=0", offered) == "zstd"
+    assert choose_encoding("br;q=0, gzip;q=0", offered) is None
+    assert choose_encoding("identity", offered) is None
+    assert choose_encoding("", offered) is None
+    assert "gzip" in available_encodings()
+
+
+def test_prefers_msgpack():
+    assert prefers_msgpack("application/msgpack")
+    assert prefers_msgpack("application/x-msgpack, application/json;q=0.5")
+    assert not prefers_msgpack("*/*")
+    assert not prefers_msgpack("application/json, application/msgpack")
+    assert not prefers_msgpack("")
+
+
+def test_large_list_is_gzipped_small_response_is_not(gzip_client, history):
+    token, car_id = history
+    r = gzip_client.get(f"/api/cars/{car_id}/renewals", headers={**_auth(token), "Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in r.headers["vary"]
+    assert len(r.json()) == 10  # httpx decodes transparently
+    assert r.num_bytes_downloaded < len(r.content) / 4
+    assert metrics.get("compression.gzip.responses") == 1
+
+    r = gzip_client.get(f"/api/cars/{car_id}", headers={**_auth(token), "Accept-Encoding": "gzip"})
+    assert "content-encoding" not in r.headers  # under the size threshold
+
+    r = gzip_client.get(f"/api/cars/{car_id}/renewals", headers={**_auth(token), "Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers and len(r.json()) == 10
+
+
+def test_brotli_when_installed(client, history):
+    pytest.importorskip("brotli")
+    token, car_id = history
+    r = client.get(f"/api/cars/{car_id}/renewals", headers={**_auth(token), "Accept-Encoding": "br"})
+    assert r.headers["content-encoding"] == "br"
+    assert len(r.json()) == 10
+
+
+def test_list_endpoints_negotiate_msgpack(gzip_client, history):
+    msgpack = pytest.importorskip("msgpack")
+    token, car_id = history
+    as_json = gzip_client.get(f"/api/cars/{car_id}/renewals", headers=_auth(token))
+
+    headers = {**_auth(token), "Accept": "application/msgpack", "Accept-Encoding": "gzip"}
+    r = gzip_client.get(f"/api/cars/{car_id}/renewals", headers=headers)
+    assert r.headers["content-type"] == "application/msgpack"
+    assert r.headers["content-encoding"] == "gzip"
+    assert "Accept" in r.headers["vary"]
+    assert msgpack.unpackb(r.content) == as_json.json()
+
+    # not a list endpoint: JSON regardless
+    r = gzip_client.get(f"/api/cars/{car_id}", headers=headers)
+    assert r.headers["content-type"] == "application/json"
+
+    # errors stay JSON
+    r = gzip_client.get(f"/api/cars/{uuid.uuid4()}/renewals", headers=headers)
+    assert r.status_code == 404 and r.json() == {"detail": "Car not found"}
+
+
+def test_compression_can_be_disabled(db_session):
+    app = create_app(replace(Settings.from_env(), compression_encodings=[]))
+    with TestClient(app) as c:
+        r = c.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in r.headers
+    assert len(r.content) > 1024
+    # and the same document is compressed by default
+    with TestClient(create_app(Settings.from_env())) as c:
+        r = c.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
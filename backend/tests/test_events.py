@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import tracemalloc
+import uuid
+
+import httpx
+import pytest
+import uvicorn
+
+from app.db import get_engine, make_session_factory
+from app.events import EventHub, notify_change
+from app.main import app
+
+
+def _notify(household_id: uuid.UUID, entity_id: uuid.UUID, op: str = "update") -> None:
+    with make_session_factory(get_engine(os.environ["DATABASE_URL"]))() as db:
+        notify_change(db, household_id, "car", entity_id, op)
+        db.commit()
+
+
+async def _wait_listening(hub: EventHub) -> None:
+    deadline = time.monotonic() + 5
+    while not hub.listening.is_set():
+        assert time.monotonic() < deadline, "listener did not start"
+        await asyncio.sleep(0.01)
+
+
+def test_10k_idle_subscribers_share_one_listen_connection():
+    hub = EventHub(os.environ["DATABASE_URL"])
+    household, other = uuid.uuid4(), uuid.uuid4()
+
+    async def scenario():
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        subs = [hub.subscribe(household) for _ in range(10_000)]
+        bystander = hub.subscribe(other)
+        # every subscriber parked in a wait, as an open stream would be
+        waits = [asyncio.ensure_future(s.next_batch(30)) for s in subs]
+        await asyncio.sleep(0)
+        per_sub = (tracemalloc.get_traced_memory()[0] - before) / len(subs)
+        tracemalloc.stop()
+        await _wait_listening(hub)
+
+        car_id = uuid.uuid4()
+        await asyncio.to_thread(_notify, household, car_id)
+        batches = await asyncio.wait_for(asyncio.gather(*waits), 10)
+        assert all(b == [("change", {"entity": "car", "id": str(car_id), "op": "update"})] for b in batches)
+        assert await bystander.next_batch(0.05) == []
+
+        for s in [*subs, bystander]:
+            hub.unsubscribe(s)
+        assert hub.subscriber_count() == 0
+        return per_sub
+
+    try:
+        per_sub = asyncio.run(scenario())
+    finally:
+        hub.stop()
+    # subscriber + its pending wait (task, coroutine, future); far below a thread per client
+    assert per_sub < 4096, f"{per_sub:.0f} bytes per idle subscriber"
+
+
+def test_slow_subscriber_collapses_to_resync():
+    hub = EventHub(os.environ["DATABASE_URL"])
+
+    async def scenario():
+        sub = hub.subscribe(uuid.uuid4(), maxlen=3)
+        for i in range(3):
+            sub.push({"id": i})
+        assert len(await sub.next_batch(0)) == 3
+        for i in range(10):  # client stopped reading
+            sub.push({"id": i})
+        assert await sub.next_batch(0) == [("resync", {})]
+        assert await sub.next_batch(0.01) == []
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        hub.stop()
+
+
+@pytest.fixture()
+def server():
+    """The real app on a local port (TestClient cannot read an endless stream)."""
+    app.dependency_overrides.clear()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    srv = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=srv.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not srv.started:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    yield f"http://127.0.0.1:{port}"
+    srv.should_exit = True
+    thread.join(timeout=10)
+
+
+def test_mutations_reach_the_households_event_stream(server):
+    with httpx.Client(base_url=server, timeout=10) as http:
+        email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+        http.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+        token = http.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        assert http.post("/api/households", headers=headers, json={"name": "Live"}).status_code == 201
+
+        with http.stream("GET", "/api/events", headers=headers) as stream:
+            assert stream.headers["content-type"].startswith("text/event-stream")
+            lines = stream.iter_lines()
+            assert next(lines) == "retry: 5000"
+            assert next(lines) == ": connected"  # sent once the hub listens: nothing after is missed
+
+            car = http.post("/api/cars", headers=headers, json={"registration_number": "EV1"}).json()
+            http.post(f"/api/cars/{car['id']}/archive", headers=headers)
+
+            events = []
+            for line in lines:
+                if line.startswith("data: "):
+                    events.append(json.loads(line[len("data: "):]))
+                    if len(events) == 2:
+                        break
+    assert events == [
+        {"entity": "car", "id": car["id"], "op": "create"},
+        {"entity": "car", "id": car["id"], "op": "archive"},
+    ]
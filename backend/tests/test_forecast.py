@@ -0,0 +1,133 @@
+import time
+import uuid
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app import forecast
+from app.config import Settings
+from app.events import get_event_hub
+from app.metrics import metrics
+
+TODAY = date(2026, 1, 15)
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _household(client, name: str) -> str:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": name})
+    return token
+
+
+def _renewal(client, token: str, car_id: str, kind: str, valid_from: date, valid_to: date, cost: int | None) -> dict:
+    payload = {"kind": kind, "valid_from": valid_from.isoformat(), "valid_to": valid_to.isoformat(), "cost_pence": cost}
+    r = client.post(f"/api/cars/{car_id}/renewals", headers=_auth(token), json=payload)
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def _days(d: date) -> int:
+    return (d - date(1970, 1, 1)).days
+
+
+def test_projection_follows_cadence_and_falls_back_to_the_kind_median():
+    rows = [
+        # car 0: yearly insurance, priced, ends in 30 days; MOT lapsed 10 days ago, unpriced
+        (0, "INSURANCE", TODAY - timedelta(days=700), TODAY - timedelta(days=336), 40_000),
+        (0, "INSURANCE", TODAY - timedelta(days=335), TODAY + timedelta(days=30), 44_000),
+        (0, "MOT", TODAY - timedelta(days=375), TODAY - timedelta(days=10), None),
+        # car 1: yearly MOT ending in 100 days
+        (1, "MOT", TODAY - timedelta(days=265), TODAY + timedelta(days=100), 5_000),
+        # car 2: six-monthly tax ending in 10 days; an old price outside HISTORY_YEARS is ignored
+        (2, "TAX", TODAY - timedelta(days=1500), TODAY - timedelta(days=1318), 1),
+        (2, "TAX", TODAY - timedelta(days=172), TODAY + timedelta(days=10), 9_000),
+    ]
+    kinds = {"INSURANCE": 0, "MOT": 1, "TAX": 2}
+    car, kind, start, end, cost = zip(
+        *((c, kinds[k], _days(s), _days(e), -1 if p is None else p) for c, k, s, e, p in rows), strict=True
+    )
+    p = forecast.project(
+        np.array(car), np.array(kind), np.array(start), np.array(end), np.array(cost), cars=3, today=TODAY, months=12
+    )
+    got = sorted(
+        (int(c), int(k), date(1970, 1, 1) + timedelta(days=int(d)), int(e), bool(o))
+        for c, k, d, e, o in zip(p.car, p.kind, p.due, p.estimate, p.own_history, strict=True)
+    )
+    assert got == [
+        (0, 0, TODAY + timedelta(days=31), 42_000, True),
+        (0, 1, TODAY, 5_000, False),  # lapsed: due now, priced like car 1's MOT
+        (1, 1, TODAY + timedelta(days=101), 5_000, True),
+        (2, 2, TODAY + timedelta(days=11), 9_000, True),
+        (2, 2, TODAY + timedelta(days=11 + 183), 9_000, True),
+    ]
+    assert p.car_total.tolist() == [47_000, 5_000, 18_000]
+
+
+@pytest.fixture()
+def listening(client):
+    settings = Settings.from_env()
+    forecast.get_forecast_cache(settings)
+    assert get_event_hub(settings).listening.wait(5), "listener did not start"
+    return settings
+
+
+def test_forecast_endpoint_is_cached_until_a_renewal_changes(client, listening):
+    token = _household(client, "Forecasts")
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "FC1"}).json()
+    ends = TODAY + timedelta(days=40)
+    renewal = _renewal(client, token, car["id"], "INSURANCE", ends - timedelta(days=364), ends, 50_000)
+    _renewal(client, token, car["id"], "TAX", ends - timedelta(days=364), ends, None)
+    old = client.post("/api/cars", headers=_auth(token), json={"registration_number": "OLD1"}).json()
+    _renewal(client, token, old["id"], "MOT", ends - timedelta(days=364), ends, 7_000)
+    client.patch(f"/api/cars/{old['id']}", headers=_auth(token), json={"is_archived": True})
+
+    url = f"/api/forecast?as_of={TODAY.isoformat()}"
+    r = client.get(url, headers=_auth(token))
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["as_of"] == "2026-01-15" and body["until"] == "2027-01-15"
+    assert body["total_pence"] == 50_000 and body["unpriced"] == 1
+    assert body["by_kind"] == {"INSURANCE": 50_000, "MOT": 0, "TAX": 0}
+    assert len(body["by_month"]) == 13
+    assert body["by_month"][1] == {"month": "2026-02-01", "total_pence": 50_000, "renewals": 2}
+    [forecast_car] = body["cars"]  # archived car left out
+    assert forecast_car["registration_number"] == "FC1" and forecast_car["total_pence"] == 50_000
+    due = (ends + timedelta(days=1)).isoformat()
+    assert forecast_car["renewals"] == [
+        {"kind": "INSURANCE", "due_date": due, "estimate_pence": 50_000, "basis": "car"},
+        {"kind": "TAX", "due_date": due, "estimate_pence": None, "basis": None},
+    ]
+    assert client.get(url, headers=_auth(token)).json() == body
+    assert metrics.get("forecast.builds") == 1 and metrics.get("forecast.hits") == 1
+
+    client.patch(f"/api/renewals/{renewal['id']}", headers=_auth(token), json={"cost_pence": 60_000})
+    deadline = time.monotonic() + 5
+    while (total := client.get(url, headers=_auth(token)).json()["total_pence"]) == 50_000:
+        assert time.monotonic() < deadline, "forecast never picked up the change"
+        time.sleep(0.02)
+    assert total == 60_000
+    assert metrics.get("forecast.builds") == 2
+
+    # a listener reconnect (notifications possibly missed) drops every forecast
+    forecast.get_forecast_cache(listening).on_change(None, None)
+    assert client.get(url, headers=_auth(token)).json()["total_pence"] == 60_000
+    assert metrics.get("forecast.builds") == 3
+
+
+def test_forecast_needs_a_household_and_a_sane_horizon(client):
+    token = _household(client, "Empty")
+    r = client.get("/api/forecast", headers=_auth(token))
+    assert r.status_code == 200
+    assert r.json()["cars"] == [] and r.json()["total_pence"] == 0
+    assert client.get("/api/forecast?months=0", headers=_auth(token)).status_code == 422
+
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    login = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()
+    assert client.get("/api/forecast", headers=_auth(login["access_token"])).status_code == 409
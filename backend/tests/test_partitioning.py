@@ -0,0 +1,64 @@
+import uuid
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app import partitioning
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture()
+def range_partitioned(engine, db_session):
+    # The client shares db_session; end its transaction so the DDL can take its lock.
+    db_session.rollback()
+    with engine.begin() as conn:
+        partitioning.convert(conn, "range")
+    try:
+        yield
+    finally:
+        db_session.rollback()
+        with engine.begin() as conn:
+            partitioning.convert(conn, "none")
+
+
+def _setup_car(client) -> tuple[str, str]:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": "Parts"})
+    r = client.post("/api/cars", headers=_auth(token), json={"registration_number": "P4RT"})
+    assert r.status_code == 201, r.text
+    return token, r.json()["id"]
+
+
+def test_range_partitions_serve_the_api_and_roll_forward(client, engine, db_session, range_partitioned):
+    token, car_id = _setup_car(client)
+    today = date.today()
+    far = date(today.year + 5, 6, 1)
+
+    for start, end in ((today - timedelta(days=400), today - timedelta(days=30)), (today, far)):
+        payload = {"kind": "MOT", "valid_from": start.isoformat(), "valid_to": end.isoformat()}
+        r = client.post(f"/api/cars/{car_id}/renewals", headers=_auth(token), json=payload)
+        assert r.status_code == 201, r.text
+
+    r = client.get("/api/renewals/upcoming?days=60", headers=_auth(token))
+    assert r.status_code == 200, r.text
+    assert {(i["kind"], i["status"]) for i in r.json()} == {("INSURANCE", "missing"), ("TAX", "missing")}
+
+    db_session.rollback()
+    with engine.begin() as conn:
+        assert partitioning.current_strategy(conn) == "range"
+        # beyond the pre-created years, the record landed in DEFAULT
+        assert conn.execute(text("SELECT count(*) FROM renewals_default")).scalar_one() == 1
+        created = partitioning.ensure_future_partitions(conn, years_ahead=5)
+        assert f"renewals_y{far.year}" in created
+        assert conn.execute(text("SELECT count(*) FROM renewals_default")).scalar_one() == 0
+        assert conn.execute(text(f"SELECT count(*) FROM renewals_y{far.year}")).scalar_one() == 1
+        assert partitioning.ensure_future_partitions(conn, years_ahead=5) == []
+
+    r = client.get(f"/api/cars/{car_id}/renewals", headers=_auth(token))
+    assert r.status_code == 200 and len(r.json()) == 2, r.text
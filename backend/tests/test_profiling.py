@@ -0,0 +1,158 @@
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.deps import get_db
+from app.main import create_app
+from app.metrics import metrics
+from app.profiling import ProfilingMiddleware, Sampler, collapse
+
+ADMIN = {"X-Admin-Token": "s3cret"}
+
+
+def _spin(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@pytest.fixture()
+def admin_client(db_session, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+    monkeypatch.setenv("PROFILER_INTERVAL_MS", "2")
+    app = create_app(Settings.from_env())
+
+    def override_get_db():
+        yield db_session
+
+    app.dependency_overrides[get_db] = override_get_db
+    with TestClient(app) as c:
+        yield c
+
+
+def test_sampler_counts_busy_threads_and_skips_idle_ones():
+    idle = threading.Event()
+    threading.Thread(target=idle.wait, daemon=True).start()  # blocked in threading.py, root is ours
+    busy = threading.Thread(target=_spin, args=(0.5,), daemon=True)
+    busy.start()
+
+    sampler = Sampler(0.001)
+    for _ in range(5):
+        sampler.sample()
+    idle.set()
+    busy.join()
+
+    stacks = dict(sampler.top())
+    spinning = [s for s in stacks if s.split(";")[-1].startswith("_spin ")]
+    assert len(spinning) == 1 and stacks[spinning[0]] == 5
+    assert spinning[0].split(";")[0].startswith("Thread._bootstrap ")  # root first
+    assert sampler.samples == 5
+    line = sampler.folded(1).strip()
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+
+def test_collapse_treats_pool_workers_as_idle():
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        ident = pool.submit(threading.get_ident).result()
+        time.sleep(0.01)  # back to waiting on the work queue
+        assert collapse(sys._current_frames()[ident]) is None
+
+
+def test_admin_endpoints_need_the_token(admin_client, monkeypatch):
+    assert admin_client.get("/admin/profiles").status_code == 403
+    assert admin_client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert admin_client.get("/admin/profiles", headers=ADMIN).status_code == 200
+    # The app's own settings count, not the environment's.
+    monkeypatch.delenv("ADMIN_TOKEN")
+    assert admin_client.get("/admin/profiles", headers=ADMIN).status_code == 200
+    # no ADMIN_TOKEN configured: nothing gets in
+    with TestClient(create_app(Settings.from_env())) as other:
+        assert other.get("/admin/profiles", headers=ADMIN).status_code == 403
+
+
+def test_profiled_request(admin_client, monkeypatch):
+    from app.routers import renewals
+
+    compute = renewals._compute_upcoming
+
+    def _slow_upcoming(*args, **kwargs):
+        _spin(0.05)
+        return compute(*args, **kwargs)
+
+    monkeypatch.setattr(renewals, "_compute_upcoming", _slow_upcoming)
+    email = "profiled@example.com"
+    admin_client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = admin_client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+    admin_client.post("/api/households", headers=auth, json={"name": "Profiled"})
+
+    # X-Profile without the admin token is ignored
+    r = admin_client.get("/api/renewals/upcoming", headers={**auth, "X-Profile": "1"})
+    assert r.status_code == 200 and "x-profile-id" not in r.headers
+
+    r = admin_client.get("/api/renewals/upcoming", headers={**auth, **ADMIN, "X-Profile": "1"})
+    assert r.status_code == 200
+    profile_id = r.headers["x-profile-id"]
+
+    (listed,) = admin_client.get("/admin/profiles", headers=ADMIN).json()
+    assert listed["id"] == profile_id and listed["path"] == "/api/renewals/upcoming"
+    assert listed["status"] == 200 and listed["duration_ms"] >= 50 and listed["samples"] > 0
+
+    folded = admin_client.get(f"/admin/profiles/{profile_id}", headers=ADMIN)
+    assert folded.headers["content-type"].startswith("text/plain")
+    assert "_slow_upcoming" in folded.text
+    assert admin_client.get("/admin/profiles/nope", headers=ADMIN).status_code == 404
+
+
+def test_one_request_profiled_at_a_time_and_never_a_stream(monkeypatch):
+    monkeypatch.setenv("PROFILE_REQUEST_RATE", "1")
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/api/slow":
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = ProfilingMiddleware(app, settings=Settings.from_env())
+
+    async def profiled(path: str) -> bool:
+        started = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                started.append(dict(message["headers"]))
+
+        await middleware({"type": "http", "method": "GET", "path": path, "headers": []}, None, send)
+        return b"x-profile-id" in started[0]
+
+    async def run():
+        slow = asyncio.create_task(profiled("/api/slow"))
+        await asyncio.sleep(0)  # now sampling, until released
+        meanwhile = await profiled("/api/cars")
+        release.set()
+        return await slow, meanwhile, await profiled("/api/events"), await profiled("/api/cars")
+
+    assert asyncio.run(run()) == (True, False, False, True)
+    assert metrics.get("profiler.requests.skipped") == 1
+
+
+def test_continuous_profiler_reports_hot_stacks(admin_client):
+    admin_client.get("/admin/profiler", headers=ADMIN, params={"reset": True})
+    worker = threading.Thread(target=_spin, args=(0.3,), daemon=True)
+    worker.start()
+    worker.join()
+
+    report = admin_client.get("/admin/profiler", headers=ADMIN, params={"format": "json"}).json()
+    assert report["interval_ms"] == 2 and report["samples"] > 0
+    assert 0 <= report["overhead_pct"] < 100
+    assert any("_spin" in s["stack"] for s in report["stacks"])
+
+    folded = admin_client.get("/admin/profiler", headers=ADMIN, params={"top": 5}).text
+    assert 0 < len(folded.splitlines()) <= 5
@@ -0,0 +1,159 @@
+import os
+import uuid
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select, text
+
+# Statements per request, auth included. Lower is fine (update the number);
+# higher means a round trip crept back into the handler. Car and renewal
+# handlers check ownership inside their one statement (app.scoped).
+ONE = 1
+HOUSEHOLD = 1  # membership lookup, for handlers that need the household id up front
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture()
+def fleet(client):
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": "Counts"})
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "QC1"}).json()
+    today = date.today()
+    renewal = client.post(
+        f"/api/cars/{car['id']}/renewals",
+        headers=_auth(token),
+        json={"kind": "MOT", "valid_from": today.isoformat(), "valid_to": (today + timedelta(days=365)).isoformat()},
+    ).json()
+    return token, car["id"], renewal["id"]
+
+
+def _run(client, count_queries, method: str, url: str, token: str, **kwargs):
+    with count_queries() as statements:
+        r = client.request(method, url, headers=_auth(token), **kwargs)
+    assert r.status_code < 300, r.text
+    return statements
+
+
+def test_car_write_path_query_counts(client, count_queries, fleet):
+    token, car_id, _ = fleet
+
+    statements = _run(client, count_queries, "POST", "/api/cars", token, json={"registration_number": "QC2"})
+    assert len(statements) == ONE, statements
+    assert "RETURNING" in statements[-1]
+
+    statements = _run(client, count_queries, "PATCH", f"/api/cars/{car_id}", token, json={"make": "Ford"})
+    assert len(statements) == ONE, statements
+
+    statements = _run(client, count_queries, "POST", f"/api/cars/{car_id}/archive", token)
+    assert len(statements) == ONE, statements
+
+    statements = _run(client, count_queries, "POST", f"/api/cars/{car_id}/unarchive", token)
+    assert len(statements) == ONE, statements
+
+
+def test_renewal_write_path_query_counts(client, count_queries, fleet):
+    token, car_id, renewal_id = fleet
+    today = date.today()
+
+    payload = {"kind": "TAX", "valid_from": today.isoformat(), "valid_to": (today + timedelta(days=30)).isoformat()}
+    statements = _run(client, count_queries, "POST", f"/api/cars/{car_id}/renewals", token, json=payload)
+    assert len(statements) == ONE, statements  # INSERT ... SELECT from the owned car
+
+    statements = _run(client, count_queries, "PATCH", f"/api/renewals/{renewal_id}", token, json={"cost_pence": 100})
+    assert len(statements) == ONE, statements
+
+    statements = _run(client, count_queries, "DELETE", f"/api/renewals/{renewal_id}", token)
+    assert len(statements) == ONE, statements
+
+
+def test_read_path_query_counts(client, count_queries, fleet):
+    token, car_id, _ = fleet
+
+    for url in ("/api/cars", f"/api/cars/{car_id}", f"/api/cars/{car_id}/renewals", f"/api/cars/{car_id}/renewals?kind=MOT"):
+        statements = _run(client, count_queries, "GET", url, token)
+        assert len(statements) == ONE, (url, statements)
+
+    # upcoming: membership (for the shared-computation key), then cars, current and lapsed cover
+    statements = _run(client, count_queries, "GET", "/api/renewals/upcoming", token)
+    assert len(statements) == HOUSEHOLD + 3, statements
+
+
+def test_renewal_list_tells_empty_from_not_found(client, fleet):
+    token, _, _ = fleet
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "QC9"}).json()
+    assert client.get(f"/api/cars/{car['id']}/renewals", headers=_auth(token)).json() == []
+    assert client.get(f"/api/cars/{uuid.uuid4()}/renewals", headers=_auth(token)).status_code == 404
+
+
+def test_no_household_is_409_on_every_handler(client, fleet):
+    _, car_id, renewal_id = fleet
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+
+    calls = [
+        ("GET", "/api/cars", None),
+        ("POST", "/api/cars", {"registration_number": "NH1"}),
+        ("GET", f"/api/cars/{car_id}", None),
+        ("PATCH", f"/api/cars/{car_id}", {"make": "X"}),
+        ("GET", f"/api/cars/{car_id}/renewals", None),
+        ("PATCH", f"/api/renewals/{renewal_id}", {"notes": "x"}),
+        ("DELETE", f"/api/renewals/{renewal_id}", None),
+    ]
+    for method, url, body in calls:
+        r = client.request(method, url, headers=_auth(token), json=body)
+        assert r.status_code == 409, (method, url, r.text)
+
+
+def test_update_other_households_car_is_404(client, fleet):
+    _, car_id, renewal_id = fleet
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": "Other"})
+
+    assert client.get(f"/api/cars/{car_id}", headers=_auth(token)).status_code == 404
+    assert client.get(f"/api/cars/{car_id}/renewals", headers=_auth(token)).status_code == 404
+    assert client.patch(f"/api/cars/{car_id}", headers=_auth(token), json={"make": "X"}).status_code == 404
+    assert client.patch(f"/api/renewals/{renewal_id}", headers=_auth(token), json={"notes": "x"}).status_code == 404
+    assert client.delete(f"/api/renewals/{renewal_id}", headers=_auth(token)).status_code == 404
+    payload = {"kind": "TAX", "valid_from": date.today().isoformat(), "valid_to": date.today().isoformat()}
+    assert client.post(f"/api/cars/{car_id}/renewals", headers=_auth(token), json=payload).status_code == 404
+
+
+def test_hot_statements_are_compiled_once_and_prepared(fleet):
+    from app import scoped
+    from app.db import get_engine, make_session_factory
+    from app.deps import household_id_for
+    from app.enums import RenewalKind
+    from app.metrics import metrics
+    from app.models import HouseholdMember
+
+    _, car_id, _ = fleet
+    # A fresh engine (so an empty compiled cache) that prepares statements on first use.
+    engine = get_engine(os.environ["DATABASE_URL"] + "?application_name=prepared", prepare_threshold=0)
+    try:
+        with make_session_factory(engine)() as db:
+            user_id = db.scalar(select(HouseholdMember.user_id))
+
+            def hot_reads():
+                household_id_for(db, user_id)
+                assert len(scoped.list_cars(db, user_id, include_archived=False)) == 1
+                assert len(scoped.list_renewals(db, user_id, uuid.UUID(car_id), kind=RenewalKind.MOT)) == 1
+
+            hot_reads()
+            assert metrics.get("db.statement_cache.hit") == 0
+            misses = metrics.get("db.statement_cache.miss")
+            hot_reads()
+            assert metrics.get("db.statement_cache.hit") == 3
+            assert metrics.get("db.statement_cache.miss") == misses
+
+            assert db.connection().connection.driver_connection.prepare_threshold == 0
+            assert db.scalar(text("SELECT count(*) FROM pg_prepared_statements")) >= 3
+    finally:
+        engine.dispose()
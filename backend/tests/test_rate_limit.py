@@ -0,0 +1,53 @@
+import uuid
+
+from app.ratelimit import InMemoryBucketStore
+
+
+def test_login_is_throttled_per_email_before_password_check(client, monkeypatch):
+    monkeypatch.setenv("LOGIN_RATE_PER_EMAIL", "2")
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    r = client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    assert r.status_code == 201, r.text
+
+    for _ in range(2):
+        r = client.post("/api/auth/login", json={"email": email, "password": "wrong-password"})
+        assert r.status_code == 401, r.text
+
+    # bucket empty: rejected even with the right password, and case-insensitively
+    r = client.post("/api/auth/login", json={"email": email.upper(), "password": "string1234"})
+    assert r.status_code == 429, r.text
+    assert int(r.headers["Retry-After"]) >= 1
+
+    r = client.post("/api/auth/token", data={"username": email, "password": "string1234"})
+    assert r.status_code == 429, r.text
+
+    # another account from the same client is unaffected
+    other = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": other, "password": "string1234"})
+    r = client.post("/api/auth/login", json={"email": other, "password": "string1234"})
+    assert r.status_code == 200, r.text
+
+    counters = client.get("/metrics").json()
+    assert counters["auth.rate_limited.email"] == 2
+    assert counters["auth.rate_limit.checks"] == 5
+
+
+def test_login_is_throttled_per_ip(client, monkeypatch):
+    monkeypatch.setenv("LOGIN_RATE_PER_IP", "1")
+    r = client.post("/api/auth/login", json={"email": "a@example.com", "password": "x"})
+    assert r.status_code == 401, r.text
+    r = client.post("/api/auth/login", json={"email": "b@example.com", "password": "x"})
+    assert r.status_code == 429, r.text
+    assert client.get("/metrics").json()["auth.rate_limited.ip"] == 1
+
+
+def test_in_memory_bucket_refills_and_bounds_keys():
+    store = InMemoryBucketStore(max_keys=2)
+    assert store.take("k", capacity=1, refill_per_sec=1000) == 0
+    # bucket is empty and refills slowly, so the caller is told how long to wait
+    retry = store.take("k", capacity=1, refill_per_sec=0.001)
+    assert 0 < retry <= 1000
+
+    store.take("a", capacity=1, refill_per_sec=1)
+    store.take("b", capacity=1, refill_per_sec=1)
+    assert len(store._buckets) == 2
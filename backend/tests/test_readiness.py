@@ -0,0 +1,112 @@
+import os
+from dataclasses import replace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from app.config import Settings
+from app.db import DatabaseRouter
+from app.health import Readiness, Thresholds
+from app.main import create_app
+from app.metrics import metrics
+
+_IDLE = {"busy": 0, "size": 40}
+
+
+def test_live_and_ready_report_the_numbers_behind_the_answer(client, monkeypatch):
+    monkeypatch.setenv("READINESS_CACHE_SECONDS", "60")
+    assert client.get("/health/live").json() == {"status": "ok"}
+
+    res = client.get("/health/ready")
+    assert res.status_code == 200
+    body = res.json()
+    assert body["status"] == "ready" and body["failing"] == []
+    assert set(body["pools"]["primary"]) == {"checked_out", "overflow", "size", "capacity", "utilization"}
+    assert body["database"]["primary"]["ok"] is True
+    assert body["database"]["primary"]["ms"] >= 0
+    assert body["cache"] == {"configured": False}
+    assert body["requests"]["queued"] == 0
+    assert body["threads"]["size"] > 0
+
+    # Within READINESS_CACHE_SECONDS the round trips are reused, the gauges are not.
+    again = client.get("/health/ready").json()
+    assert again["checked_at"] == body["checked_at"]
+    assert metrics.get("health.probes") == 1
+
+
+def test_ready_fails_past_a_threshold(client, monkeypatch):
+    monkeypatch.setenv("READINESS_CACHE_SECONDS", "0")
+    monkeypatch.setenv("READINESS_THRESHOLDS", "db_ms=0")
+    res = client.get("/health/ready")
+    assert res.status_code == 503
+    assert res.json()["status"] == "not_ready"
+    assert res.json()["failing"] == ["db_ms"]
+    assert res.json()["thresholds"]["db_ms"] == 0
+    assert metrics.get("health.not_ready") == 1
+    # Liveness is unaffected.
+    assert client.get("/health/live").status_code == 200
+
+
+def test_bad_thresholds_fail_at_startup():
+    with pytest.raises(ValueError, match="Unknown READINESS_THRESHOLDS: pol"):
+        create_app(replace(Settings.from_env(), readiness_thresholds={"pol": 0.9}))
+
+
+def test_ready_uses_the_settings_the_app_was_built_with():
+    settings = replace(Settings.from_env(), readiness_cache_seconds=0, readiness_thresholds={"db_ms": 0})
+    with TestClient(create_app(settings)) as client:
+        res = client.get("/health/ready")
+    assert res.status_code == 503 and res.json()["failing"] == ["db_ms"]
+
+
+def test_saturated_pool_queue_and_threads_fail_readiness_without_a_round_trip():
+    engine = create_engine(os.environ["DATABASE_URL"], pool_size=1, max_overflow=0)
+    readiness = Readiness(
+        DatabaseRouter(engine, []), redis_url=None, cache_seconds=0, thresholds=Thresholds(queued=2, threads=0.5)
+    )
+    try:
+        with engine.connect():
+            probed = readiness.probe()
+            assert probed["database"]["primary"] == {"ok": False, "error": "pool exhausted"}
+            admission = {"default": {"limit": 8, "in_flight": 8, "queued": 3}}
+            ready, body = readiness.report(probed, admission=admission, threads={"busy": 1, "size": 2})
+        assert not ready
+        assert body["failing"] == ["pool", "database", "queued", "threads"]
+        assert body["pools"]["primary"]["utilization"] == 1.0
+        assert body["requests"]["in_flight"] == 8
+
+        # Not probed (threadpool full): judged on the gauges alone.
+        ready, body = readiness.report(None, admission={}, threads=_IDLE)
+        assert ready and body["database"] is None
+    finally:
+        engine.dispose()
+
+
+def test_shards_are_reported_and_held_to_the_primary_limits():
+    primary = create_engine(os.environ["DATABASE_URL"])
+    shard = create_engine(os.environ["DATABASE_URL"], pool_size=1, max_overflow=0)
+    dead = create_engine("postgresql+psycopg://nobody@127.0.0.1:1/none?connect_timeout=1")
+    readiness = Readiness(
+        DatabaseRouter(primary, []),
+        redis_url=None,
+        cache_seconds=0,
+        thresholds=Thresholds(),
+        shards={"s1": shard, "s2": dead},
+    )
+    try:
+        ready, body = readiness.report(readiness.probe(), admission={}, threads=_IDLE)
+        assert not ready and body["failing"] == ["shard:s2:database"]
+        assert body["database"]["shard:s1"]["ok"] and set(body["pools"]) == {"primary", "shard:s1", "shard:s2"}
+        with shard.connect():
+            _, body = readiness.report(readiness.probe(), admission={}, threads=_IDLE)
+        assert body["failing"] == ["shard:s1:pool", "shard:s1:database", "shard:s2:database"]
+    finally:
+        for engine in (primary, shard, dead):
+            engine.dispose()
+
+
+def test_thresholds_parse():
+    assert Thresholds.parse({"queued": 5.0, "pool": 0.5}) == Thresholds(pool=0.5, queued=5)
+    with pytest.raises(ValueError, match="latency"):
+        Thresholds.parse({"latency": 1.0})
@@ -0,0 +1,158 @@
+import uuid
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import search
+from app.metrics import metrics
+from app.search import has_trigram
+
+AUTH = 3  # users row, membership, household
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _household(client, name: str) -> str:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": name})
+    return token
+
+
+def _car(client, token: str, vrm: str, **extra) -> dict:
+    return client.post("/api/cars", headers=_auth(token), json={"registration_number": vrm, **extra}).json()
+
+
+def _renewal(client, token: str, car_id: str, **fields) -> dict:
+    today = date.today()
+    payload = {"kind": "INSURANCE", "valid_from": today.isoformat(), "valid_to": (today + timedelta(days=365)).isoformat()}
+    return client.post(f"/api/cars/{car_id}/renewals", headers=_auth(token), json={**payload, **fields}).json()
+
+
+def _search(client, token: str, q: str, **params):
+    r = client.get("/api/search", headers=_auth(token), params={"q": q, **params})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_search_is_household_scoped_and_normalized(client):
+    mine = _household(client, "Mine")
+    theirs = _household(client, "Theirs")
+    car = _car(client, mine, "ab12 cde", make="Ford", model="Focus")
+    _car(client, theirs, "AB12 CDE")
+
+    hits = _search(client, mine, "  ab12 ")["items"]
+    assert [(h["type"], h["id"]) for h in hits] == [("car", car["id"])]
+    assert hits[0]["registration_number"] == "AB12 CDE"
+
+    assert [h["id"] for h in _search(client, mine, "focus")["items"]] == [car["id"]]
+
+
+def test_search_ranks_exact_then_prefix_then_substring(client):
+    token = _household(client, "Rank")
+    middle = _car(client, token, "XAB12")
+    exact = _car(client, token, "AB12")
+    prefix = _car(client, token, "AB12XYZ")
+
+    hits = _search(client, token, "ab12")["items"]
+    assert [h["id"] for h in hits] == [exact["id"], prefix["id"], middle["id"]]
+    assert hits[0]["score"] > hits[1]["score"] > hits[2]["score"]
+
+
+def test_search_finds_live_renewals(client):
+    token = _household(client, "Renewals")
+    car = _car(client, token, "RN1")
+    live = _renewal(client, token, car["id"], provider="Admiral", reference="POL-77")
+    gone = _renewal(client, token, car["id"], provider="Admiral Direct")
+    client.delete(f"/api/renewals/{gone['id']}", headers=_auth(token))
+    noted = _renewal(client, token, car["id"], kind="MOT", notes="advisory: front tyres admiral")
+
+    hits = _search(client, token, "admiral")["items"]
+    assert {h["id"] for h in hits} == {live["id"], noted["id"]}
+    assert all(h["type"] == "renewal" and h["car_id"] == car["id"] for h in hits)
+    assert all(h["registration_number"] == "RN1" for h in hits)
+
+    (hit,) = _search(client, token, "pol-77")["items"]
+    assert (hit["id"], hit["kind"], hit["reference"]) == (live["id"], "INSURANCE", "POL-77")
+
+
+def test_search_paginates(client):
+    token = _household(client, "Pages")
+    ids = {_car(client, token, f"PG{i}")["id"] for i in range(5)}
+
+    seen, offset = [], 0
+    while offset is not None:
+        page = _search(client, token, "PG", limit=2, offset=offset)
+        assert len(page["items"]) <= 2
+        seen += [h["id"] for h in page["items"]]
+        offset = page["next_offset"]
+    assert len(seen) == 5 and set(seen) == ids
+
+
+def test_search_treats_like_wildcards_literally(client):
+    token = _household(client, "Wild")
+    _car(client, token, "WC1")
+    assert _search(client, token, "%%")["items"] == []
+    assert _search(client, token, "W_1")["items"] == []
+    assert client.get("/api/search", headers=_auth(token), params={"q": "W"}).status_code == 422
+
+
+def test_search_is_one_statement(client, count_queries):
+    token = _household(client, "Count")
+    car = _car(client, token, "QS1")
+    _renewal(client, token, car["id"], provider="QS Insure")
+    _search(client, token, "QS")  # first call also checks for pg_trgm
+
+    with count_queries() as statements:
+        assert len(_search(client, token, "QS")["items"]) == 2
+    assert len(statements) == AUTH + 1, statements
+
+
+def test_missing_pg_trgm_is_reported_once(db_session):
+    search._trigram.clear()
+    found = has_trigram(db_session)
+    has_trigram(db_session)
+    assert metrics.get("search.trigram_missing") == (0 if found else 1)
+
+
+class _Checked:
+    """Just enough of a session for has_trigram, with pg_trgm installed or not."""
+
+    def __init__(self, engine, installed: bool) -> None:
+        self.engine, self.installed, self.checks = engine, installed, 0
+
+    def get_bind(self):
+        return self.engine
+
+    def execute(self, stmt):
+        self.checks += 1
+        return SimpleNamespace(scalar_one=lambda: self.installed)
+
+
+def test_a_missing_pg_trgm_is_looked_for_again(engine, monkeypatch):
+    monkeypatch.setattr(search, "_trigram", {})
+    db = _Checked(engine, installed=False)
+    assert not has_trigram(db) and not has_trigram(db)
+    assert db.checks == 1  # within TRIGRAM_RECHECK_SECONDS
+
+    monkeypatch.setattr(search, "TRIGRAM_RECHECK_SECONDS", 0)
+    db.installed = True
+    assert has_trigram(db) and has_trigram(db)
+    assert db.checks == 2  # once found, never checked again
+    assert metrics.get("search.trigram_missing") == 1
+
+
+def test_fuzzy_matches_need_pg_trgm(client, db_session):
+    if not has_trigram(db_session):
+        pytest.skip("pg_trgm is not installed in the test database")
+    token = _household(client, "Fuzzy")
+    car = _car(client, token, "AB12CDE")
+    _car(client, token, "ZZ99ZZZ")
+
+    hits = _search(client, token, "AB12CDF")["items"]  # one character off
+    assert [h["id"] for h in hits] == [car["id"]]
+    assert hits[0]["score"] < 1  # fuzzy-only matches rank below any substring match
@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+
+import pytest
+from alembic.config import Config
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.engine import make_url
+
+from alembic import command
+from app import audit
+from app.config import Settings
+from app.main import app
+from app.metrics import metrics
+from app.models import Car, HouseholdMember, HouseholdShard, RenewalRecord
+from app.shards import DEFAULT, HashRing, ShardMoved, get_shard_router, move
+
+# Point TEST_SHARD_DATABASE_URLS at other servers ("name=url,..."). By default
+# two more databases are created next to the test database.
+
+_TABLES = (
+    "attachments, renewals, renewals_archive, cars_archive, cars, audit_outbox, audit_log, "
+    "household_members, household_shards, households, users"
+)
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _shard_urls() -> dict[str, str]:
+    if configured := os.getenv("TEST_SHARD_DATABASE_URLS"):
+        return {name: url for name, _, url in (p.partition("=") for p in configured.split(","))}
+    base = make_url(os.environ["DATABASE_URL"])
+    return {
+        f"s{i}": base.set(database=f"{base.database}_shard{i}").render_as_string(hide_password=False) for i in (1, 2)
+    }
+
+
+@pytest.fixture(scope="module")
+def shard_urls() -> dict[str, str]:
+    urls = _shard_urls()
+    if not os.getenv("TEST_SHARD_DATABASE_URLS"):
+        server = create_engine(os.environ["DATABASE_URL"], isolation_level="AUTOCOMMIT")
+        try:
+            with server.connect() as conn:
+                for url in urls.values():
+                    name = make_url(url).database
+                    if conn.scalar(text("SELECT 1 FROM pg_database WHERE datname = :n"), {"n": name}) is None:
+                        conn.execute(text(f"CREATE DATABASE \"{name}\" ENCODING 'UTF8' TEMPLATE template0"))
+        except Exception as err:
+            pytest.skip(f"cannot create shard databases ({type(err).__name__}); set TEST_SHARD_DATABASE_URLS")
+        finally:
+            server.dispose()
+    directory = os.environ["DATABASE_URL"]
+    try:
+        for url in urls.values():
+            os.environ["DATABASE_URL"] = url  # alembic/env.py reads it
+            command.upgrade(Config("alembic.ini"), "head")
+    finally:
+        os.environ["DATABASE_URL"] = directory
+    return urls
+
+
+@pytest.fixture()
+def sharded(shard_urls, monkeypatch):
+    """A client using the real get_db with DATABASE_SHARDS set, plus each shard's engine."""
+    engines = {name: create_engine(url) for name, url in shard_urls.items()}
+    for engine in engines.values():
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE TABLE {_TABLES} RESTART IDENTITY CASCADE"))
+    monkeypatch.setenv("DATABASE_SHARDS", ",".join(f"{n}={u}" for n, u in shard_urls.items()))
+    monkeypatch.setenv("AUDIT_FLUSH_INTERVAL_SECONDS", "0")
+    with TestClient(app) as client:
+        yield client, engines
+    for engine in engines.values():
+        engine.dispose()
+
+
+def _household(client, name: str) -> tuple[str, uuid.UUID]:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    r = client.post("/api/households", headers=_auth(token), json={"name": name})
+    assert r.status_code == 201, r.text
+    return token, uuid.UUID(r.json()["id"])
+
+
+def _household_on_a_shard(client) -> tuple[str, uuid.UUID, str]:
+    router = get_shard_router(Settings.from_env())
+    for i in range(40):
+        token, household_id = _household(client, f"H{i}")
+        shard = router.shard_of(household_id, fresh=True)
+        if shard != DEFAULT:
+            return token, household_id, shard
+    raise AssertionError("the ring never picked a shard")
+
+
+def _cars_on(engine, household_id: uuid.UUID) -> list[str]:
+    with engine.connect() as conn:
+        return sorted(conn.scalars(select(Car.registration_number).where(Car.household_id == household_id)))
+
+
+def test_hash_ring_spreads_keys_and_a_new_shard_takes_only_its_share():
+    keys = [uuid.uuid4() for _ in range(6_000)]
+    ring = HashRing(["default", "s1", "s2"])
+    placed = {k: ring.node(k) for k in keys}
+    assert placed == {k: ring.node(k) for k in keys}  # stable
+    counts = Counter(placed.values())
+    assert set(counts) == {"default", "s1", "s2"}
+    assert min(counts.values()) > 6_000 / 3 * 0.7
+
+    grown = HashRing(["default", "s1", "s2", "s3"])
+    moved = [k for k in keys if grown.node(k) != placed[k]]
+    assert all(grown.node(k) == "s3" for k in moved)
+    assert 6_000 / 4 * 0.6 < len(moved) < 6_000 / 4 * 1.4
+
+
+def test_new_households_are_placed_and_their_rows_routed_to_their_shard(sharded, engine):
+    client, engines = sharded
+    token, household_id, shard = _household_on_a_shard(client)
+
+    with engine.connect() as conn:  # the directory
+        assert conn.scalar(select(HouseholdShard.shard).where(HouseholdShard.household_id == household_id)) == shard
+        members = conn.scalar(select(HouseholdMember.id).where(HouseholdMember.household_id == household_id))
+    # identity rows are copied, so ownership checks run on the shard alone
+    with engines[shard].connect() as conn:
+        assert conn.scalar(select(HouseholdMember.id).where(HouseholdMember.household_id == household_id)) == members
+
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "SH1"})
+    assert car.status_code == 201, car.text
+    renewal = {"kind": "MOT", "valid_from": "2026-01-01", "valid_to": "2026-12-31"}
+    assert client.post(f"/api/cars/{car.json()['id']}/renewals", headers=_auth(token), json=renewal).status_code == 201
+
+    assert _cars_on(engines[shard], household_id) == ["SH1"]
+    assert _cars_on(engine, household_id) == []
+    assert [c["registration_number"] for c in client.get("/api/cars", headers=_auth(token)).json()] == ["SH1"]
+    assert len(client.get(f"/api/cars/{car.json()['id']}/renewals", headers=_auth(token)).json()) == 1
+    assert client.get("/api/households/current", headers=_auth(token)).json()["id"] == str(household_id)
+
+
+def test_move_keeps_the_household_writable_and_loses_nothing(sharded, engine):
+    client, engines = sharded
+    token, household_id, source = _household_on_a_shard(client)
+    car = client.post("/api/cars", headers=_auth(token), json={"registration_number": "MV0"}).json()
+    renewal = {"kind": "INSURANCE", "valid_from": "2026-01-01", "valid_to": "2026-12-31", "cost_pence": 100}
+    renewal_id = client.post(f"/api/cars/{car['id']}/renewals", headers=_auth(token), json=renewal).json()["id"]
+    assert audit.flush(engines[source]) == 2  # the rest stay in the outbox until after the move
+    target = "s2" if source == "s1" else "s1"
+
+    # Keep adding cars while the household moves; a write caught by the cutover is told to retry.
+    added: list[str] = []
+    refused: list = []
+    stop = threading.Event()
+
+    def writer():
+        i = 1
+        while not stop.is_set():
+            reg = f"MV{i}"
+            r = client.post("/api/cars", headers=_auth(token), json={"registration_number": reg})
+            if r.status_code == 201:
+                added.append(reg)
+                i += 1
+            else:
+                refused.append((r.status_code, r.headers.get("Retry-After"), r.text))
+
+    def wait_for(n: int) -> None:
+        deadline = time.monotonic() + 10
+        while len(added) < n:
+            assert time.monotonic() < deadline, "writes stalled"
+            time.sleep(0.01)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        wait_for(3)
+        result = move(get_shard_router(Settings.from_env()), household_id, target)
+        wait_for(len(added) + 3)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert all(r[:2] == (503, "1") for r in refused), refused
+    assert result["source"] == source and result["target"] == target and result["copied"] > 0
+    expected = sorted(["MV0", *added])
+    assert _cars_on(engines[target], household_id) == expected
+    assert _cars_on(engines[source], household_id) == []
+    with engines[source].connect() as conn:
+        assert conn.scalar(select(RenewalRecord.id).where(RenewalRecord.id == uuid.UUID(renewal_id))) is None
+        assert conn.scalar(select(HouseholdMember.id).where(HouseholdMember.household_id == household_id)) is None
+
+    got = client.get("/api/cars", headers=_auth(token)).json()
+    assert sorted(c["registration_number"] for c in got) == expected
+    patched = client.patch(f"/api/renewals/{renewal_id}", headers=_auth(token), json={"cost_pence": 200})
+    assert patched.status_code == 200, patched.text
+    # The audit trail came along: entries already shipped and those still in the outbox.
+    audit.flush(engines[target])
+    history = client.get("/api/audit?limit=500", headers=_auth(token)).json()
+    assert len(history) == 2 + len(added) + 1
+    assert history[0]["changes"] == {"cost_pence": [100, 200]}
+    assert metrics.get("shards.moves") == 1
+
+
+def test_a_write_routed_by_a_stale_placement_is_fenced(sharded, engine):
+    client, engines = sharded
+    token, household_id, source = _household_on_a_shard(client)
+    assert client.post("/api/cars", headers=_auth(token), json={"registration_number": "ST1"}).status_code == 201
+    router = get_shard_router(Settings.from_env())
+    move(router, household_id, DEFAULT)
+
+    # Another worker, still sure the household is on the old shard.
+    db = router.session()
+    db.info.update(household_id=household_id)
+    db.info["shard_principal"], db.info["shard_household"], db.info["shard"] = (household_id, None), household_id, source
+    with pytest.raises(ShardMoved):
+        db.execute(insert(Car).values(id=uuid.uuid4(), household_id=household_id, registration_number="LOST"))
+    db.close()
+    assert metrics.get("shards.fenced") == 1
+
+    # Over HTTP that is a 503, and the retry lands on the household's new shard.
+    router._remember(household_id, source)
+    r = client.post("/api/cars", headers=_auth(token), json={"registration_number": "ST2"})
+    assert r.status_code == 503 and r.headers["Retry-After"] == "1"
+    assert client.post("/api/cars", headers=_auth(token), json={"registration_number": "ST2"}).status_code == 201
+    assert _cars_on(engine, household_id) == ["ST1", "ST2"]
+    assert _cars_on(engines[source], household_id) == []
@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.main import app
+from app.metrics import metrics
+from app.routers import renewals
+from app.singleflight import RedisSingleFlight, SingleFlight
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _run_concurrently(fn, n: int) -> list:
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return list(pool.map(lambda _: fn(), range(n)))
+
+
+def test_concurrent_callers_share_one_computation():
+    flight = SingleFlight("t", timeout=5)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return ["result"]
+
+    results = _run_concurrently(lambda: flight.do("k", slow), 8)
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert metrics.get("singleflight.t.coalesced") == 7
+
+    # nothing is cached once the computation finished
+    flight.do("k", slow)
+    assert len(calls) == 2
+
+
+def test_waiters_see_the_leaders_error_and_time_out_to_their_own_run():
+    flight = SingleFlight("t", timeout=5)
+    started = threading.Event()
+
+    def boom():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("db down")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "k", boom)
+        started.wait()
+        waiter = pool.submit(flight.do, "k", lambda: "unused")
+        for fut in (leader, waiter):
+            with pytest.raises(RuntimeError, match="db down"):
+                fut.result()
+
+    impatient = SingleFlight("t2", timeout=0.05)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        pool.submit(impatient.do, "k", lambda: time.sleep(0.3))
+        time.sleep(0.02)
+        assert pool.submit(impatient.do, "k", lambda: "own").result() == "own"
+    assert metrics.get("singleflight.t2.timeouts") == 1
+
+
+def test_upcoming_requests_are_coalesced(client, monkeypatch):
+    app.dependency_overrides.clear()  # real get_db: one session per request, as in production
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": "Flight"})
+    client.post("/api/cars", headers=_auth(token), json={"registration_number": "SF1"})
+
+    compute = renewals._compute_upcoming
+
+    def slow_compute(*args, **kwargs):
+        time.sleep(0.3)
+        return compute(*args, **kwargs)
+
+    monkeypatch.setattr(renewals, "_compute_upcoming", slow_compute)
+    responses = _run_concurrently(lambda: client.get("/api/renewals/upcoming?days=30", headers=_auth(token)), 5)
+
+    assert [r.status_code for r in responses] == [200] * 5
+    assert all(r.json() == responses[0].json() for r in responses)
+    assert len(responses[0].json()) == 3  # three missing kinds
+    assert metrics.get("singleflight.upcoming.leaders") == 1
+    assert metrics.get("singleflight.upcoming.coalesced") == 4
+
+
+@pytest.mark.skipif(not os.getenv("TEST_REDIS_URL"), reason="set TEST_REDIS_URL to test coalescing across workers")
+def test_coalescing_across_workers_through_redis():
+    url = os.environ["TEST_REDIS_URL"]
+    key = uuid.uuid4().hex
+    # two instances stand in for two worker processes
+    worker_a, worker_b = RedisSingleFlight("t", url), RedisSingleFlight("t", url)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return {"due": 3}
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        a = pool.submit(worker_a.do, key, slow, dumps=json.dumps, loads=json.loads)
+        time.sleep(0.05)
+        b = pool.submit(worker_b.do, key, slow, dumps=json.dumps, loads=json.loads)
+        assert a.result() == b.result() == {"due": 3}
+    assert len(calls) == 1
+    assert metrics.get("singleflight.t.coalesced_remote") == 1
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from app.config import Settings
+from app.db import DatabaseRouter, get_engine, warm_up
+from app.main import create_app
+from app.metrics import metrics
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+# Cumulative import time of `create_app()`; raise it deliberately, not by accident.
+IMPORT_BUDGET_MS = int(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+
+# Only needed once a request hashes a password, verifies a token, or talks to
+# the database; importing them at startup is a regression.
+LAZY_MODULES = ("bcrypt", "jose", "cryptography", "psycopg", "redis", "numpy", "jwt")
+
+
+def _importtime(code: str) -> dict[str, tuple[int, int]]:
+    """module -> (self us, cumulative us) from `python -X importtime`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def test_create_app_import_budget():
+    modules = _importtime("import app.main; app.main.create_app()")
+
+    eager = [m for m in LAZY_MODULES if m in modules]
+    assert not eager, f"imported at startup: {eager}"
+
+    total_ms = sum(self_us for self_us, _ in modules.values()) / 1000
+    slowest = sorted(modules.items(), key=lambda kv: kv[1][0], reverse=True)[:10]
+    report = "\n".join(f"{us / 1000:8.1f} ms  {name}" for name, (us, _) in slowest)
+    assert total_ms < IMPORT_BUDGET_MS, f"imports took {total_ms:.0f} ms (budget {IMPORT_BUDGET_MS}):\n{report}"
+
+
+def test_importing_main_does_not_build_the_app():
+    modules = _importtime("import app.main")
+    assert "app.routers" not in modules
+    assert "sqlalchemy.orm" not in modules
+
+
+def test_lifespan_warms_the_pool():
+    settings = Settings.from_env()
+    with TestClient(create_app(settings)) as client:
+        assert metrics.get("db.pool.warmed") == settings.pool_warmup_connections
+        assert client.get("/health").status_code == 200
+
+
+def test_warm_up_skips_unreachable_replica():
+    primary = get_engine(os.environ["DATABASE_URL"])
+    dead = create_engine("postgresql+psycopg://nobody@127.0.0.1:1/none?connect_timeout=1")
+    router = DatabaseRouter(primary, [dead])
+
+    assert warm_up(router, 2) == 2
+    assert router.pick_replica() is None  # marked down until its retry window passes
+
+    shard = create_engine(os.environ["DATABASE_URL"], pool_size=3)
+    try:
+        assert warm_up(router, 2, shards=[shard]) == 4  # the shard's pool is warmed too
+        assert shard.pool.checkedin() == 2
+    finally:
+        shard.dispose()
@@ -0,0 +1,234 @@
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app import vehicles
+from app.metrics import metrics
+from app.models import VehicleLookup
+from app.vehicles import CircuitBreaker, ProviderError, StubProvider, VehicleData, VehicleLookups
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _household(client, name: str) -> str:
+    email = f"user_{uuid.uuid4().hex[:10]}@example.com"
+    client.post("/api/auth/signup", json={"email": email, "password": "string1234"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "string1234"}).json()["access_token"]
+    client.post("/api/households", headers=_auth(token), json={"name": name})
+    return token
+
+
+class Counting(StubProvider):
+    """A stub that records each batch it is asked for, and can fail the first `fail` calls."""
+
+    def __init__(self, *args, fail: int = 0, retryable: bool = True, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.batches: list[list[str]] = []
+        self.fail = fail
+        self.retryable = retryable
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, registrations):
+        with self._lock:
+            self.batches.append(list(registrations))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failing = self.fail > 0
+            self.fail -= 1
+        try:
+            if failing:
+                raise ProviderError("provider down", retryable=self.retryable)
+            return super().lookup(registrations)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+KNOWN = {
+    "AB12CDE": VehicleData(make="Ford", model="Focus", mot_expiry=date(2030, 3, 1), tax_due=date(2030, 1, 1)),
+    "ZZ99ZZZ": None,
+}
+
+
+def test_answers_are_cached_until_they_expire(db_session):
+    provider = Counting(KNOWN, batch_size=10)
+    lookups = VehicleLookups(provider, ttl=timedelta(hours=1), backoff_seconds=0)
+
+    first = lookups.lookup(db_session, ["ab12cde ", "ZZ99ZZZ", "AB12CDE"])
+    assert first.found == {"AB12CDE": KNOWN["AB12CDE"]} and first.not_found == {"ZZ99ZZZ"}
+    assert provider.batches == [["AB12CDE", "ZZ99ZZZ"]]
+    db_session.commit()
+
+    again = lookups.lookup(db_session, ["AB12CDE", "ZZ99ZZZ"])
+    assert (again.found, again.not_found) == (first.found, first.not_found)
+    assert len(provider.batches) == 1  # "not found" is cached too
+    assert metrics.get("vehicles.cache.hits") == 2 and metrics.get("vehicles.cache.misses") == 2
+
+    expired = VehicleLookups(provider, ttl=timedelta(0), backoff_seconds=0)
+    expired.lookup(db_session, ["EX1"])
+    db_session.commit()
+    expired.lookup(db_session, ["EX1"])
+    assert len(provider.batches) == 3
+
+
+def test_no_transaction_is_held_across_provider_calls(db_session):
+    seen = []
+
+    class Watching(StubProvider):
+        def lookup(self, registrations):
+            seen.append(db_session.in_transaction())
+            return super().lookup(registrations)
+
+    lookups = VehicleLookups(Watching(KNOWN), ttl=timedelta(hours=1), backoff_seconds=0)
+    assert lookups.lookup(db_session, ["AB12CDE"]).found == {"AB12CDE": KNOWN["AB12CDE"]}
+    assert seen == [False]
+    assert not db_session.in_transaction()  # the answer is already committed
+    assert db_session.scalar(select(func.count()).select_from(VehicleLookup)) == 1
+
+
+def test_batches_run_with_bounded_concurrency(db_session):
+    provider = Counting(batch_size=5, latency=0.05)
+    lookups = VehicleLookups(provider, ttl=timedelta(hours=1), concurrency=3, backoff_seconds=0)
+    t0 = time.monotonic()
+    result = lookups.lookup(db_session, [f"CC{i:03d}" for i in range(40)])
+    elapsed = time.monotonic() - t0
+
+    assert len(result.found) == 40 and not result.unavailable
+    assert sorted(len(b) for b in provider.batches) == [5] * 8
+    assert 1 < provider.max_in_flight <= 3
+    assert elapsed < 8 * 0.05  # not one batch after another
+    assert metrics.get("vehicles.provider.calls") == 8
+
+
+def test_retries_then_circuit_breaker(db_session):
+    provider = Counting(KNOWN, batch_size=1, fail=2)
+    lookups = VehicleLookups(provider, ttl=timedelta(hours=1), retries=2, backoff_seconds=0)
+    assert lookups.lookup(db_session, ["AB12CDE"]).found  # third attempt succeeds
+    assert metrics.get("vehicles.provider.retries") == 2
+
+    now = [0.0]
+    breaker = CircuitBreaker(failures=2, reset_seconds=30, clock=lambda: now[0])
+    provider = Counting(batch_size=1, fail=1_000)
+    lookups = VehicleLookups(provider, ttl=timedelta(hours=1), retries=1, backoff_seconds=0, breaker=breaker)
+    lookups._pool = vehicles.ThreadPoolExecutor(max_workers=1)  # batches in order, for counting
+    result = lookups.lookup(db_session, ["R1", "R2", "R3", "R4"])
+    assert result.unavailable == {"R1", "R2", "R3", "R4"} and not result.found
+    assert len(provider.batches) == 4  # two batches of two attempts, then the breaker opened
+    assert breaker.state == "open" and metrics.get("vehicles.breaker.rejected") == 2
+
+    # Unavailable answers aren't cached: after the reset period one trial batch goes through.
+    now[0] += 30
+    assert breaker.state == "half_open"
+    provider.fail = 0
+    assert lookups.lookup(db_session, ["R1", "R2"]).found.keys() == {"R1", "R2"}
+    assert breaker.state == "closed"
+
+    provider = Counting(batch_size=1, fail=5, retryable=False)
+    lookups = VehicleLookups(provider, ttl=timedelta(hours=1), retries=3, backoff_seconds=0)
+    assert lookups.lookup(db_session, ["R5"]).unavailable == {"R5"}
+    assert len(provider.batches) == 1  # not retried
+
+
+def test_breaker_trial_settles_on_any_failure_and_ignores_bad_requests(db_session):
+    now = [0.0]
+    breaker = CircuitBreaker(failures=1, reset_seconds=30, clock=lambda: now[0])
+
+    class Broken(StubProvider):
+        def lookup(self, registrations):
+            raise KeyError("a provider bug")
+
+    lookups = VehicleLookups(Broken(), ttl=timedelta(hours=1), retries=0, backoff_seconds=0, breaker=breaker)
+    assert lookups.lookup(db_session, ["B1"]).unavailable == {"B1"}
+    assert breaker.state == "open"
+    now[0] += 30
+    assert lookups.lookup(db_session, ["B1"]).unavailable == {"B1"}  # the trial fails...
+    now[0] += 30
+    assert breaker.allow()  # ...and doesn't leave the breaker stuck half open
+    breaker.succeeded()
+
+    class Refusing(StubProvider):
+        def lookup(self, registrations):
+            raise ProviderError("DVLA returned 400", bad_request=True)
+
+    lookups = VehicleLookups(Refusing(), ttl=timedelta(hours=1), retries=2, backoff_seconds=0, breaker=breaker)
+    for _ in range(3):
+        assert lookups.lookup(db_session, ["NOT A REG"]).unavailable == {"NOT A REG"}
+    assert breaker.state == "closed" and metrics.get("vehicles.provider.calls") == 2 + 3
+
+
+@pytest.fixture()
+def fixed_provider(monkeypatch):
+    today = date.today()
+    provider = Counting(
+        {
+            "EN1": VehicleData("Toyota", "Yaris", mot_expiry=today + timedelta(days=200), tax_due=today + timedelta(days=40)),
+            "EN2": VehicleData("Kia", "Picanto", mot_expiry=today + timedelta(days=100)),
+            "EN3": None,
+        },
+        batch_size=2,
+    )
+    vehicles.register_provider("fixed", lambda settings: provider)
+    monkeypatch.setenv("VEHICLE_DATA_PROVIDER", "fixed")
+    yield provider
+    vehicles.close_vehicle_lookups()
+
+
+def test_enrich_fills_cars_and_suggests_renewals(client, fixed_provider):
+    token = _household(client, "Enrich")
+    today = date.today()
+    cars = {
+        reg: client.post("/api/cars", headers=_auth(token), json={"registration_number": reg, **extra}).json()
+        for reg, extra in (("EN1", {}), ("EN2", {"make": "KIA Motors"}), ("EN3", {}))
+    }
+    mot = {
+        "kind": "MOT",
+        "valid_from": (today - timedelta(days=265)).isoformat(),
+        "valid_to": (today + timedelta(days=100)).isoformat(),
+    }
+    assert client.post(f"/api/cars/{cars['EN2']['id']}/renewals", headers=_auth(token), json=mot).status_code == 201
+
+    r = client.post("/api/vehicles/enrich", headers=_auth(token))
+    assert r.status_code == 200, r.text
+    by_reg = {e["car"]["registration_number"]: e for e in r.json()}
+    assert len(fixed_provider.batches) == 2  # three cars, batches of two
+
+    en1 = by_reg["EN1"]
+    assert en1["lookup"] == "found" and en1["filled"] == ["make", "model"]
+    assert (en1["car"]["make"], en1["car"]["model"]) == ("Toyota", "Yaris")
+    suggested = {s["kind"]: s for s in en1["suggestions"]}
+    assert suggested["MOT"]["valid_to"] == (today + timedelta(days=200)).isoformat()
+    assert suggested["TAX"]["valid_to"] == (today + timedelta(days=39)).isoformat()
+    assert all(date.fromisoformat(s["valid_from"]) <= today for s in en1["suggestions"])
+    # a suggestion can be posted as it is
+    assert client.post(f"/api/cars/{cars['EN1']['id']}/renewals", headers=_auth(token), json=suggested["MOT"]).status_code == 201
+
+    en2 = by_reg["EN2"]
+    assert en2["filled"] == ["model"] and en2["car"]["make"] == "KIA Motors"  # what the user typed stays
+    assert en2["suggestions"] == []  # the recorded MOT already runs that far
+    assert by_reg["EN3"]["lookup"] == "not_found"
+
+    # The second run is served from the cache and has nothing left to fill or suggest for MOT.
+    again = client.post("/api/vehicles/enrich", headers=_auth(token), json={"car_ids": [cars["EN1"]["id"]]}).json()
+    assert len(fixed_provider.batches) == 2
+    assert again[0]["filled"] == [] and [s["kind"] for s in again[0]["suggestions"]] == ["TAX"]
+
+    r = client.post("/api/vehicles/lookup", headers=_auth(token), json={"registration_numbers": ["en1", "EN3", "EN4"]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert [v["registration_number"] for v in body["vehicles"]] == ["EN1"]
+    assert body["not_found"] == ["EN3", "EN4"] and body["unavailable"] == []
+    assert metrics.get("vehicles.cache.hits") == 3 and metrics.get("vehicles.cache.misses") == 4
+
+
+def test_lookups_off_by_default(client):
+    token = _household(client, "NoLookups")
+    r = client.post("/api/vehicles/lookup", headers=_auth(token), json={"registration_numbers": ["AB12CDE"]})
+    assert r.status_code == 503
@@ -53,6 +53,22 @@ export type UpcomingRenewalOut = {
   current_valid_to?: string | null;
 };
 
+export type SearchHit = {
+  type: "car" | "renewal";
+  id: string;
+  car_id: string;
+  registration_number: string;
+  make?: string | null;
+  model?: string | null;
+  is_archived: boolean;
+  kind?: RenewalKind | null;
+  provider?: string | null;
+  reference?: string | null;
+  score: number;
+};
+
+export type SearchResults = { items: SearchHit[]; next_offset?: number | null };
+
 export type ReminderPreferences = {
   preferences: Record<RenewalKind, number[]>;
 };
@@ -89,6 +105,65 @@ async function request<T>(path: string, opts: RequestInit = {}): Promise<T> {
   return body as T;
 }
 
+export type ChangeEvent = { entity: "car" | "renewal"; id: string; op: string };
+
+// Subscribe to the household's change stream (server-sent events).
+// EventSource cannot send the Authorization header, so the stream is read with fetch.
+// Reconnects after a dropped connection; call the returned function to stop.
+export function subscribeEvents(
+  onEvent: (name: "change" | "resync", data: ChangeEvent | null) => void,
+): () => void {
+  const ctrl = new AbortController();
+  let retryMs = 5000;
+
+  async function connect() {
+    const token = getToken();
+    const res = await fetch(`${API_BASE}/api/events`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+      signal: ctrl.signal,
+    });
+    if (!res.ok || !res.body) throw new Error(`events: ${res.status}`);
+    // anything may have changed while we were disconnected
+    onEvent("resync", null);
+
+    const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buf = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) return;
+      buf += value;
+      let end;
+      while ((end = buf.indexOf("\n\n")) >= 0) {
+        const frame = buf.slice(0, end);
+        buf = buf.slice(end + 2);
+        let name = "message";
+        let data = "";
+        for (const line of frame.split("\n")) {
+          if (line.startsWith("event: ")) name = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+          else if (line.startsWith("retry: ")) retryMs = Number(line.slice(7)) || retryMs;
+        }
+        if (name === "change") onEvent("change", JSON.parse(data));
+        else if (name === "resync") onEvent("resync", null);
+      }
+    }
+  }
+
+  (async () => {
+    while (!ctrl.signal.aborted) {
+      try {
+        await connect();
+      } catch {
+        // fall through to the retry delay
+      }
+      if (ctrl.signal.aborted) return;
+      await new Promise((r) => setTimeout(r, retryMs));
+    }
+  })();
+
+  return () => ctrl.abort();
+}
+
 export const api = {
   // auth
   signup: (email: string, password: string) =>
@@ -158,6 +233,12 @@ export const api = {
   upcomingRenewals: (days = 60) =>
     request<UpcomingRenewalOut[]>(`/api/renewals/upcoming?days=${days}`),
 
+  // search (cars by registration/make/model, renewals by provider/reference/notes)
+  search: (q: string, limit = 20, offset = 0) =>
+    request<SearchResults>(
+      `/api/search?q=${encodeURIComponent(q)}&limit=${limit}&offset=${offset}`,
+    ),
+
   // settings
   getReminderPreferences: () =>
     request<ReminderPreferences>("/api/settings/reminders"),
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from "react";
 import { Link } from "react-router-dom";
-import { api, Car, UpcomingRenewalOut } from "../lib/api";
+import { api, Car, subscribeEvents, UpcomingRenewalOut } from "../lib/api";
 import { Button, Card, Input, Pill } from "../lib/ui";
 
 function fmtKind(k: UpcomingRenewalOut["kind"]) {
@@ -48,6 +48,17 @@ export default function Dashboard() {
 
   useEffect(() => {
     refresh();
+    // Refetch when something in the household changes (here or in another tab),
+    // coalescing bursts of events into one refresh.
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    const unsubscribe = subscribeEvents(() => {
+      clearTimeout(timer);
+      timer = setTimeout(refresh, 250);
+    });
+    return () => {
+      clearTimeout(timer);
+      unsubscribe();
+    };
   }, []);
 
   async function addCar(e: React.FormEvent) {